@@ -0,0 +1,62 @@
+"""Compares bytes read by the staged duplicate finder against full hashing
+
+Run from the repository root: `python -m benchmarks.duplicates`
+"""
+import os
+import random
+import tempfile
+import time
+
+from src.duplicates import DuplicateFinder
+from src.file_manager import FileManager
+
+
+def make_tree(root: str, files: int = 2000, duplicates: int = 50, max_size: int = 256 * 1024) -> None:
+    """Fills `root` with random files, a few of them duplicated
+
+    Args:
+        root (str): Directory to fill
+        files (int, optional): Number of unique files. Defaults to 2000.
+        duplicates (int, optional): Number of extra copies. Defaults to 50.
+        max_size (int, optional): Largest file size in bytes. Defaults to 256 KiB.
+    """
+    rng = random.Random(0)
+    paths = []
+    for index in range(files):
+        folder = os.path.join(root, f"dir{index % 20}")
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"file{index}.bin")
+        with open(path, "wb") as a_file:
+            a_file.write(rng.randbytes(rng.randint(0, max_size)))
+        paths.append(path)
+    for index, source in enumerate(rng.sample(paths, duplicates)):
+        with open(source, "rb") as a_file, open(os.path.join(root, f"copy{index}.bin"), "wb") as copy:
+            copy.write(a_file.read())
+
+
+def main() -> None:
+    """Runs the benchmark and prints the results"""
+    with tempfile.TemporaryDirectory() as root:
+        make_tree(root)
+
+        start = time.perf_counter()
+        full = FileManager(root, staged=False)
+        full_result = full.get_dupliacte()
+        full_time = time.perf_counter() - start
+        full_bytes = sum(file.size for file in full.data[2])
+
+        start = time.perf_counter()
+        staged = FileManager(root)
+        finder = DuplicateFinder(staged.data[2])
+        finder.find()
+        staged_time = time.perf_counter() - start
+
+        assert staged.get_dupliacte() == full_result
+        print(f"files:        {len(full.data[2])}")
+        print(f"full hashing: {full_bytes:>12,} bytes read in {full_time:.3f}s")
+        print(f"staged:       {finder.bytes_read:>12,} bytes read in {staged_time:.3f}s")
+        print(f"reduction:    {full_bytes / max(finder.bytes_read, 1):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Compares the memory used to hold scanned files in each representation
+
+Run from the repository root: `python -m benchmarks.memory [files]`
+"""
+import hashlib
+import os
+import pathlib
+import sys
+import tracemalloc
+
+from src.file_manager import File
+from src.index import FileIndex
+
+
+class LegacyFile:
+    """The `File` record as it was before `__slots__`, kept for comparison"""
+
+    def __init__(self, name: str, path: str, hash: str) -> None:
+        self.name = name
+        self.path = path
+        self.hash = hash
+        self.extension = os.path.splitext(self.name)[-1]
+        self.info = pathlib.Path(self.path)
+
+
+def make_records(count: int) -> list:
+    """Returns `count` synthetic `(root, name, hash, size)` records spread over 1000 directories"""
+    records = []
+    for index in range(count):
+        root = f"/srv/share/project{index % 1000}/assets"
+        name = f"file{index}.{('py', 'mp3', 'mp4', 'txt')[index % 4]}"
+        digest = hashlib.sha224(name.encode()).hexdigest()
+        records.append((root, name, digest, index * 7))
+    return records
+
+
+def measure(build: callable, records: list) -> int:
+    """Returns the bytes still allocated by `build(records)`"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build(records)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return after - before
+
+
+def build_legacy(records: list) -> list:
+    """One `LegacyFile` per record"""
+    return [LegacyFile(name, os.path.join(root, name), digest) for root, name, digest, _ in records]
+
+
+def build_slots(records: list) -> list:
+    """One slotted `File` per record"""
+    return [File(name, os.path.join(root, name), digest, size, index, size)
+            for index, (root, name, digest, size) in enumerate(records)]
+
+
+def build_index(records: list) -> FileIndex:
+    """A single columnar `FileIndex`"""
+    index = FileIndex(File)
+    for inode, (root, name, digest, size) in enumerate(records):
+        index.append(File(name, os.path.join(root, name), digest, size, inode, size))
+    return index
+
+
+def main() -> None:
+    """Runs the benchmark and prints the results"""
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    records = make_records(count)
+    legacy = measure(build_legacy, records)
+    print(f"files:      {count:,}")
+    for label, build in (("legacy", build_legacy), ("slots", build_slots), ("index", build_index)):
+        used = legacy if build is build_legacy else measure(build, records)
+        print(f"{label + ':':<11} {used:>13,} bytes  {used / count:7.1f} B/file  {legacy / used:4.1f}x smaller")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Measures cold start, from a fresh interpreter to a usable terminal
+
+Run from the repository root: `python -m benchmarks.startup [--output results.json] [--compare old.json]`
+
+Every case is timed as the wall clock of a whole `python -c` subprocess, the
+best of `--repeat` runs. `-X importtime` then shows which imports the
+`terminal` case still pays for.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+TARGET_MS = 50
+CASES = {
+    "interpreter": "pass",
+    "terminal": "from src import main; main.Terminal()",
+    "first_command": "from src import main; main.Terminal().run_batch(['test -v'])",
+    "prompt": "from src import main; from templates import main_menu; main_menu.render(main.Terminal().console)",
+}
+
+
+def time_case(code: str, repeat: int = 10) -> float:
+    """Returns the best wall clock time of `python -c code` in milliseconds"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True, stdout=subprocess.DEVNULL)
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def time_script(repeat: int = 10) -> float:
+    """Returns the best wall clock time of a one line `launcher.py --script` in milliseconds"""
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as script:
+        script.write("test -v\n")
+    try:
+        return time_case(f"import sys; sys.argv = ['launcher.py', '--script', {script.name!r}]; "
+                         "import runpy; runpy.run_path('launcher.py', run_name='__main__')", repeat)
+    finally:
+        os.unlink(script.name)
+
+
+def get_import_times(code: str, top: int = 15) -> list[dict]:
+    """Returns the `top` modules by self import time under `-X importtime`"""
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", code], check=True, capture_output=True,
+                            text=True).stderr
+    modules = []
+    for line in output.splitlines():
+        fields = line.removeprefix("import time:").split("|")
+        if len(fields) == 3 and fields[0].strip().isdigit():
+            modules.append({"module": fields[2].strip(), "self_us": int(fields[0]), "cumulative_us": int(fields[1])})
+    return sorted(modules, key=lambda module: module["self_us"], reverse=True)[:top]
+
+
+def main() -> None:
+    """Times every case and prints them against `TARGET_MS`"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10, help="runs per case, the best one counts")
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to list")
+    parser.add_argument("--output", metavar="FILE", help="write the results as JSON")
+    parser.add_argument("--compare", metavar="FILE", help="print the change against earlier JSON results")
+    args = parser.parse_args()
+
+    results = {"cases": {name: time_case(code, args.repeat) for name, code in CASES.items()}}
+    results["cases"]["script"] = time_script(args.repeat)
+    interpreter = results["cases"]["interpreter"]
+    for name, milliseconds in results["cases"].items():
+        verdict = "" if name == "interpreter" else "ok" if milliseconds <= TARGET_MS else "over target"
+        print(f"  {name:<14} {milliseconds:8.1f}ms  {milliseconds - interpreter:+8.1f}ms over the interpreter  "
+              f"{verdict}".rstrip())
+    results["imports"] = get_import_times(CASES["terminal"], args.top)
+    print(f"\nslowest imports of `{CASES['terminal']}`:")
+    for module in results["imports"]:
+        print(f"  {module['module']:<40} {module['self_us'] / 1000:7.2f}ms self "
+              f"{module['cumulative_us'] / 1000:7.2f}ms cumulative")
+
+    if args.output:
+        with open(args.output, "w") as a_file:
+            json.dump(results, a_file, indent=2)
+    if args.compare:
+        with open(args.compare) as a_file:
+            previous = json.load(a_file)
+        print("\nagainst the earlier run:")
+        for name, milliseconds in results["cases"].items():
+            if name in previous["cases"]:
+                print(f"  {name:<14} {milliseconds / previous['cases'][name] - 1:+7.1%}")
+
+
+if __name__ == "__main__":
+    main()
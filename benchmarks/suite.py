@@ -0,0 +1,295 @@
+"""Benchmarks scanning, hashing and command dispatch on a synthetic tree
+
+Run from the repository root: `python -m benchmarks.suite [--output results.json] [--compare old.json]`
+
+Every scan runs in a fresh interpreter so its peak RSS and syscall counts are
+its own. Read/write syscalls come from `/proc/self/io`; with `--strace` every
+syscall is counted by `strace -c` when it is installed.
+"""
+import argparse
+import io
+import json
+import math
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from src.file_manager import FileManager, get_checksum
+from src.walker import walk
+
+SIZE_DISTRIBUTIONS = ["fixed", "uniform", "lognormal"]
+SCENARIOS = {
+    "walk": "walk only, no file is read",
+    "scan_full": "hash every file during the scan",
+    "scan_staged": "scan, then find duplicates by size, head/tail and full hash",
+    "scan_workers": "hash every file with 4 threads",
+    "hash": "get_checksum on every file",
+}
+DISPATCH_LINES = ["test -v --me x a b", "test test1 -v c", "test --me y", "test test1"]
+
+
+def make_shaped_tree(root: str,
+                     depth: int = 3,
+                     fanout: int = 4,
+                     files_per_dir: int = 20,
+                     sizes: str = "lognormal",
+                     mean_size: int = 32 * 1024,
+                     duplicate_ratio: float = 0.1,
+                     seed: int = 0) -> dict:
+    """Fills `root` with a tree of random files
+
+    Args:
+        root (str): Directory to fill
+        depth (int, optional): Directory levels below `root`. Defaults to 3.
+        fanout (int, optional): Subdirectories per directory. Defaults to 4.
+        files_per_dir (int, optional): Files per directory. Defaults to 20.
+        sizes (str, optional): One of `SIZE_DISTRIBUTIONS`. Defaults to "lognormal".
+        mean_size (int, optional): Mean file size in bytes. Defaults to 32 KiB.
+        duplicate_ratio (float, optional): Share of files that copy an earlier file. Defaults to 0.1.
+        seed (int, optional): Random seed, the same arguments always build the same tree. Defaults to 0.
+
+    Returns:
+        dict: `files`, `directories` and `bytes` in the tree
+    """
+    rng = random.Random(seed)
+    sigma = 1.5
+    written = []
+    total = directories = 0
+    stack = [(root, 0)]
+    while stack:
+        folder, level = stack.pop()
+        os.makedirs(folder, exist_ok=True)
+        directories += 1
+        for index in range(files_per_dir):
+            path = os.path.join(folder, f"file{index}.bin")
+            if written and rng.random() < duplicate_ratio:
+                shutil.copyfile(rng.choice(written), path)
+            else:
+                if sizes == "fixed":
+                    size = mean_size
+                elif sizes == "uniform":
+                    size = rng.randint(0, 2 * mean_size)
+                else:
+                    size = min(int(rng.lognormvariate(math.log(mean_size) - sigma ** 2 / 2, sigma)), 64 * mean_size)
+                with open(path, "wb") as a_file:
+                    a_file.write(rng.randbytes(size))
+                written.append(path)
+            total += os.path.getsize(path)
+        if level < depth:
+            stack.extend((os.path.join(folder, f"dir{index}"), level + 1) for index in range(fanout))
+    return {"files": directories * files_per_dir, "directories": directories, "bytes": total}
+
+
+def run_scenario(name: str, root: str) -> dict:
+    """Runs one scenario in this process and measures it
+
+    Returns:
+        dict: `seconds`, `files`, `bytes`, `peak_rss_kib` and `/proc/self/io` syscall counts
+    """
+    before = _read_proc_io()
+    start = time.perf_counter()
+    if name == "walk":
+        sizes = [file.size for file in FileManager(root).get_files()]
+    elif name == "scan_full":
+        sizes = [file.size for file in FileManager(root, staged=False).get_files()]
+    elif name == "scan_staged":
+        manager = FileManager(root)
+        manager.get_dupliacte()
+        sizes = [file.size for file in manager.get_files()]
+    elif name == "scan_workers":
+        sizes = [file.size for file in FileManager(root, staged=False, workers=4).get_files()]
+    elif name == "hash":
+        sizes = []
+        for _, entry, st in walk(root):
+            if st is not None:
+                get_checksum(entry.path)
+                sizes.append(st.st_size)
+    else:
+        raise KeyError(name)
+    seconds = time.perf_counter() - start
+    after = _read_proc_io()
+    result = {
+        "seconds": seconds,
+        "files": len(sizes),
+        "bytes": sum(sizes),
+        "peak_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+    for key in ("syscr", "syscw", "rchar"):
+        result[key] = after[key] - before[key] if key in after and key in before else None
+    return result
+
+
+def measure_scenario(name: str, root: str, use_strace: bool = False) -> dict:
+    """Runs one scenario in a fresh interpreter, under `strace -c` if asked and available"""
+    command = [sys.executable, "-m", "benchmarks.suite", "--run", name, root]
+    trace = None
+    if use_strace and shutil.which("strace"):
+        trace = tempfile.NamedTemporaryFile(suffix=".strace", delete=False).name
+        command = ["strace", "-f", "-c", "-o", trace] + command
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["files_per_second"] = result["files"] / result["seconds"] if result["seconds"] else None
+    result["mb_per_second"] = result["bytes"] / 1e6 / result["seconds"] if result["seconds"] else None
+    if trace is not None:
+        result["syscalls"] = _parse_strace(trace)
+        os.unlink(trace)
+    return result
+
+
+def measure_dispatch(iterations: int = 20000) -> dict:
+    """Measures `Command.parse`, `Terminal.parse_input` and full dispatch latencies
+
+    Returns:
+        dict: Percentiles in microseconds per measured call
+    """
+    from rich.console import Console
+
+    from src.command import Command
+    from src.input_parser import parse
+    from src.main import Terminal
+
+    app = Terminal()
+    app.console = Console(file=io.StringIO())
+    timings = {"command_parse": [], "parse_input_cached": [], "parse_input_uncached": [], "dispatch": []}
+    try:
+        for index in range(iterations):
+            line = DISPATCH_LINES[index % len(DISPATCH_LINES)]
+            names = " ".join(parse(line).names)
+
+            start = time.perf_counter_ns()
+            Command.parse(names)
+            timings["command_parse"].append(time.perf_counter_ns() - start)
+
+            start = time.perf_counter_ns()
+            app.parse_input(line)
+            timings["parse_input_cached"].append(time.perf_counter_ns() - start)
+
+            unique = f"{line} p{index}"
+            start = time.perf_counter_ns()
+            app.parse_input(unique)
+            timings["parse_input_uncached"].append(time.perf_counter_ns() - start)
+
+            start = time.perf_counter_ns()
+            app.run_command(app.parse_input(line))
+            timings["dispatch"].append(time.perf_counter_ns() - start)
+            if index % 1000 == 0:
+                app.console.file = io.StringIO()
+    finally:
+        app.jobs.shutdown()
+    return {name: _percentiles(samples) for name, samples in timings.items()}
+
+
+def _percentiles(samples: list[int]) -> dict:
+    """Returns p50, p90, p99 and max of nanosecond samples, in microseconds"""
+    samples = sorted(samples)
+
+    def pick(fraction: float) -> float:
+        return samples[min(int(fraction * len(samples)), len(samples) - 1)] / 1000
+
+    return {"p50_us": pick(0.5), "p90_us": pick(0.9), "p99_us": pick(0.99), "max_us": samples[-1] / 1000}
+
+
+def _read_proc_io() -> dict:
+    """Returns the counters of `/proc/self/io`, or an empty dict where it does not exist"""
+    try:
+        with open("/proc/self/io") as a_file:
+            return {key: int(value) for key, value in (line.split(": ") for line in a_file)}
+    except OSError:
+        return {}
+
+
+def _parse_strace(path: str) -> dict:
+    """Returns syscall -> calls from a `strace -c` summary"""
+    calls = {}
+    with open(path) as a_file:
+        for line in a_file:
+            fields = line.split()
+            if len(fields) >= 5 and fields[0][0].isdigit() and fields[-1] != "total":
+                calls[fields[-1]] = int(fields[3])
+    return calls
+
+
+def _git_commit() -> str:
+    """Returns the checked out commit, or `None` outside of a git checkout"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], check=True, capture_output=True,
+                              text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_comparison(results: dict, previous: dict) -> None:
+    """Prints the change of every timing against an earlier run"""
+    print(f"\nagainst {previous['meta'].get('commit')}:")
+    for name, result in results["scans"].items():
+        old = previous["scans"].get(name)
+        if old:
+            print(f"  {name:<14} {result['seconds'] / old['seconds'] - 1:+7.1%} time"
+                  f"  {result['peak_rss_kib'] / old['peak_rss_kib'] - 1:+7.1%} peak RSS")
+    for name, result in results["dispatch"].items():
+        old = previous["dispatch"].get(name)
+        if old:
+            print(f"  {name:<22} {result['p50_us'] / old['p50_us'] - 1:+7.1%} p50"
+                  f"  {result['p99_us'] / old['p99_us'] - 1:+7.1%} p99")
+
+
+def main() -> None:
+    """Builds the tree, runs every benchmark and reports the results"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--fanout", type=int, default=4)
+    parser.add_argument("--files-per-dir", type=int, default=20)
+    parser.add_argument("--sizes", choices=SIZE_DISTRIBUTIONS, default="lognormal")
+    parser.add_argument("--mean-size", type=int, default=32 * 1024)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help="comma separated, from: " + ", ".join(SCENARIOS))
+    parser.add_argument("--iterations", type=int, default=20000, help="dispatch measurements per call type")
+    parser.add_argument("--strace", action="store_true", help="count every syscall with strace -c")
+    parser.add_argument("--output", metavar="FILE", help="write the results as JSON")
+    parser.add_argument("--compare", metavar="FILE", help="print the change against earlier JSON results")
+    parser.add_argument("--run", nargs=2, metavar=("SCENARIO", "ROOT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run_scenario(*args.run)))
+        return
+
+    shape = {key: getattr(args, key) for key in
+             ("depth", "fanout", "files_per_dir", "sizes", "mean_size", "duplicate_ratio", "seed")}
+    results = {
+        "meta": {"commit": _git_commit(), "python": platform.python_version(), "platform": platform.platform(),
+                 "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "shape": shape},
+        "scans": {},
+    }
+    with tempfile.TemporaryDirectory() as root:
+        results["tree"] = make_shaped_tree(root, **shape)
+        print(f"tree: {results['tree']['files']:,} files, {results['tree']['directories']:,} directories, "
+              f"{results['tree']['bytes'] / 1e6:,.1f} MB")
+        for name in args.scenarios.split(","):
+            result = results["scans"][name] = measure_scenario(name, root, args.strace)
+            print(f"  {name:<14} {result['seconds']:8.3f}s {result['files_per_second']:12,.0f} files/s "
+                  f"{result['mb_per_second']:9,.1f} MB/s {result['peak_rss_kib'] / 1024:8.1f} MiB RSS "
+                  f"{result['syscr'] or 0:>9,} read syscalls")
+    results["dispatch"] = measure_dispatch(args.iterations)
+    for name, result in results["dispatch"].items():
+        print(f"  {name:<22} p50 {result['p50_us']:8.2f}us  p90 {result['p90_us']:8.2f}us  "
+              f"p99 {result['p99_us']:8.2f}us  max {result['max_us']:10.2f}us")
+
+    if args.output:
+        with open(args.output, "w") as a_file:
+            json.dump(results, a_file, indent=2)
+    if args.compare:
+        with open(args.compare) as a_file:
+            print_comparison(results, json.load(a_file))
+
+
+if __name__ == "__main__":
+    main()
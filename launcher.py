@@ -1,5 +1,61 @@
 # in this file we can do some pre run stuff like initializing the file manager or whatnot
+import argparse
+import sys
+
 from src import main
+from src.errors import DaemonError
+from src.instrumentation import stats
+
+arg_parser = argparse.ArgumentParser(description="CLI File Manager")
+arg_parser.add_argument("--script", metavar="FILE",
+                        help="run the commands in FILE ('-' for stdin) and exit, stdin is used when piped")
+arg_parser.add_argument("--timings", action="store_true", help="print per-command timings after a script")
+arg_parser.add_argument("--stats", action="store_true", help="collect counters and timings from the start")
+arg_parser.add_argument("--profile", metavar="FILE", help="profile with cProfile, write the stats to FILE on exit")
+arg_parser.add_argument("--daemon", metavar="SOCKET", nargs="?", const="",
+                        help="leave scans to the index daemon (`python -m src.daemon`) on SOCKET or its default")
+arg_parser.add_argument("--tracemalloc", action="store_true", help="print the top allocation sites on exit")
+args = arg_parser.parse_args()
+
+
+def run(app: main.Terminal) -> int:
+    """Runs the prompt, or a script, and returns the exit status"""
+    if args.script is None and sys.stdin.isatty():
+        app.run()
+        return 0
+    if args.script is None or args.script == "-":
+        return 1 if app.run_batch(sys.stdin, args.timings) else 0
+    with open(args.script) as script:
+        return 1 if app.run_batch(script, args.timings) else 0
+
+
+stats.enabled = args.stats
+# the profiling modules are only imported when asked for, they are not free to import
+if args.tracemalloc:
+    import tracemalloc
+
+    tracemalloc.start()
+profiler = None
+if args.profile:
+    import cProfile
+    import pstats
 
-app = main.Terminal()
-app.run()
+    profiler = cProfile.Profile()
+    profiler.enable()
+try:
+    app = main.Terminal()
+    if args.daemon is not None:
+        try:
+            app.attach(args.daemon or None)
+        except DaemonError as error:
+            sys.exit(f"launcher.py: {error}")
+    status = run(app)
+finally:
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+        pstats.Stats(profiler, stream=sys.stderr).sort_stats("cumulative").print_stats(20)
+    if args.tracemalloc:
+        for stat in tracemalloc.take_snapshot().statistics("lineno")[:10]:
+            print(stat, file=sys.stderr)
+sys.exit(status)
@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import errno
+import functools
+import os
+import shutil
+import stat
+from typing import Callable, NamedTuple
+
+from .errors import InvalidOption, UnknownPolicy
+from .pool import bounded_map
+
+OPERATIONS = ["copy", "move", "delete"]
+WORKERS = 8
+# Steps handed to a worker at once, single steps would cost more in the pool than in the kernel
+BATCH_SIZE = 256
+# Bytes asked for per copy_file_range/sendfile call, the kernel may move less
+CHUNK_SIZE = 1 << 30
+# Errors meaning a zero-copy call is not supported for this pair of files, not that the copy failed
+UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP}
+
+
+class Step(NamedTuple):
+    """One planned operation, `target` is `None` for deletes"""
+
+    source: str
+    target: str
+
+
+class BulkReport(NamedTuple):
+    """What `apply` did"""
+
+    done: int
+    failed: list[tuple[str, str]]
+    copied: int
+
+
+def plan(operation: str, paths: list[str], destination: str = None) -> list[Step]:
+    """Plans an operation on many paths, nothing is changed yet
+
+    Paths inside another given directory are dropped, that directory takes
+    them along. Copies and moves go into `destination` when it is an existing
+    directory, a single path may also be copied or moved to a new name. Two
+    sources with the same name can't go into the same directory, the second
+    would overwrite the first.
+
+    Args:
+        operation (str): One of `OPERATIONS`
+        paths (list[str]): Files and directories, e.g. from `FileManager.query`
+        destination (str, optional): Target directory of copies and moves. Defaults to None.
+
+    Raises:
+        UnknownPolicy: If `operation` is not in `OPERATIONS`
+        InvalidOption: If a copy or move has no usable destination, or two sources share a target
+
+    Returns:
+        list[Step]: The steps
+    """
+    if operation not in OPERATIONS:
+        raise UnknownPolicy(f"Unknown operation: {operation}")
+    sources = _drop_nested(paths)
+    if operation == "delete":
+        return [Step(source, None) for source in sources]
+    if destination is None:
+        raise InvalidOption(f"{operation} needs a destination")
+    destination = os.path.abspath(destination)
+    into = os.path.isdir(destination)
+    if not into and len(sources) > 1:
+        raise InvalidOption(f"Not a directory: {destination}")
+    steps = []
+    targets: dict[str, str] = {}
+    for source in sources:
+        target = os.path.join(destination, os.path.basename(source)) if into else destination
+        if target == source or target.startswith(source + os.sep):
+            raise InvalidOption(f"Can't {operation} {source} into itself")
+        other = targets.setdefault(target, source)
+        if other != source:
+            raise InvalidOption(f"{other} and {source} would both become {target}")
+        steps.append(Step(source, target))
+    return steps
+
+
+def apply(operation: str,
+          steps: list[Step],
+          workers: int = WORKERS,
+          overwrite: bool = False,
+          progress: Callable[[str], None] = None) -> BulkReport:
+    """Runs a plan from `plan` across a thread pool
+
+    Every step is a few syscalls: a `rename`, an `unlink` or a zero-copy
+    `copy_file_range`, so many small files are bound by the filesystem, not
+    by Python. A failing step is reported and does not stop the others.
+
+    Args:
+        operation (str): The operation the plan was made for
+        steps (list[Step]): The plan
+        workers (int, optional): Steps running at once. Defaults to `WORKERS`.
+        overwrite (bool, optional): Replace existing targets instead of failing. Defaults to False.
+        progress (Callable[[str], None], optional): Called with the source of every finished step,
+            an exception it raises stops the run. Defaults to None.
+
+    Raises:
+        UnknownPolicy: If `operation` is not in `OPERATIONS`
+
+    Returns:
+        BulkReport: Steps done, `(path, error)` of failed ones and bytes copied
+    """
+    if operation not in OPERATIONS:
+        raise UnknownPolicy(f"Unknown operation: {operation}")
+    run = functools.partial(_run_batch, operation, overwrite)
+    batches = (steps[start:start + BATCH_SIZE] for start in range(0, len(steps), BATCH_SIZE))
+    done = copied = 0
+    failed = []
+    for batch, results in bounded_map(run, batches, workers):
+        for step, result in zip(batch, results):
+            if isinstance(result, OSError):
+                failed.append((step.source, result.strerror or str(result)))
+            else:
+                done += 1
+                copied += result
+            if progress is not None:
+                progress(step.source)
+    return BulkReport(done, failed, copied)
+
+
+def _run_batch(operation: str, overwrite: bool, steps: list[Step]) -> list[int | OSError]:
+    """Runs steps one after the other, returning the bytes copied or the error of each"""
+    results = []
+    for step in steps:
+        try:
+            if operation == "delete":
+                delete_path(step.source)
+                results.append(0)
+            elif operation == "move":
+                results.append(move_path(step.source, step.target, overwrite))
+            else:
+                results.append(copy_path(step.source, step.target, overwrite))
+        except OSError as error:
+            results.append(error)
+    return results
+
+
+def _drop_nested(paths: list[str]) -> list[str]:
+    """Returns the absolute paths that are not inside another one of them"""
+    kept = []
+    for path in sorted({os.path.abspath(path) for path in paths}):
+        if not kept or not path.startswith(kept[-1].rstrip(os.sep) + os.sep):
+            kept.append(path)
+    return kept
+
+
+def copy_file(source: str, target: str, overwrite: bool = False) -> int:
+    """Copies a file's data and permissions/times inside the kernel where possible
+
+    `os.copy_file_range` is tried first, it lets the filesystem share blocks
+    or copy server side. `os.sendfile` comes next, a read/write loop last.
+
+    Raises:
+        shutil.SameFileError: If `target` is `source`, a hard link or a symlink to it,
+            overwriting it would truncate the source
+
+    Returns:
+        int: The bytes copied
+    """
+    if overwrite and os.path.exists(target) and os.path.samefile(source, target):
+        raise shutil.SameFileError(errno.EEXIST, f"{source} and {target} are the same file", target)
+    with open(source, "rb") as source_file, open(target, "wb" if overwrite else "xb") as target_file:
+        _copy_data(source_file, target_file)
+        copied = os.fstat(target_file.fileno()).st_size
+    shutil.copystat(source, target)
+    return copied
+
+
+def _copy_data(source_file: object, target_file: object) -> None:
+    """Copies from the current offsets to the end of `source_file`"""
+    source, target = source_file.fileno(), target_file.fileno()
+    copied = 0
+    for copy in (getattr(os, "copy_file_range", None), _sendfile):
+        if copy is None:
+            continue
+        try:
+            while True:
+                count = copy(source, target, CHUNK_SIZE)
+                if not count:
+                    return
+                copied += count
+        except OSError as error:
+            if copied or error.errno not in UNSUPPORTED:
+                raise
+    shutil.copyfileobj(source_file, target_file)
+
+
+def _sendfile(source: int, target: int, count: int) -> int:
+    return os.sendfile(target, source, None, count)
+
+
+def copy_path(source: str, target: str, overwrite: bool = False) -> int:
+    """Copies a file, symlink or whole directory tree, see `copy_file`
+
+    Returns:
+        int: The bytes copied
+    """
+    st = os.lstat(source)
+    if stat.S_ISLNK(st.st_mode):
+        if overwrite and os.path.lexists(target):
+            os.unlink(target)
+        os.symlink(os.readlink(source), target)
+        return 0
+    if not stat.S_ISDIR(st.st_mode):
+        return copy_file(source, target, overwrite)
+    copied = 0
+    stack = [(source, target)]
+    created = []
+    while stack:
+        folder, copy = stack.pop()
+        os.makedirs(copy, exist_ok=overwrite)
+        created.append((folder, copy))
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                destination = os.path.join(copy, entry.name)
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append((entry.path, destination))
+                else:
+                    copied += copy_path(entry.path, destination, overwrite)
+    for folder, copy in reversed(created):
+        shutil.copystat(folder, copy)
+    return copied
+
+
+def move_path(source: str, target: str, overwrite: bool = False) -> int:
+    """Renames `source` to `target`, copying and deleting it only across filesystems
+
+    Returns:
+        int: The bytes copied, `0` for a rename
+    """
+    if not overwrite and os.path.lexists(target):
+        raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), target)
+    try:
+        os.rename(source, target)
+        return 0
+    except OSError as error:
+        if error.errno != errno.EXDEV:
+            raise
+    copied = copy_path(source, target, overwrite)
+    delete_path(source)
+    return copied
+
+
+def delete_path(path: str) -> None:
+    """Unlinks a file or symlink, or removes a directory tree"""
+    if stat.S_ISDIR(os.lstat(path).st_mode):
+        shutil.rmtree(path)
+    else:
+        os.unlink(path)
@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_NAME = "hashes.sqlite3"
+MAX_ENTRIES = 5_000_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT NOT NULL,
+    algorithm TEXT NOT NULL,
+    inode INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    seen REAL NOT NULL,
+    PRIMARY KEY (path, algorithm)
+);
+CREATE INDEX IF NOT EXISTS files_seen ON files (seen);
+"""
+
+
+def get_cache_dir() -> str:
+    """Returns the default cache directory, honouring `XDG_CACHE_HOME`"""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "insightful-ibises")
+
+
+def _prefix_range(root: str) -> tuple[str, str]:
+    """Returns the `[low, high)` str range of every path below `root`"""
+    prefix = os.path.join(os.path.abspath(root), "")
+    return prefix, prefix[:-1] + chr(ord(os.sep) + 1)
+
+
+class HashCache:
+    """Persistent checksum cache keyed by path and (inode, size, mtime_ns)
+
+    A cached digest is only returned while the file's stat tuple is unchanged,
+    so a rescan of an untouched tree only costs the `stat` calls of the walk.
+    One cache is shared by the scans of every job thread, so the database
+    connection is not tied to a thread and every change goes through `lock`.
+    """
+
+    def __init__(self, directory: str = None, max_entries: int = MAX_ENTRIES) -> None:
+        """Opens (or creates) the cache database
+
+        Args:
+            directory (str, optional): Where to keep the database. Defaults to `get_cache_dir()`.
+            max_entries (int, optional): Rows kept after `flush`, least recently seen go first.
+                Defaults to MAX_ENTRIES.
+        """
+        self.directory = directory or get_cache_dir()
+        self.max_entries = max_entries
+        os.makedirs(self.directory, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(self.directory, CACHE_NAME), check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+        self.lock = threading.RLock()
+        self.entries: dict[tuple[str, str], tuple[int, int, int, str]] = {}
+        self.pending: dict[tuple[str, str], tuple[int, int, int, str]] = {}
+        self.loaded: set[tuple[str, str]] = set()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, root: str, algorithm: str) -> None:
+        """Reads every entry below `root` into memory and marks them as seen
+
+        Args:
+            root (str): The directory about to be scanned
+            algorithm (str): The hash algorithm the scan uses
+        """
+        low, high = _prefix_range(root)
+        with self.lock:
+            if (low, algorithm) in self.loaded:
+                return
+            rows = self.connection.execute(
+                "SELECT path, inode, size, mtime_ns, digest FROM files "
+                "WHERE algorithm = ? AND path >= ? AND path < ?",
+                (algorithm, low, high),
+            )
+            for path, inode, size, mtime_ns, digest in rows:
+                self.entries[path, algorithm] = (inode, size, mtime_ns, digest)
+            with self.connection:
+                self.connection.execute(
+                    "UPDATE files SET seen = ? WHERE algorithm = ? AND path >= ? AND path < ?",
+                    (time.time(), algorithm, low, high),
+                )
+            self.loaded.add((low, algorithm))
+
+    def get(self, file: object, algorithm: str) -> str:
+        """Returns the cached digest of `file` if its stat tuple still matches
+
+        Args:
+            file (File): A scanned file with `path`, `inode`, `size` and `mtime_ns`
+            algorithm (str): The hash algorithm
+
+        Returns:
+            str: The digest, or `None` if missing or stale
+        """
+        entry = self.entries.get((os.path.abspath(file.path), algorithm))
+        if entry is not None and entry[:3] == (file.inode, file.size, file.mtime_ns):
+            self.hits += 1
+            return entry[3]
+        self.misses += 1
+        return None
+
+    def put(self, file: object, algorithm: str, digest: str) -> None:
+        """Stores the digest of `file`, written out on the next `flush`
+
+        Args:
+            file (File): A scanned file with `path`, `inode`, `size` and `mtime_ns`
+            algorithm (str): The hash algorithm
+            digest (str): The file's digest
+        """
+        key = (os.path.abspath(file.path), algorithm)
+        entry = (file.inode, file.size, file.mtime_ns, digest)
+        with self.lock:
+            self.entries[key] = entry
+            self.pending[key] = entry
+
+    def flush(self) -> None:
+        """Writes pending entries and trims the cache down to `max_entries`"""
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(path, algorithm, *entry, now) for (path, algorithm), entry in self.pending.items()],
+            )
+            self.pending.clear()
+            self.connection.execute(
+                "DELETE FROM files WHERE rowid IN "
+                "(SELECT rowid FROM files ORDER BY seen DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def invalidate(self, path: str = None) -> None:
+        """Drops the entries of `path` and everything below it, or the whole cache
+
+        Args:
+            path (str, optional): A file or directory. Defaults to None (everything).
+        """
+        with self.lock, self.connection:
+            if path is None:
+                self.connection.execute("DELETE FROM files")
+                self.entries.clear()
+                self.pending.clear()
+                self.loaded.clear()
+                return
+            path = os.path.abspath(path)
+            low, high = _prefix_range(path)
+            self.connection.execute(
+                "DELETE FROM files WHERE path = ? OR (path >= ? AND path < ?)", (path, low, high)
+            )
+            for cached in (self.entries, self.pending):
+                for key in [key for key in cached if key[0] == path or low <= key[0] < high]:
+                    del cached[key]
+
+    def compact(self) -> int:
+        """Removes entries whose file is gone or changed, then shrinks the database
+
+        Returns:
+            int: Number of entries removed
+        """
+        self.flush()
+        stale = []
+        with self.lock:
+            rows = self.connection.execute("SELECT path, algorithm, inode, size, mtime_ns FROM files").fetchall()
+        for path, algorithm, inode, size, mtime_ns in rows:
+            try:
+                st = os.stat(path)
+            except OSError:
+                stale.append((path, algorithm))
+                continue
+            if (st.st_ino, st.st_size, st.st_mtime_ns) != (inode, size, mtime_ns):
+                stale.append((path, algorithm))
+        with self.lock:
+            with self.connection:
+                self.connection.executemany("DELETE FROM files WHERE path = ? AND algorithm = ?", stale)
+            for key in stale:
+                self.entries.pop(key, None)
+            self.connection.execute("VACUUM")
+        return len(stale)
+
+    def close(self) -> None:
+        """Flushes pending entries and closes the database"""
+        self.flush()
+        with self.lock:
+            self.connection.close()
+
+
+def open_cache(directory: str = None) -> HashCache:
+    """Opens a `HashCache`, returning `None` instead of failing if it can't be (read-only home, broken database)"""
+    try:
+        return HashCache(directory)
+    except (OSError, sqlite3.Error):
+        return None
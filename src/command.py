@@ -1,21 +1,33 @@
 from __future__ import annotations
 
+import time
 from typing import Callable
 
 from .errors import UnknownCommand, UnknownOption
+from .instrumentation import stats
 
 
 class Command:
-    """Base class for commands"""
+    """Base class for commands
+
+    Commands are indexed by name (the first one registered wins, like a linear
+    scan would) and every command maps its subcommands by name, so lookups
+    are constant time per token. Names added with `add_lazy` only import the
+    module defining them when one of them is first looked up.
+    """
 
     commands: list[Command] = []
+    _by_name: dict[str, Command] = {}
+    _registered: set[Command] = set()
+    _lazy: dict[str, Callable[[], None]] = {}
 
     def __init__(self,
                  name: str,
                  terminal: None,
                  options: list[list[str], list[str]],
                  func: Callable[[None, dict[str, str], list[str]], None],
-                 parent: Command | str = None) -> None:
+                 parent: Command | str = None,
+                 background: bool = False) -> None:
         """Creates a Command to use in `Terminal`
 
         Args:
@@ -24,24 +36,27 @@ class Command:
             options (list[list[str], list[str]]): Valid options for command
             func (Callable[[None, dict[str, str], list[str]], None]): The Function to call when command is run
             parent (Command, optional): the parent this command belongs to. Defaults to None.
+            background (bool, optional): Run as a job on `terminal.jobs`, `func` then also gets the `Job`
+                as a fourth argument and may be a coroutine function. Defaults to False.
         """
         self.name = name
         self.terminal = terminal
         self.options = options
         self.func = func
         self.parent = parent
+        self.background = background
+        self._subcommands: list[Command] = []
+        self._children: dict[str, Command] = {}
         if self.parent is not None:
-            if type(self.parent) == str:
-                for _command in Command.commands:
-                    if _command.name == self.parent:
-                        self.parent = _command
-                        break
-                else:
+            if isinstance(self.parent, str):
+                self.parent = Command._by_name.get(self.parent)
+                if self.parent is None:
                     self.terminal.console.print("Parent command Not Found!")
                     raise KeyboardInterrupt
             self.parent.add_subcommand(self)
-        self._subcommands: list[Command] = []
         Command.commands.append(self)
+        Command._registered.add(self)
+        Command._by_name.setdefault(self.name, self)
 
     def add_subcommand(self, subcommand: Command | str) -> None:
         """Adds a subcommand to a already existing command
@@ -49,12 +64,10 @@ class Command:
         Args:
             child (Command): The subcommand to add
         """
-        if subcommand is str:
-            for command in Command.commands:
-                if command.name == subcommand:
-                    self._subcommands.append(command)
-
+        if isinstance(subcommand, str):
+            subcommand = Command._by_name[subcommand]
         self._subcommands.append(subcommand)
+        self._children.setdefault(subcommand.name, subcommand)
 
     @classmethod
     def is_command(cls, command: Command | str) -> bool:
@@ -66,10 +79,9 @@ class Command:
         Returns:
             bool: `True` if Exists else `False`
         """
-        for _command in cls.commands:
-            if _command.name == command or _command == command:
-                return True
-        return False
+        if isinstance(command, str):
+            return command in cls._by_name or command in cls._lazy
+        return command in cls._registered
 
     @classmethod
     def get_command(cls, command: str) -> Command:
@@ -81,10 +93,29 @@ class Command:
         Returns:
             Command: The `Command` object if exists else `None`
         """
-        for _command in cls.commands:
-            if _command.name == command:
-                return _command
-        return None
+        found = cls._by_name.get(command)
+        if found is None and command in cls._lazy:
+            cls._load(cls._lazy[command])
+            found = cls._by_name.get(command)
+        return found
+
+    @classmethod
+    def add_lazy(cls, names: list[str], loader: Callable[[], None]) -> None:
+        """Registers top-level command names whose `Command` objects `loader` creates on first lookup
+
+        Args:
+            names (list[str]): The commands `loader` creates
+            loader (Callable[[], None]): Imports the module defining them and runs its `init`
+        """
+        for name in names:
+            cls._lazy.setdefault(name, loader)
+
+    @classmethod
+    def _load(cls, loader: Callable[[], None]) -> None:
+        """Runs a loader from `add_lazy` once, forgetting every name it provides"""
+        for name in [name for name, pending in cls._lazy.items() if pending is loader]:
+            del cls._lazy[name]
+        loader()
 
     @classmethod
     def has_subcommands(cls, command: str | Command) -> bool:
@@ -96,9 +127,11 @@ class Command:
         Returns:
             bool: True if `command` has subcommand/s else False
         """
-        for _command in cls.commands:
-            if _command.name == command or _command == command:
-                return _command._subcommands != []
+        if isinstance(command, str):
+            command = cls.get_command(command)
+            if command is None:
+                return None
+        return command._subcommands != []
 
     @classmethod
     def is_subcommand(cls, subcommand: str | Command, command: str | Command) -> bool:
@@ -111,12 +144,13 @@ class Command:
         Returns:
             bool: True if it is a Subcommand else False
         """
-        for _command in cls.commands:
-            if _command.name == command or _command == command:
-                for _subcommand in _command._subcommands:
-                    if subcommand == _subcommand.name or subcommand == _subcommand:
-                        return True
-        return False
+        if isinstance(command, str):
+            command = cls.get_command(command)
+            if command is None:
+                return False
+        if isinstance(subcommand, str):
+            return subcommand in command._children
+        return command._children.get(subcommand.name) is subcommand
 
     @classmethod
     def get_all_commands(cls) -> list[Command]:
@@ -125,10 +159,18 @@ class Command:
         Returns:
             list[Command]: A list of `Command` object
         """
+        for loader in list(dict.fromkeys(cls._lazy.values())):
+            cls._load(loader)
         return cls.commands
 
+    def get_full_name(self) -> str:
+        """Returns the names of this command and its parents, like they are typed"""
+        if self.parent is None:
+            return self.name
+        return f"{self.parent.get_full_name()} {self.name}"
+
     def run(self, options: dict[str, str], params: list[str]) -> None:
-        """Runs the command
+        """Runs the command, or starts it as a background job
 
         Args:
             options (dict[str, str]): Options from input, ex. `-V` or `--help`
@@ -143,7 +185,17 @@ class Command:
             else:
                 raise UnknownOption(f"Unknown Option: {key}")
 
-        self.func(self.terminal, _options, params)
+        start = time.perf_counter() if stats.enabled else None
+        try:
+            if self.background:
+                job = self.terminal.jobs.submit(" ".join([self.get_full_name(), *params]), self.func,
+                                                self.terminal, _options, params)
+                self.terminal.console.print(f"[{job.id}] started")
+                return
+            self.func(self.terminal, _options, params)
+        finally:
+            if start is not None:
+                stats.observe(f"command {self.get_full_name()}", time.perf_counter() - start)
 
     @classmethod
     def parse(self, command: str) -> Command:
@@ -159,12 +211,30 @@ class Command:
             Command: The Command object
         """
         arguments = command.split()
-        if not self.is_command(arguments[0]) or self.get_command(arguments[0]).parent is not None:
-            raise UnknownCommand(f"Unknown Command: {command}")
-        for x in range(1, len(arguments)):
-            if self.get_command(arguments[x]).parent != self.get_command(arguments[x-1]):
-                raise UnknownCommand(f"Unknown Command: {command}")
-        return self.get_command(arguments[-1])
+        return self.resolve(arguments, command)
+
+    @classmethod
+    def resolve(cls, names: list[str], command: str = None) -> Command:
+        """Walks the command hierarchy one name at a time
+
+        Args:
+            names (list[str]): A top-level command name followed by subcommand names
+            command (str, optional): The original input, for the error message. Defaults to None.
+
+        Raises:
+            UnknownCommand: If a name is not a (sub)command of the one before it
+
+        Returns:
+            Command: The last Command
+        """
+        current = cls.get_command(names[0]) if names else None
+        if current is None or current.parent is not None:
+            raise UnknownCommand(f"Unknown Command: {command or ' '.join(names)}")
+        for name in names[1:]:
+            current = current._children.get(name)
+            if current is None:
+                raise UnknownCommand(f"Unknown Command: {command or ' '.join(names)}")
+        return current
 
 
 def _test(terminal: None, options: list[list[str], dict[str, str]], params: list[str]) -> None:
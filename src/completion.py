@@ -0,0 +1,352 @@
+"""Tab completion of commands, options and paths for the prompt
+
+Command names, subcommands and options come from prefix tries that are only
+rebuilt when commands are added. Paths come from a small LRU cache of sorted
+directory listings, checked against the directory's mtime on every use, so
+a keypress costs one `stat` and a binary search instead of a directory read,
+however many entries the directory has. Directories inside a watched scan
+are listed from the scan, which the watcher keeps current.
+
+Words are split with the quoting rules of `input_parser.tokenize`, and
+candidates keep what was typed and quote the rest the same way, so names
+with spaces or quotes complete into words that parse back to the name.
+"""
+from __future__ import annotations
+
+import os
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from typing import Iterable
+
+from .command import Command
+from .errors import InvalidSyntax
+from .input_parser import tokenize
+
+# Directory listings kept, least recently used ones are dropped first
+LISTING_CACHE_SIZE = 64
+# Marks the end of a word in a trie node, no character is an empty string
+_END = ""
+# Characters that end or change an unquoted word, see `shlex`
+_SPECIAL = " \t\n'\"\\"
+
+
+class PrefixTrie:
+    """A set of words that finds every word starting with a prefix without looking at the others"""
+
+    def __init__(self, words: Iterable[str] = ()) -> None:
+        self._root: dict = {}
+        for word in words:
+            self.add(word)
+
+    def add(self, word: str) -> None:
+        """Adds a word, adding it twice keeps one"""
+        node = self._root
+        for char in word:
+            node = node.setdefault(char, {})
+        node[_END] = word
+
+    def complete(self, prefix: str) -> list[str]:
+        """Returns the words starting with `prefix`, sorted"""
+        node = self._find(prefix)
+        if node is None:
+            return []
+        words = []
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            for char, child in node.items():
+                if char == _END:
+                    words.append(child)
+                else:
+                    stack.append(child)
+        return sorted(words)
+
+    def _find(self, prefix: str) -> dict:
+        """Returns the node reached by `prefix`, or `None`"""
+        node = self._root
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return None
+        return node
+
+
+class ListingCache:
+    """Sorted directory listings, reread only when the directory changed
+
+    Entries are names with a trailing separator for directories. Hidden names
+    are kept in a second list, so completing a prefix without a leading dot
+    does not have to filter them out.
+    """
+
+    def __init__(self, size: int = LISTING_CACHE_SIZE) -> None:
+        """Creates an empty cache
+
+        Args:
+            size (int, optional): Directories kept. Defaults to LISTING_CACHE_SIZE.
+        """
+        self.size = size
+        self._listings: OrderedDict[str, tuple] = OrderedDict()
+
+    def complete(self, directory: str, prefix: str, manager: object = None) -> list[str]:
+        """Returns the entries of `directory` starting with `prefix`
+
+        Args:
+            directory (str): An absolute directory
+            prefix (str): The start of the name, hidden names are only matched if it starts with a dot
+            manager (FileManager, optional): A watched scan containing `directory` to list it from.
+                Defaults to None.
+
+        Returns:
+            list[str]: Matching names, sorted, directories end with a separator
+        """
+        listing = self.get(directory, manager)
+        if listing is None:
+            return []
+        names = listing[1] if prefix.startswith(".") else listing[2]
+        low = bisect_left(names, prefix)
+        high = bisect_left(names, prefix + "\U0010ffff", low)
+        return names[low:high]
+
+    def get(self, directory: str, manager: object = None) -> tuple:
+        """Returns `(validator, all names, visible names)` of a directory, or `None` if it can't be read"""
+        try:
+            validator = manager.version if manager is not None else os.stat(directory).st_mtime_ns
+        except OSError:
+            self._listings.pop(directory, None)
+            return None
+        listing = self._listings.get(directory)
+        if listing is not None and listing[0] == validator:
+            self._listings.move_to_end(directory)
+            return listing
+        try:
+            names = _list_scanned(manager, directory) if manager is not None else _list_directory(directory)
+        except OSError:
+            return None
+        names.sort()
+        listing = self._listings[directory] = (validator, names, [name for name in names if name[0] != "."])
+        self._listings.move_to_end(directory)
+        if len(self._listings) > self.size:
+            self._listings.popitem(last=False)
+        return listing
+
+    def clear(self) -> None:
+        """Forgets every listing"""
+        self._listings.clear()
+
+
+def _list_directory(directory: str) -> list[str]:
+    """Returns the names in a directory, directories with a trailing separator"""
+    with os.scandir(directory) as entries:
+        return [entry.name + os.sep if entry.is_dir() else entry.name for entry in entries]
+
+
+def _list_scanned(manager: object, directory: str) -> list[str]:
+    """Returns the names in a scanned directory without reading it, from the scan's per-directory index"""
+    names = [os.path.basename(child.path) + os.sep for child in manager.get_usage_children(directory)]
+    names.extend(file.name for file in manager.iter_sorted("name", False, directory))
+    return names
+
+
+class Completer:
+    """Completes the word under the cursor of a `Terminal` prompt"""
+
+    def __init__(self, terminal: None, listings: ListingCache = None) -> None:
+        """Creates a completer
+
+        Args:
+            terminal (Terminal): The terminal whose commands and scans are used
+            listings (ListingCache, optional): Directory listing cache. Defaults to a new one.
+        """
+        self.terminal = terminal
+        self.listings = listings or ListingCache()
+        self._commands: tuple = (None, None)
+        self._children: dict[int, tuple] = {}
+        self._matches: list[str] = []
+
+    def install(self) -> bool:
+        """Makes `readline` complete with this completer on tab
+
+        Returns:
+            bool: `False` if there is no `readline` module on this platform
+        """
+        try:
+            import readline
+        except ImportError:
+            return False
+        readline.set_completer(self.complete_readline)
+        readline.set_completer_delims(" \t\n")
+        if "libedit" in (readline.__doc__ or ""):
+            readline.parse_and_bind("bind ^I rl_complete")
+        else:
+            readline.parse_and_bind("tab: complete")
+        return True
+
+    def complete_readline(self, text: str, state: int) -> str:
+        """The `readline` completer, called with `state` 0, 1, 2, ... until it returns `None`"""
+        if state == 0:
+            import readline
+
+            begin = readline.get_begidx()
+            start, matches = self._complete(readline.get_line_buffer()[:readline.get_endidx()])
+            # readline only replaces from the last space, which may be inside the quoted word
+            self._matches = [match[begin - start:] for match in matches if begin >= start]
+        return self._matches[state] if state < len(self._matches) else None
+
+    def complete(self, line: str) -> list[str]:
+        """Returns the candidates for the last word of `line`, what follows the cursor is not part of it
+
+        Args:
+            line (str): The input up to the cursor
+
+        Returns:
+            list[str]: Words that could replace the last word as typed, quoted like it, sorted
+        """
+        return self._complete(line)[1]
+
+    def _complete(self, line: str) -> tuple[int, list[str]]:
+        """Returns where the last word of `line` starts and its candidates, see `complete`"""
+        start, text, quote = _split_last_word(line)
+        typed = line[start:]
+        return start, [typed + _quote(word[len(text):], quote, word)
+                       for word in self._complete_words(line[:start], text)]
+
+    def _complete_words(self, head: str, text: str) -> list[str]:
+        """Returns the unquoted words that could replace `text`, following the words of `head`"""
+        try:
+            words = tokenize(head)
+        except InvalidSyntax:
+            # `head` ends outside of any quote, this is only a safety net
+            words = head.split()
+        if not words:
+            return self._get_command_trie().complete(text)
+
+        command = Command.get_command(words[0])
+        if command is None or command.parent is not None:
+            return self.complete_path(text)
+        position = 1
+        while position < len(words) and words[position] in command._children:
+            command = command._children[words[position]]
+            position += 1
+        rest = words[position:]
+        if rest and rest[-1].startswith("--"):
+            # the value of a long option, nothing is known about it
+            return []
+        if text.startswith("-"):
+            return [word for word in self._get_child_trie(command).complete(text) if word not in rest]
+        matches = self.complete_path(text)
+        if not rest:
+            subcommands = [word for word in self._get_child_trie(command).complete(text) if word[0] != "-"]
+            for subcommand in subcommands:
+                insort(matches, subcommand)
+        return matches
+
+    def complete_path(self, text: str) -> list[str]:
+        """Returns the paths starting with `text`, relative to the current directory unless absolute"""
+        head, prefix = os.path.split(text)
+        directory = os.path.abspath(os.path.expanduser(head or os.curdir))
+        names = self.listings.complete(directory, prefix, self._get_watched_manager(directory))
+        if not head:
+            return names
+        head = os.path.join(head, "")
+        return [head + name for name in names]
+
+    def _get_watched_manager(self, directory: str) -> object:
+        """Returns the watched local scan containing `directory`, whose listing is always current"""
+        managers = self.terminal.file_managers
+        if not managers:
+            return None
+        path = directory
+        while True:
+            manager = managers.get(path)
+            if manager is not None or os.path.dirname(path) == path:
+                break
+            path = os.path.dirname(path)
+        if getattr(manager, "watcher", None) is None or manager.options.get("hidden") != "include":
+            return None
+        if manager.options.get("same_device"):
+            # mount points below the root were not scanned, their names are missing
+            return None
+        return manager
+
+    def _get_command_trie(self) -> PrefixTrie:
+        """Returns the trie of top-level command names, lazy ones included without loading them"""
+        version = (len(Command.commands), len(Command._lazy))
+        if self._commands[0] != version:
+            names = [command.name for command in Command.commands if command.parent is None]
+            self._commands = (version, PrefixTrie(names + list(Command._lazy)))
+        return self._commands[1]
+
+    def _get_child_trie(self, command: Command) -> PrefixTrie:
+        """Returns the trie of a command's subcommand names and options"""
+        cached = self._children.get(id(command))
+        if cached is None or cached[0] is not command or cached[1] != len(command._children):
+            words = [*command._children, *command.options[0], *command.options[1]]
+            cached = self._children[id(command)] = (command, len(command._children), PrefixTrie(words))
+        return cached[2]
+
+
+def _split_last_word(line: str) -> tuple[int, str, str]:
+    """Finds the last word of a line with the quoting rules of `shlex.split`
+
+    Returns:
+        tuple[int, str, str]: Where the word starts in `line`, its unquoted text,
+            and the quote left open at the end of the line, or `None`
+    """
+    start = len(line)
+    text = []
+    quote = None
+    escaped = False
+    in_word = False
+    for position, char in enumerate(line):
+        if escaped:
+            if quote == '"' and char not in '"\\':
+                # inside double quotes a backslash only escapes a quote or itself
+                text.append("\\")
+            text.append(char)
+            escaped = False
+        elif quote == "'":
+            if char == "'":
+                quote = None
+            else:
+                text.append(char)
+        elif quote == '"':
+            if char == '"':
+                quote = None
+            elif char == "\\":
+                escaped = True
+            else:
+                text.append(char)
+        elif char.isspace():
+            in_word = False
+        else:
+            if not in_word:
+                in_word = True
+                start = position
+                text = []
+            if char in "'\"":
+                quote = char
+            elif char == "\\":
+                escaped = True
+            else:
+                text.append(char)
+    if not in_word:
+        return len(line), "", None
+    return start, "".join(text), quote
+
+
+def _quote(text: str, quote: str, word: str) -> str:
+    """Quotes `text`, the rest of `word`, to continue a word whose open quote is `quote`
+
+    The quote is closed after a whole name, directories end with a separator
+    and leave it open, so completion can go on inside them.
+    """
+    if quote == "'":
+        text = text.replace("'", "'\\''")
+    elif quote == '"':
+        text = text.replace("\\", "\\\\").replace('"', '\\"')
+    elif any(char in _SPECIAL for char in text):
+        text = "".join("\\" + char if char in _SPECIAL else char for char in text)
+    if quote is not None and not word.endswith(os.sep):
+        text += quote
+    return text
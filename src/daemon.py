@@ -0,0 +1,470 @@
+"""A local index service sharing scans between terminal sessions
+
+Run it with `python -m src.daemon [--socket PATH]` and start terminals with
+`launcher.py --daemon [PATH]`. Every root is scanned once by the daemon, and
+every session attached to it queries the same `FileManager`.
+
+Messages in both directions are a 4 byte big endian length followed by
+that many bytes of compact JSON. A request is `{"op": ..., "args": {...}}`,
+the reply `{"ok": true, "result": ...}` or `{"ok": false, "error": <exception
+name>, "message": ...}`. Files travel as `[path, size, mtime_ns, hash, inode,
+dev]` and directory totals as `[path, size, files, mtime_ns]`.
+
+Anyone who can connect can make the daemon scan any path it can read, the
+socket is therefore only accessible to its owner unless `--mode` says otherwise.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import socket
+import socketserver
+import struct
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import BinaryIO, Iterator, NamedTuple
+
+from .cache import HashCache, open_cache
+from .errors import DaemonError
+from .file_manager import Directory, File, FileManager
+from .iosched import IOScheduler
+from .snapshot import write as write_snapshot
+
+DEFAULT_SOCKET = os.path.join(os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir(),
+                              f"file-manager-{os.getuid()}.sock")
+HEADER = struct.Struct(">I")
+MAX_MESSAGE = 1 << 30
+CACHED_RESULTS = 32
+# Results that are cached as encoded replies until the scan changes
+CACHED_OPS = {"files", "directories", "duplicates", "duplicates_by_name", "query", "sorted"}
+REMOTE_ERRORS = {"KeyError": KeyError, "ValueError": ValueError, "FileNotFoundError": FileNotFoundError}
+
+
+def encode(message: object) -> bytes:
+    """Returns `message` as one length prefixed frame"""
+    body = json.dumps(message, separators=(",", ":")).encode()
+    return HEADER.pack(len(body)) + body
+
+
+def read_message(stream: BinaryIO) -> object:
+    """Reads one frame from `stream`
+
+    Raises:
+        ConnectionError: If the stream ends inside a frame
+        DaemonError: If the frame is larger than `MAX_MESSAGE`
+
+    Returns:
+        object: The decoded message, or `None` at the end of the stream
+    """
+    header = stream.read(HEADER.size)
+    if not header:
+        return None
+    if len(header) < HEADER.size:
+        raise ConnectionError("Connection closed inside a message")
+    length, = HEADER.unpack(header)
+    if length > MAX_MESSAGE:
+        raise DaemonError(f"Message of {length:,} bytes is too large")
+    body = stream.read(length)
+    if len(body) < length:
+        raise ConnectionError("Connection closed inside a message")
+    return json.loads(body)
+
+
+def _encode_file(file: File) -> list:
+    return [file.path, file.size, file.mtime_ns, file.hash, file.inode, file.dev]
+
+
+def _decode_file(record: list) -> File:
+    path, size, mtime_ns, hash, inode, dev = record
+    return File(os.path.basename(path), path, hash, size, inode, mtime_ns, dev=dev)
+
+
+def _encode_directory(directory: Directory) -> list:
+    return None if directory is None else [directory.path, directory.size, directory.files, directory.mtime_ns]
+
+
+def _decode_directory(record: list) -> Directory:
+    return None if record is None else Directory(*record)
+
+
+class _Entry:
+    """One scanned root of the daemon"""
+
+    __slots__ = ("root", "manager", "lock", "replies")
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        self.manager: FileManager = None
+        self.lock = threading.Lock()
+        self.replies: OrderedDict[str, tuple[tuple, bytes]] = OrderedDict()
+
+
+class IndexServer:
+    """Owns the scans and answers requests from any number of connections
+
+    Requests for different roots run in parallel, requests for the same
+    root one after the other, so a root asked for by several sessions at
+    once is still only scanned once. Replies of `CACHED_OPS` are kept
+    encoded until `FileManager.version` changes.
+    """
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET, mode: int = 0o600) -> None:
+        """Creates the server, `serve_forever` starts listening
+
+        Args:
+            socket_path (str, optional): Path of the Unix socket. Defaults to `DEFAULT_SOCKET`.
+            mode (int, optional): Permissions of the socket. Defaults to 0o600.
+        """
+        self.socket_path = socket_path
+        self.mode = mode
+        self.entries: dict[str, _Entry] = {}
+        self.lock = threading.Lock()
+        self._server: socketserver.ThreadingUnixStreamServer = None
+        self._cache: HashCache = None
+        self._cache_opened = False
+
+    def serve_forever(self) -> None:
+        """Listens on `socket_path` until `shutdown`
+
+        Raises:
+            DaemonError: If another daemon is already listening there
+        """
+        if os.path.exists(self.socket_path):
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                    probe.connect(self.socket_path)
+            except OSError:
+                os.unlink(self.socket_path)
+            else:
+                raise DaemonError(f"A daemon is already listening on {self.socket_path}")
+        # bind creates the socket file, with `mode` from the start there is no moment other users can connect
+        umask = os.umask(~self.mode & 0o777)
+        try:
+            self._server = socketserver.ThreadingUnixStreamServer(self.socket_path, _Handler)
+        finally:
+            os.umask(umask)
+        self._server.daemon_threads = True
+        self._server.index = self
+        os.chmod(self.socket_path, self.mode)
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def shutdown(self) -> None:
+        """Stops `serve_forever` from another thread"""
+        if self._server is not None:
+            self._server.shutdown()
+
+    def respond(self, request: dict) -> bytes:
+        """Runs one request, returning the encoded reply"""
+        op = request.get("op")
+        args = request.get("args") or {}
+        try:
+            if op == "ping":
+                return encode({"ok": True, "result": {"pid": os.getpid(), "roots": len(self.entries)}})
+            if op == "roots":
+                return encode({"ok": True, "result": sorted(root for root, entry in list(self.entries.items())
+                                                            if entry.manager is not None)})
+            entry = self._get_entry(args.pop("root", None), op == "scan")
+            with entry.lock:
+                if op == "scan":
+                    return encode({"ok": True, "result": self._scan(entry, args)})
+                if entry.manager is None:
+                    raise DaemonError("Not scanned yet, run `scan` first")
+                if op not in CACHED_OPS:
+                    return encode({"ok": True, "result": self._run(entry.manager, op, args)})
+                key = json.dumps([op, args], sort_keys=True)
+                version = entry.manager.version
+                cached = entry.replies.get(key)
+                if cached is not None and cached[0] == version:
+                    entry.replies.move_to_end(key)
+                    return cached[1]
+                reply = encode({"ok": True, "result": self._run(entry.manager, op, args)})
+                entry.replies[key] = (version, reply)
+                if len(entry.replies) > CACHED_RESULTS:
+                    entry.replies.popitem(last=False)
+                return reply
+        except Exception as error:
+            message = error.args[0] if len(error.args) == 1 else str(error)
+            return encode({"ok": False, "error": type(error).__name__, "message": str(message)})
+
+    def _get_entry(self, root: str, create: bool = False) -> _Entry:
+        """Returns the entry of an absolute root, creating it for a scan"""
+        if not isinstance(root, str) or not os.path.isabs(root):
+            raise DaemonError(f"Not an absolute path: {root}")
+        root = os.path.normpath(root)
+        with self.lock:
+            entry = self.entries.get(root)
+            if entry is None:
+                if not create:
+                    raise DaemonError(f"Not scanned yet, run `scan {root}` first")
+                entry = self.entries[root] = _Entry(root)
+        return entry
+
+    def _get_cache(self) -> HashCache:
+        """Returns the checksum cache shared by every scan, `None` if it can't be opened"""
+        with self.lock:
+            if not self._cache_opened:
+                self._cache = open_cache()
+                self._cache_opened = True
+        return self._cache
+
+    def _scan(self, entry: _Entry, args: dict) -> dict:
+        """Scans a root unless an earlier request did, called with its lock held"""
+        scanned = entry.manager is None or args.get("force", False)
+        if scanned:
+            if entry.manager is not None:
+                entry.manager.unwatch()
+            entry.manager = FileManager(
+                entry.root,
+                staged=args.get("staged", True),
+                algorithm=args.get("algorithm") or "sha224",
+                workers=int(args.get("workers") or 1),
+                cache=self._get_cache(),
+                compact=args.get("compact", False),
+                scheduler=IOScheduler(**args["io"]) if args.get("io") else None,
+            )
+            entry.replies.clear()
+        data = entry.manager.data
+        return {"files": len(data[2]), "directories": len(data[1]), "scanned": scanned}
+
+    @staticmethod
+    def _run(manager: FileManager, op: str, args: dict) -> object:
+        """Runs every op but `ping`, `roots` and `scan` on a scanned root"""
+        if op == "files":
+            return [_encode_file(file) for file in manager.get_files()]
+        if op == "directories":
+            return list(manager.get_directories())
+        if op == "duplicates":
+            return [[_encode_file(file) for file in group] for group in manager.get_duplicate_groups()]
+        if op == "duplicates_by_name":
+            return manager.get_dupliacte()
+        if op == "query":
+            return [_encode_file(file) for file in manager.query(**args.get("criteria", {}))]
+        if op == "sorted":
+            return [_encode_file(file) for file in
+                    manager.iter_sorted(args.get("key", "name"), args.get("reverse", False), args.get("directory"),
+                                        args.get("hidden", True))]
+        if op == "algorithm":
+            return manager.algorithm
+        if op == "usage":
+            return _encode_directory(manager.get_usage(args.get("path")))
+        if op == "usage_children":
+            return [_encode_directory(child) for child in manager.get_usage_children(args.get("path"))]
+        if op == "rescan":
+            manager.rescan()
+            return None
+        if op == "watch":
+            return manager.watch(args.get("backend", "auto")).backend
+        if op == "unwatch":
+            manager.unwatch()
+            return None
+        raise DaemonError(f"Unknown request: {op}")
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Answers the requests of one connection until it is closed"""
+
+    def handle(self) -> None:
+        while True:
+            try:
+                request = read_message(self.rfile)
+            except (ConnectionError, DaemonError, ValueError):
+                return
+            if not isinstance(request, dict):
+                return
+            self.wfile.write(self.server.index.respond(request))
+
+
+class IndexClient:
+    """A connection to the daemon, kept open and reused for every request
+
+    It is safe to share between threads, requests are sent one at a time. A
+    broken connection, e.g. after the daemon restarted, is reopened once.
+    """
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET, timeout: float = None) -> None:
+        """Creates a client, the connection is opened by the first request
+
+        Args:
+            socket_path (str, optional): Path of the daemon socket. Defaults to `DEFAULT_SOCKET`.
+            timeout (float, optional): Seconds to wait for a reply, scans can take long. Defaults to None.
+        """
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self._socket: socket.socket = None
+        self._stream: BinaryIO = None
+
+    def request(self, op: str, **args: object) -> object:
+        """Sends one request and returns its result
+
+        Raises:
+            DaemonError: If the daemon can't be reached or the request failed there,
+                `KeyError`, `ValueError` and `FileNotFoundError` are raised as themselves
+
+        Returns:
+            object: The decoded result
+        """
+        message = encode({"op": op, "args": args})
+        with self.lock:
+            for attempt in range(2):
+                try:
+                    if self._socket is None:
+                        self._connect()
+                    self._socket.sendall(message)
+                    reply = read_message(self._stream)
+                    if reply is None:
+                        raise ConnectionError("The daemon closed the connection")
+                    break
+                except OSError as error:
+                    self.close()
+                    if attempt:
+                        raise DaemonError(f"Can't reach the daemon at {self.socket_path}: {error}") from error
+        if not reply["ok"]:
+            raise REMOTE_ERRORS.get(reply["error"], DaemonError)(reply["message"])
+        return reply["result"]
+
+    def _connect(self) -> None:
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(self.timeout)
+        try:
+            self._socket.connect(self.socket_path)
+        except OSError:
+            self.close()
+            raise
+        self._stream = self._socket.makefile("rb")
+
+    def close(self) -> None:
+        """Closes the connection, the next request opens a new one"""
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def get_roots(self) -> list[str]:
+        """Returns every root the daemon has scanned"""
+        return self.request("roots")
+
+
+class RemoteWatcher(NamedTuple):
+    """What `RemoteManager.watch` returns instead of the daemon's `Watcher`"""
+
+    backend: str
+
+
+class RemoteManager:
+    """The `FileManager` API of one root, answered by the daemon
+
+    `file_commands` uses it in place of a local scan. Files come back as
+    `File` objects without their ctime.
+    """
+
+    def __init__(self, client: IndexClient, file_path: str) -> None:
+        """Creates a proxy, nothing is sent until it is used
+
+        Args:
+            client (IndexClient): The connection to the daemon
+            file_path (str): Absolute root to scan
+        """
+        self.client = client
+        self.file_path = file_path
+
+    def _request(self, op: str, **args: object) -> object:
+        return self.client.request(op, root=self.file_path, **args)
+
+    def scan(self, staged: bool = True, algorithm: str = None, workers: int = 1, compact: bool = False,
+             force: bool = False, io: dict = None) -> dict:
+        """Makes the daemon scan the root unless it has already, see `FileManager`
+
+        `io` holds the keyword arguments of the `IOScheduler` the daemon reads with.
+
+        Returns:
+            dict: `files` and `directories` counts, `scanned` is `False` if an earlier scan was reused
+        """
+        return self._request("scan", staged=staged, algorithm=algorithm, workers=workers,
+                             compact=compact, force=force, io=io)
+
+    @property
+    def algorithm(self) -> str:
+        """The hash algorithm of the daemon's scan"""
+        return self._request("algorithm")
+
+    def rescan(self) -> None:
+        """Makes the daemon walk the root again on its next use"""
+        self._request("rescan")
+
+    def watch(self, backend: str = "auto") -> RemoteWatcher:
+        """Makes the daemon keep the scan current, see `FileManager.watch`"""
+        return RemoteWatcher(self._request("watch", backend=backend))
+
+    def unwatch(self) -> None:
+        """Stops the daemon's watcher of the root"""
+        self._request("unwatch")
+
+    def query(self, **criteria) -> list[File]:
+        """See `FileManager.query`"""
+        return [_decode_file(record) for record in self._request("query", criteria=criteria)]
+
+    def iter_sorted(self,
+                    key: str = "name",
+                    reverse: bool = False,
+                    directory: str = None,
+                    hidden: bool = True) -> Iterator[File]:
+        """See `FileManager.iter_sorted`, the files arrive in one reply"""
+        return map(_decode_file, self._request("sorted", key=key, reverse=reverse, directory=directory,
+                                               hidden=hidden))
+
+    def get_usage(self, path: str = None) -> Directory:
+        """See `FileManager.get_usage`"""
+        return _decode_directory(self._request("usage", path=path))
+
+    def get_usage_children(self, path: str = None) -> list[Directory]:
+        """See `FileManager.get_usage_children`"""
+        return [_decode_directory(record) for record in self._request("usage_children", path=path)]
+
+    def get_duplicate_groups(self) -> list[list[File]]:
+        """See `FileManager.get_duplicate_groups`"""
+        return [[_decode_file(record) for record in group] for group in self._request("duplicates")]
+
+    def get_dupliacte(self) -> dict:
+        """See `FileManager.get_dupliacte`"""
+        return self._request("duplicates_by_name")
+
+    def save_snapshot(self, path: str) -> None:
+        """See `FileManager.save_snapshot`, the file is written by this process, not the daemon"""
+        write_snapshot(path, self.get_files(), self.file_path, self.algorithm)
+
+    def get_directories(self) -> list:
+        """See `FileManager.get_directories`"""
+        return self._request("directories")
+
+    def get_files(self) -> list:
+        """See `FileManager.get_files`"""
+        return [_decode_file(record) for record in self._request("files")]
+
+
+def main() -> None:
+    """Runs the daemon in the foreground until interrupted"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help=f"socket path, defaults to {DEFAULT_SOCKET}")
+    parser.add_argument("--mode", type=lambda text: int(text, 8), default=0o600,
+                        help="octal socket permissions, e.g. 660 to share with the group")
+    args = parser.parse_args()
+    server = IndexServer(args.socket, args.mode)
+    print(f"listening on {args.socket}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
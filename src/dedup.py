@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import contextlib
+import os
+import secrets
+import shutil
+import stat
+from typing import Callable, NamedTuple
+
+from .duplicates import get_inode_key
+from .errors import UnknownPolicy
+from .hashing import BUFFER_SIZE
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+FICLONE = 0x40049409
+ACTIONS = ["hardlink", "reflink"]
+
+
+class Replacement(NamedTuple):
+    """One planned step, `duplicate` becomes a hard link or clone of `original`"""
+
+    original: str
+    duplicate: str
+    size: int
+
+
+class DedupReport(NamedTuple):
+    """What `apply` did"""
+
+    replaced: int
+    copied: int
+    skipped: int
+    reclaimed: int
+
+
+def plan(groups: list[list]) -> list[Replacement]:
+    """Plans replacing every duplicate with the first file of its group on the same device
+
+    Every extra hard link of a duplicate inode is planned too, the inode is
+    only freed once none of its names point to it.
+
+    Args:
+        groups (list[list[File]]): Duplicate groups, see `FileManager.get_duplicate_groups`
+
+    Returns:
+        list[Replacement]: The steps, nothing is changed yet
+    """
+    steps = []
+    for group in groups:
+        if not group[0].size:
+            # empty files share no blocks, linking them frees nothing
+            continue
+        originals = {}
+        for file in group:
+            original = originals.setdefault(file.dev, file)
+            if get_inode_key(file) != get_inode_key(original):
+                steps.append(Replacement(original.path, file.path, file.size))
+    return steps
+
+
+def get_reclaimable(groups: list[list]) -> int:
+    """Returns the bytes freed by keeping a single inode per group and device
+
+    Only links inside the scan are known, an inode with more names outside
+    of it stays allocated.
+    """
+    total = 0
+    for group in groups:
+        inodes = {get_inode_key(file) for file in group}
+        devices = {file.dev for file in group}
+        total += group[0].size * (len(inodes) - len(devices))
+    return total
+
+
+def verify(original: str, duplicate: str) -> bool:
+    """Returns `True` if both files have exactly the same bytes"""
+    with open(original, "rb", buffering=0) as first, open(duplicate, "rb", buffering=0) as second:
+        if os.fstat(first.fileno()).st_size != os.fstat(second.fileno()).st_size:
+            return False
+        first_view = memoryview(bytearray(BUFFER_SIZE))
+        second_view = memoryview(bytearray(BUFFER_SIZE))
+        while True:
+            read = first.readinto(first_view)
+            if read != second.readinto(second_view) or first_view[:read] != second_view[:read]:
+                return False
+            if not read:
+                return True
+
+
+def reflink(source: str, target: str) -> bool:
+    """Clones `source` to the new file `target` with the FICLONE ioctl, copying if that is not supported
+
+    `target` is removed again if the copy fails.
+
+    Raises:
+        FileExistsError: If `target` exists, it is left alone
+
+    Returns:
+        bool: `True` if the data blocks are shared, `False` if they were copied
+    """
+    with open(source, "rb") as source_file, open(target, "xb") as target_file:
+        try:
+            if fcntl is not None:
+                try:
+                    fcntl.ioctl(target_file.fileno(), FICLONE, source_file.fileno())
+                    return True
+                except OSError:
+                    pass
+            shutil.copyfileobj(source_file, target_file, BUFFER_SIZE)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.unlink(target)
+            raise
+    return False
+
+
+def replace(original: str, duplicate: str, action: str = "hardlink") -> bool:
+    """Atomically replaces `duplicate` with a hard link or clone of `original`
+
+    The link or clone is made under a new random name next to `duplicate`
+    and renamed over it, so `duplicate` always exists. Clones keep the
+    permissions and times of `duplicate`.
+
+    Returns:
+        bool: `True` if the data is now shared, `False` if a reflink fell back to a copy
+    """
+    directory, name = os.path.split(duplicate)
+    for _ in range(os.TMP_MAX):
+        temporary = os.path.join(directory, f".{name}.{secrets.token_hex(4)}.dedup")
+        # both fail with FileExistsError instead of touching an existing file
+        try:
+            if action == "hardlink":
+                os.link(original, temporary)
+                shared = True
+            else:
+                shared = reflink(original, temporary)
+            break
+        except FileExistsError:
+            continue
+    else:
+        raise FileExistsError(f"No free temporary name next to {duplicate}")
+    try:
+        if action != "hardlink":
+            shutil.copystat(duplicate, temporary)
+        os.replace(temporary, duplicate)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(temporary)
+        raise
+    return shared
+
+
+def apply(steps: list[Replacement],
+          action: str = "hardlink",
+          check: bool = True,
+          progress: Callable[[str], None] = None) -> DedupReport:
+    """Runs a plan from `plan`
+
+    Args:
+        steps (list[Replacement]): The plan
+        action (str, optional): "hardlink" or "reflink". Defaults to "hardlink".
+        check (bool, optional): Compare every pair byte for byte first and skip those that differ.
+            Defaults to True.
+        progress (Callable[[str], None], optional): Called with every duplicate path before it is
+            replaced, an exception it raises stops the run. Defaults to None.
+
+    Raises:
+        UnknownPolicy: If `action` is not in `ACTIONS`
+
+    Returns:
+        DedupReport: Counts of replaced, copied and skipped files and the bytes freed
+    """
+    if action not in ACTIONS:
+        raise UnknownPolicy(f"Unknown dedup action: {action}")
+    replaced = copied = skipped = reclaimed = 0
+    for step in steps:
+        if progress is not None:
+            progress(step.duplicate)
+        try:
+            st = os.lstat(step.duplicate)
+            if stat.S_ISLNK(st.st_mode) or os.path.samefile(step.original, step.duplicate):
+                skipped += 1
+                continue
+            if check and not verify(step.original, step.duplicate):
+                skipped += 1
+                continue
+            if replace(step.original, step.duplicate, action):
+                replaced += 1
+                if st.st_nlink == 1:
+                    reclaimed += st.st_size
+            else:
+                copied += 1
+        except OSError:
+            skipped += 1
+    return DedupReport(replaced, copied, skipped, reclaimed)
@@ -0,0 +1,274 @@
+from __future__ import annotations
+
+import functools
+import os
+from typing import Callable
+
+from .hashing import (
+    DEFAULT_ALGORITHM, file_checksum, get_hasher, update_from_file
+)
+from .pool import bounded_map
+
+PARTIAL_SIZE = 4096
+
+
+class DuplicateFinder:
+    """Finds duplicate files in stages so only colliding files are fully hashed
+
+    Files are first grouped by size, then by a hash of their first and last
+    `partial_size` bytes, and only the files that still collide are read in full.
+    Hard links of one inode are read once and only count as duplicates of
+    other inodes, never of each other.
+    """
+
+    def __init__(self,
+                 files: list,
+                 partial_size: int = PARTIAL_SIZE,
+                 algorithm: str = DEFAULT_ALGORITHM,
+                 workers: int = 1,
+                 executor: str = "thread",
+                 cache: object = None,
+                 scheduler: object = None) -> None:
+        """Creates a DuplicateFinder over already scanned files
+
+        Args:
+            files (list[File]): Files to search, in walk order
+            partial_size (int, optional): Bytes read from each end of a file. Defaults to PARTIAL_SIZE.
+            algorithm (str, optional): Hash algorithm from `hashing.ALGORITHMS`. Defaults to DEFAULT_ALGORITHM.
+            workers (int, optional): Number of files fully hashed at once. Defaults to 1.
+            executor (str, optional): "thread" or "process" pool for full hashing. Defaults to "thread".
+            cache (HashCache, optional): Persistent checksum cache to read and fill. Defaults to None.
+            scheduler (IOScheduler, optional): Orders and throttles the reads of both hashing stages.
+                Defaults to None.
+        """
+        self.files = files
+        self.partial_size = partial_size
+        self.algorithm = algorithm
+        self.workers = workers
+        self.executor = executor
+        self.cache = cache
+        self.scheduler = scheduler
+        self.bytes_read = 0
+        self.hashed: list[tuple[int, object]] = []
+        self._sizes = {}
+        self._partials = {}
+        self._digests = {}
+        self._inodes = {}
+
+    def group_by_size(self) -> list[list]:
+        """Groups files by size, dropping sizes that only appear once
+
+        `self.files` is iterated once, so it may build its `File` objects on the fly.
+
+        Returns:
+            list[list[tuple[int, File]]]: Groups of `(walk index, file)` sharing a size
+        """
+        sizes = {}
+        for index, file in enumerate(self.files):
+            sizes.setdefault(file.size, []).append((index, file))
+        return [group for group in sizes.values() if len(group) > 1]
+
+    def get_partial_checksum(self, file: object) -> str:
+        """Returns a hash of the head and tail of the file
+
+        Files small enough to be read whole get their full checksum stored on
+        `file.hash` so the last stage does not read them again.
+
+        Args:
+            file (File): The file to hash
+
+        Returns:
+            str: Hex digest of the sampled bytes
+        """
+        hasher = get_hasher(self.algorithm)
+        if self.scheduler is None:
+            a_file, throttle = open(file.path, "rb", buffering=0), None
+        else:
+            a_file = self.scheduler.open(file.path)
+            throttle = self.scheduler.throttle if self.scheduler.throttled else None
+        try:
+            if file.size <= 2 * self.partial_size:
+                self.bytes_read += update_from_file(hasher, a_file, throttle=throttle)
+                file.hash = hasher.hexdigest()
+                return file.hash
+            self.bytes_read += update_from_file(hasher, a_file, self.partial_size, throttle)
+            a_file.seek(-self.partial_size, os.SEEK_END)
+            self.bytes_read += update_from_file(hasher, a_file, self.partial_size, throttle)
+        finally:
+            if self.scheduler is None:
+                a_file.close()
+            else:
+                self.scheduler.close(a_file)
+        return hasher.hexdigest()
+
+    def get_checksum(self) -> Callable[[str], str]:
+        """Returns `path -> full checksum`, reading through the scheduler if there is one"""
+        if self.scheduler is None:
+            return functools.partial(file_checksum, algorithm=self.algorithm)
+        return self.scheduler.get_checksum(self.algorithm, self.executor)
+
+    def group_by_partial_checksum(self, size_groups: list[list]) -> list:
+        """Returns the files whose head/tail checksum collides within their size group
+
+        With a scheduler every sampled file is read in its order, not group by group.
+
+        Args:
+            size_groups (list[list[File]]): Files sharing a size, one inode each
+
+        Returns:
+            list[File]: The files that still need a full checksum
+        """
+        files = [file for group in size_groups for file in group]
+        if self.scheduler is not None:
+            files = self.scheduler.sort(files)
+        partials = {id(file): self.get_partial_checksum(file) for file in files}
+        candidates = []
+        for size_group in size_groups:
+            groups = {}
+            for file in size_group:
+                groups.setdefault(partials[id(file)], []).append(file)
+            for group in groups.values():
+                if len(group) > 1:
+                    candidates.extend(group)
+        return candidates
+
+    def hash_files(self, files: list) -> None:
+        """Stores the full checksum on every file that does not have one yet
+
+        Args:
+            files (list[File]): The files to hash
+        """
+        unhashed = [file for file in files if file.hash is None]
+        if self.scheduler is not None:
+            unhashed = self.scheduler.sort(unhashed)
+        for file, digest in bounded_map(self.get_checksum(), unhashed, self.workers, self.executor, key=_get_path):
+            file.hash = digest
+            self.bytes_read += file.size
+            if self.cache is not None:
+                self.cache.put(file, self.algorithm, digest)
+        if self.cache is not None:
+            self.cache.flush()
+
+    def get_cached_checksums(self, files: list) -> bool:
+        """Fills `file.hash` from the cache where the file is unchanged
+
+        Args:
+            files (list[File]): The files to look up
+
+        Returns:
+            bool: `True` if every file now has a checksum
+        """
+        known = True
+        for file in files:
+            if file.hash is None and self.cache is not None:
+                file.hash = self.cache.get(file, self.algorithm)
+            known = known and file.hash is not None
+        return known
+
+    def add(self, file: object) -> object:
+        """Feeds one file to the streaming finder
+
+        Unlike `find`, this works while the scan is still running: a file is
+        only read once another file of the same size has been added.
+
+        Args:
+            file (File): The next scanned file
+
+        Returns:
+            File: The earlier file with the same content, or `None`
+        """
+        key = get_inode_key(file)
+        first = self._sizes.setdefault(file.size, file)
+        if first is file:
+            return None
+        if first is not None:
+            if get_inode_key(first) == key:
+                return None
+            self._sizes[file.size] = None
+            self._add_partial(first)
+        if key in self._inodes:
+            return None
+        return self._add_partial(file)
+
+    def _add_partial(self, file: object) -> object:
+        """Second stage of `add`, groups a file by its head/tail checksum"""
+        self._inodes[get_inode_key(file)] = file
+        group = self._partials.setdefault((file.size, self.get_partial_checksum(file)), [])
+        group.append(file)
+        if len(group) == 1:
+            return None
+        if len(group) == 2:
+            self._add_digest(group[0])
+        return self._add_digest(file)
+
+    def _add_digest(self, file: object) -> object:
+        """Last stage of `add`, returns the first file seen with the same full checksum"""
+        if not self.get_cached_checksums([file]):
+            file.hash = self.get_checksum()(file.path)
+            self.bytes_read += file.size
+            if self.cache is not None:
+                self.cache.put(file, self.algorithm, file.hash)
+        first = self._digests.setdefault(file.hash, file)
+        return None if first is file else first
+
+    def find(self) -> dict[str, list]:
+        """Runs every stage and returns the duplicate groups
+
+        `hashed` is then `(walk index, file)` of every file that got a full
+        checksum, so callers keeping files in a `FileIndex` can store them.
+
+        Returns:
+            dict[str, list[File]]: checksum -> files, ordered like a full scan would be
+        """
+        order = {}
+        candidates = []
+        links = []
+        sampled = []
+        for indexed_group in self.group_by_size():
+            inodes = {}
+            for index, file in indexed_group:
+                order[id(file)] = index
+                first = inodes.setdefault(get_inode_key(file), file)
+                if first is not file:
+                    links.append((file, first))
+            size_group = list(inodes.values())
+            if len(size_group) < 2:
+                continue
+            if self.get_cached_checksums(size_group):
+                candidates.extend(size_group)
+                continue
+            sampled.append(size_group)
+        candidates.extend(self.group_by_partial_checksum(sampled))
+        self.hash_files(candidates)
+        hashed = {id(file) for file in candidates}
+        for file, first in links:
+            if id(first) in hashed:
+                file.hash = first.hash
+                candidates.append(file)
+
+        self.hashed = [(order[id(file)], file) for file in candidates]
+        groups = {}
+        for file in candidates:
+            groups.setdefault(file.hash, []).append(file)
+        duplicates = {}
+        for digest, group in groups.items():
+            if count_inodes(group) > 1:
+                duplicates[digest] = sorted(group, key=lambda file: order[id(file)])
+        return dict(sorted(duplicates.items(), key=lambda item: order[id(item[1][0])]))
+
+
+def get_inode_key(file: object) -> tuple[int, int]:
+    """Returns `(st_dev, st_ino)` of a File, or its path if it was not stat'ed"""
+    if file.inode is None:
+        return file.path
+    return file.dev, file.inode
+
+
+def count_inodes(files: list) -> int:
+    """Returns how many distinct inodes `files` use"""
+    return len({get_inode_key(file) for file in files})
+
+
+def _get_path(file: object) -> str:
+    """Returns the path of a File"""
+    return file.path
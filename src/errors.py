@@ -31,3 +31,52 @@ class InvalidSyntax(Exception):
 
     def __init__(self, *args: object) -> None:
         super().__init__(*args)
+
+
+class UnknownAlgorithm(Exception):
+    """Unknown hash algorithm"""
+
+    def __init__(self, *args: object) -> None:
+        super().__init__(*args)
+
+
+class UnknownExecutor(Exception):
+    """Unknown executor"""
+
+    def __init__(self, *args: object) -> None:
+        super().__init__(*args)
+
+
+class UnknownPolicy(Exception):
+    """Unknown walk policy"""
+
+    def __init__(self, *args: object) -> None:
+        super().__init__(*args)
+
+
+class UnknownJob(Exception):
+    """Unknown job"""
+
+    def __init__(self, *args: object) -> None:
+        super().__init__(*args)
+
+
+class JobCancelled(Exception):
+    """Job cancelled"""
+
+    def __init__(self, *args: object) -> None:
+        super().__init__(*args)
+
+
+class DaemonError(Exception):
+    """Index daemon error"""
+
+    def __init__(self, *args: object) -> None:
+        super().__init__(*args)
+
+
+class InvalidSnapshot(Exception):
+    """Invalid snapshot file"""
+
+    def __init__(self, *args: object) -> None:
+        super().__init__(*args)
@@ -0,0 +1,400 @@
+from __future__ import annotations
+
+import os
+import sys
+
+from rich.markup import escape
+from rich.table import Table
+
+from templates import folder_tree
+
+from . import bulk, dedup, listing, snapshot
+from .command import Command
+from .errors import InvalidOption, InvalidSnapshot
+from .file_manager import FileManager
+from .iosched import IOScheduler
+from .query import SORT_KEYS, parse_age, parse_size
+
+
+def get_manager(terminal: None, path: str = None) -> FileManager:
+    """Returns the scan of `path`, or of the current directory
+
+    Args:
+        terminal (Terminal): The terminal holding finished scans
+        path (str, optional): The scanned root. Defaults to the current directory.
+
+    Returns:
+        FileManager: The scan, or `None` if that root was not scanned yet
+    """
+    path = os.path.abspath(path or os.getcwd())
+    manager = terminal.file_managers.get(path)
+    if manager is None and _add_remote_roots(terminal):
+        manager = terminal.file_managers.get(path)
+    return manager
+
+
+def find_manager(terminal: None, path: str = None) -> FileManager:
+    """Returns the scan whose tree contains `path`, or the current directory
+
+    Args:
+        terminal (Terminal): The terminal holding finished scans
+        path (str, optional): Any path inside a scanned root. Defaults to the current directory.
+
+    Returns:
+        FileManager: The scan with the deepest matching root, or `None`
+    """
+    path = os.path.abspath(path or os.getcwd())
+    manager = _get_deepest(terminal.file_managers, path)
+    if manager is None and _add_remote_roots(terminal):
+        manager = _get_deepest(terminal.file_managers, path)
+    return manager
+
+
+def _get_deepest(managers: dict[str, FileManager], path: str) -> FileManager:
+    """Returns the manager of `path` or of its closest parent"""
+    while True:
+        manager = managers.get(path)
+        if manager is not None or os.path.dirname(path) == path:
+            return manager
+        path = os.path.dirname(path)
+
+
+def _add_remote_roots(terminal: None) -> bool:
+    """Adds the roots the index daemon scanned for other sessions, returns `True` if there were new ones"""
+    if terminal.client is None:
+        return False
+    from .daemon import RemoteManager
+
+    new = [root for root in terminal.client.get_roots() if root not in terminal.file_managers]
+    terminal.add_file_managers({root: RemoteManager(terminal.client, root) for root in new})
+    return bool(new)
+
+
+def _get_io_options(options: list[list[str], dict[str, str]]) -> dict:
+    """Returns the `IOScheduler` arguments of `--order`, `--max-rate`, `--max-iops` and `-k`, or `None`"""
+    values = options[1]
+    if not any(values.get(name) for name in ("--order", "--max-rate", "--max-iops")) and "-k" not in options[0]:
+        return None
+    return {
+        "order": values.get("--order") or "inode",
+        "bytes_per_second": parse_size(values["--max-rate"]) if values.get("--max-rate") else None,
+        "iops": float(values["--max-iops"]) if values.get("--max-iops") else None,
+        "fadvise": "-k" not in options[0],
+    }
+
+
+def _scan(terminal: None, options: list[list[str], dict[str, str]], params: list[str], job: object) -> None:
+    """Scans a directory in the background and keeps the result for other commands
+
+    Attached to the index daemon, a root it already scanned is reused unless `-r` is given.
+    `--order inode|extent|walk` sorts the reads, `--max-rate 50M` and `--max-iops 200`
+    cap them and `-k` keeps the read files in the page cache, see `iosched`.
+    """
+    path = os.path.abspath(params[0] if params else os.getcwd())
+    io = _get_io_options(options)
+    scheduler = IOScheduler(**io) if io is not None else None
+    if terminal.client is not None:
+        from .daemon import RemoteManager
+
+        manager = RemoteManager(terminal.client, path)
+        counts = manager.scan(
+            staged="-f" not in options[0],
+            algorithm=options[1].get("--algorithm") or "sha224",
+            workers=int(options[1].get("--workers") or 1),
+            compact="-c" in options[0],
+            force="-r" in options[0],
+            io=io,
+        )
+        terminal.add_file_managers({path: manager})
+        reused = "" if counts["scanned"] else " (already scanned by the daemon)"
+        terminal.console.print(
+            f"[{job.id}] {escape(path)}: {counts['files']:,} files in {counts['directories']:,} directories{reused}"
+        )
+        return
+    manager = FileManager(
+        path,
+        staged="-f" not in options[0],
+        algorithm=options[1].get("--algorithm") or "sha224",
+        workers=int(options[1].get("--workers") or 1),
+        cache=terminal.hash_cache,
+        compact="-c" in options[0],
+        progress=job.advance,
+        scheduler=scheduler,
+    )
+    terminal.add_file_managers({path: manager})
+    terminal.console.print(
+        f"[{job.id}] {escape(path)}: {len(manager.data[2]):,} files in {len(manager.data[1]):,} directories"
+    )
+
+
+def _watch(terminal: None, options: list[list[str], dict[str, str]], params: list[str]) -> None:
+    """Keeps a finished scan current as files change"""
+    manager = get_manager(terminal, params[0] if params else None)
+    if manager is None:
+        terminal.console.print("[red]Not scanned yet, run `scan` first")
+        return
+    watcher = manager.watch("poll" if "-p" in options[0] else "auto")
+    terminal.console.print(f"Watching {escape(manager.file_path)} ({watcher.backend})")
+    polled = getattr(watcher, "polled", None)
+    if polled:
+        terminal.console.print(f"[yellow]{len(polled):,} directories are polled instead, the inotify watch limit "
+                               "(fs.inotify.max_user_watches) was reached")
+
+
+def _unwatch(terminal: None, options: list[list[str], dict[str, str]], params: list[str]) -> None:
+    """Stops watching a scan"""
+    manager = get_manager(terminal, params[0] if params else None)
+    if manager is not None:
+        manager.unwatch()
+
+
+def _find(terminal: None, options: list[list[str], dict[str, str]], params: list[str]) -> None:
+    """Lists scanned files by extension, category, size, age or name glob"""
+    manager = get_manager(terminal, params[0] if params else None)
+    if manager is None:
+        terminal.console.print("[red]Not scanned yet, run `scan` first")
+        return
+    values = options[1]
+    criteria = {
+        "extension": values["--ext"].split(",") if values.get("--ext") else None,
+        "category": values.get("--category") or None,
+        "min_size": parse_size(values["--min-size"]) if values.get("--min-size") else None,
+        "max_size": parse_size(values["--max-size"]) if values.get("--max-size") else None,
+        "modified_after": parse_age(values["--newer"]) if values.get("--newer") else None,
+        "modified_before": parse_age(values["--older"]) if values.get("--older") else None,
+        "name": values.get("--name") or None,
+    }
+    try:
+        files = manager.query(**criteria)
+    except KeyError as error:
+        terminal.console.print(f"[red]Unknown category: {escape(str(error))}")
+        return
+    for file in files:
+        terminal.console.print(f"{file.size:>14,}  {escape(file.path)}", highlight=False)
+    terminal.console.print(f"{len(files):,} files")
+
+
+def _du(terminal: None, options: list[list[str], dict[str, str]], params: list[str]) -> None:
+    """Shows the size, file count and newest change below every subdirectory, largest first"""
+    path = os.path.abspath(params[0] if params else os.getcwd())
+    manager = find_manager(terminal, path)
+    directory = manager.get_usage(path) if manager is not None else None
+    if directory is None:
+        terminal.console.print("[red]Not scanned yet, run `scan` first")
+        return
+    table = Table()
+    for column in ("Size", "Files", "Newest", "Directory"):
+        table.add_column(column, justify="right" if column in ("Size", "Files") else "left")
+    for child in manager.get_usage_children(path) + [directory]:
+        newest = f"{child.get_last_modified_time():%Y-%m-%d %H:%M}" if child.mtime_ns else "-"
+        table.add_row(folder_tree.format_size(child.size), f"{child.files:,}", newest, escape(child.path))
+    terminal.console.print(table)
+
+
+def _tree(terminal: None, options: list[list[str], dict[str, str]], params: list[str]) -> None:
+    """Draws the directory tree with sizes, `--depth` levels deep"""
+    path = os.path.abspath(params[0] if params else os.getcwd())
+    manager = find_manager(terminal, path)
+    directory = manager.get_usage(path) if manager is not None else None
+    if directory is None:
+        terminal.console.print("[red]Not scanned yet, run `scan` first")
+        return
+    folder_tree.render(terminal.console, directory, manager.get_usage_children, int(options[1].get("--depth") or 2))
+
+
+def _dedup(terminal: None, options: list[list[str], dict[str, str]], params: list[str], job: object) -> None:
+    """Replaces duplicates with hard links or reflinks, only printing the plan unless `-y` is given"""
+    manager = get_manager(terminal, params[0] if params else None)
+    if manager is None:
+        terminal.console.print("[red]Not scanned yet, run `scan` first")
+        return
+    groups = manager.get_duplicate_groups()
+    steps = dedup.plan(groups)
+    reclaimable = folder_tree.format_size(dedup.get_reclaimable(groups))
+    if "-y" not in options[0]:
+        for step in steps:
+            terminal.console.print(f"{escape(step.duplicate)} -> {escape(step.original)}", highlight=False)
+        terminal.console.print(f"[{job.id}] {len(steps):,} files to replace, {reclaimable} reclaimable (dry run)")
+        return
+    job.total = len(steps)
+    report = dedup.apply(steps, options[1].get("--action") or "hardlink", progress=job.advance)
+    manager.rescan()
+    terminal.console.print(
+        f"[{job.id}] {report.replaced:,} replaced, {report.copied:,} copied, {report.skipped:,} skipped, "
+        f"{folder_tree.format_size(report.reclaimed)} reclaimed"
+    )
+
+
+def _run_bulk(terminal: None, operation: str, options: list[list[str], dict[str, str]], params: list[str],
+              job: object) -> None:
+    """Copies, moves or deletes the given paths, or with `-d` the duplicates in the scan of the first one
+
+    Duplicates are compared byte for byte with the file they duplicate first, and
+    deleting them only prints the plan unless `-y` is given, like `dedup`.
+    """
+    if "-d" in options[0]:
+        manager = find_manager(terminal, params[0] if params else None)
+        if manager is None:
+            terminal.console.print("[red]Not scanned yet, run `scan` first")
+            return
+        pairs = dedup.plan(manager.get_duplicate_groups())
+        job.total = len(pairs)
+        verified = []
+        for step in pairs:
+            job.advance()
+            try:
+                if dedup.verify(step.original, step.duplicate):
+                    verified.append(step)
+            except OSError:
+                pass
+        changed = len(pairs) - len(verified)
+        if changed:
+            terminal.console.print(f"[yellow]{changed:,} duplicates changed since the scan, skipped")
+        if operation == "delete" and "-y" not in options[0]:
+            for step in verified:
+                terminal.console.print(f"{escape(step.duplicate)} (same as {escape(step.original)})", highlight=False)
+            terminal.console.print(f"[{job.id}] {len(verified):,} duplicates to delete (dry run, -y to delete)")
+            return
+        sources = [step.duplicate for step in verified]
+        destination = params[1] if len(params) > 1 else None
+    elif operation == "delete":
+        sources, destination = params, None
+    else:
+        sources, destination = params[:-1], params[-1] if params else None
+    if not sources:
+        terminal.console.print(f"[red]Nothing to {operation}")
+        return
+    try:
+        steps = bulk.plan(operation, sources, destination)
+    except InvalidOption as error:
+        terminal.console.print(f"[red]{escape(str(error))}")
+        return
+    if "-n" in options[0]:
+        for step in steps:
+            line = step.source if step.target is None else f"{step.source} -> {step.target}"
+            terminal.console.print(escape(line), highlight=False)
+        terminal.console.print(f"[{job.id}] {len(steps):,} to {operation} (dry run)")
+        return
+    job.total = len(steps)
+    report = bulk.apply(operation, steps, int(options[1].get("--workers") or bulk.WORKERS), "-f" in options[0],
+                        job.advance)
+    for path, error in report.failed:
+        terminal.console.print(f"[red]{escape(path)}:[/] {escape(str(error))}", highlight=False)
+    touched = [step.source for step in steps] + [step.target for step in steps if step.target is not None]
+    for root, manager in terminal.file_managers.items():
+        if any(path == root or path.startswith(root.rstrip(os.sep) + os.sep) for path in touched):
+            manager.rescan()
+    terminal.console.print(f"[{job.id}] {report.done:,} done, {len(report.failed):,} failed, "
+                           f"{folder_tree.format_size(report.copied)} copied")
+
+
+def _cp(terminal: None, options: list[list[str], dict[str, str]], params: list[str], job: object) -> None:
+    """Copies files and directories into the last path, in the kernel where the filesystem allows"""
+    _run_bulk(terminal, "copy", options, params, job)
+
+
+def _mv(terminal: None, options: list[list[str], dict[str, str]], params: list[str], job: object) -> None:
+    """Moves files and directories into the last path, renaming unless it is on another filesystem"""
+    _run_bulk(terminal, "move", options, params, job)
+
+
+def _rm(terminal: None, options: list[list[str], dict[str, str]], params: list[str], job: object) -> None:
+    """Deletes files and directory trees across a pool of workers"""
+    _run_bulk(terminal, "delete", options, params, job)
+
+
+def _snapshot(terminal: None, options: list[list[str], dict[str, str]], params: list[str], job: object) -> None:
+    """Saves a scan to a snapshot file: `snapshot [ROOT] FILE`"""
+    if not params:
+        terminal.console.print("[red]Usage: snapshot [ROOT] FILE")
+        return
+    manager = get_manager(terminal, params[0] if len(params) > 1 else None)
+    if manager is None:
+        terminal.console.print("[red]Not scanned yet, run `scan` first")
+        return
+    manager.save_snapshot(params[-1])
+    terminal.console.print(f"[{job.id}] {escape(manager.file_path)} saved to {escape(params[-1])}")
+
+
+def _diff(terminal: None, options: list[list[str], dict[str, str]], params: list[str]) -> None:
+    """Lists what changed between two snapshots, or between a snapshot and the current scan of its root"""
+    if not params:
+        terminal.console.print("[red]Usage: diff OLD [NEW]")
+        return
+    try:
+        old = snapshot.Snapshot.open(params[0])
+    except (OSError, InvalidSnapshot) as error:
+        terminal.console.print(f"[red]{escape(params[0])}: {escape(str(error))}")
+        return
+    with old:
+        if len(params) > 1:
+            try:
+                new = snapshot.Snapshot.open(params[1])
+            except (OSError, InvalidSnapshot) as error:
+                terminal.console.print(f"[red]{escape(params[1])}: {escape(str(error))}")
+                return
+        else:
+            manager = get_manager(terminal, old.root)
+            if manager is None:
+                terminal.console.print(f"[red]{escape(old.root)} is not scanned, run `scan {escape(old.root)}` first")
+                return
+            new = snapshot.Snapshot(snapshot.build(manager.get_files(), manager.file_path, manager.algorithm))
+        with new:
+            try:
+                changes = snapshot.diff(old, new)
+            except InvalidSnapshot as error:
+                terminal.console.print(f"[red]{escape(str(error))}")
+                return
+    if "-s" not in options[0]:
+        styles = {"added": "[green]+", "removed": "[red]-", "modified": "[yellow]~", "moved": "[blue]>"}
+        for change in changes:
+            line = change.path if change.old_path is None else f"{change.old_path} -> {change.path}"
+            terminal.console.print(f"{styles[change.kind]}[/] {escape(line)}", highlight=False)
+    counts = {kind: 0 for kind in snapshot.CHANGE_KINDS}
+    for change in changes:
+        counts[change.kind] += 1
+    terminal.console.print(", ".join(f"{count:,} {kind}" for kind, count in counts.items()))
+
+
+def _ls(terminal: None, options: list[list[str], dict[str, str]], params: list[str]) -> None:
+    """Lists a directory a page at a time, sorted through the scan indexes when it was scanned"""
+    path = os.path.abspath(params[0] if params else os.getcwd())
+    key = options[1].get("--sort") or None
+    if key is not None and key not in SORT_KEYS:
+        terminal.console.print(f"[red]Unknown sort key: {key}, use one of {', '.join(SORT_KEYS)}")
+        return
+    reverse = "-r" in options[0]
+    manager = find_manager(terminal, path)
+    if manager is not None and manager.get_usage(path) is not None:
+        rows = listing.iter_scanned(manager, path, key, reverse, "-a" in options[0])
+    else:
+        rows = listing.iter_directory(path, key, reverse, "-a" in options[0])
+    shown = listing.Pager(terminal.console).show(rows, terminal.running and sys.stdin.isatty())
+    terminal.console.print(f"[dim]{shown:,} entries")
+
+
+def init(terminal: None) -> None:
+    """Initialize the file commands
+
+    Args:
+        terminal (Terminal): The `Terminal` object to add commands to
+    """
+    for command in (
+        Command("scan", terminal,
+                [["-f", "-c", "-r", "-k"], ["--algorithm", "--workers", "--order", "--max-rate", "--max-iops"]],
+                _scan, background=True),
+        Command("watch", terminal, [["-p"], []], _watch),
+        Command("unwatch", terminal, [[], []], _unwatch),
+        Command("dedup", terminal, [["-y"], ["--action"]], _dedup, background=True),
+        Command("cp", terminal, [["-n", "-f", "-d"], ["--workers"]], _cp, background=True),
+        Command("mv", terminal, [["-n", "-f", "-d"], ["--workers"]], _mv, background=True),
+        Command("rm", terminal, [["-n", "-d", "-y"], ["--workers"]], _rm, background=True),
+        Command("snapshot", terminal, [[], []], _snapshot, background=True),
+        Command("diff", terminal, [["-s"], []], _diff),
+        Command("ls", terminal, [["-a", "-r"], ["--sort"]], _ls),
+        Command("du", terminal, [[], []], _du),
+        Command("tree", terminal, [[], ["--depth"]], _tree),
+        Command("find", terminal,
+                [[], ["--ext", "--category", "--min-size", "--max-size", "--newer", "--older", "--name"]], _find),
+    ):
+        terminal.commands.append(command)
@@ -1,87 +1,631 @@
 import datetime
-import hashlib
+import functools
 import os
 import pathlib
+import time
+from collections.abc import Mapping
+from typing import Callable, Iterable, Iterator
+
+from . import snapshot
+from .cache import HashCache
+from .duplicates import DuplicateFinder, count_inodes
+from .hashing import DEFAULT_ALGORITHM, file_checksum
+from .index import FileIndex
+from .instrumentation import stats
+from .iosched import IOScheduler
+from .pool import bounded_map
+from .query import ChildIndex, QueryIndex
+from .usage import DiskUsage, get_link_key
+from .walker import walk
+from .watcher import TreeState, Watcher
 
 DEV_FILES = [".py", ".cpp", ".ini"]
 MUSIC_FILES = [".mp3"]
 VIDEO_FILES = [".mp4"]
+CATEGORIES = {"dev": DEV_FILES, "music": MUSIC_FILES, "video": VIDEO_FILES}
 
 
 class File:
-    """Class for manipulating files"""
+    """Class for manipulating files
+
+    Stat data captured by the scan is reused by the getters. It is trusted for
+    `stat_ttl` seconds (forever when `None`), `refresh()` reloads it on demand.
+    """
+
+    __slots__ = ("name", "path", "hash", "size", "inode", "mtime_ns", "ctime_ns", "stat_time", "dev", "nlink",
+                 "_info")
 
-    def __init__(self, name: str, path: str, hash: str) -> None:
+    stat_ttl: float = None
+
+    def __init__(self,
+                 name: str,
+                 path: str,
+                 hash: str = None,
+                 size: int = None,
+                 inode: int = None,
+                 mtime_ns: int = None,
+                 ctime_ns: int = None,
+                 stat_time: float = None,
+                 dev: int = None,
+                 nlink: int = None) -> None:
         self.name = name
         self.path = path
         self.hash = hash
-        self.extension = os.path.splitext(self.name)[-1]
-        self.info = pathlib.Path(self.path)
+        self.size = size
+        self.inode = inode
+        self.mtime_ns = mtime_ns
+        self.ctime_ns = ctime_ns
+        if stat_time is None and ctime_ns is not None:
+            stat_time = time.monotonic()
+        self.stat_time = stat_time
+        self.dev = dev
+        self.nlink = nlink
+        self._info = None
+
+    def refresh(self) -> None:
+        """Reloads size, inode and times from the filesystem"""
+        st = os.stat(self.path)
+        self.size = st.st_size
+        self.inode = st.st_ino
+        self.mtime_ns = st.st_mtime_ns
+        self.ctime_ns = st.st_ctime_ns
+        self.stat_time = time.monotonic()
+        self.dev = st.st_dev
+        self.nlink = st.st_nlink
+
+    def is_stale(self) -> bool:
+        """Returns `True` if the captured stat data is missing or older than `stat_ttl`"""
+        if self.stat_time is None:
+            return True
+        return self.stat_ttl is not None and time.monotonic() - self.stat_time > self.stat_ttl
+
+    @property
+    def extension(self) -> str:
+        """The file extension, including the dot"""
+        return os.path.splitext(self.name)[-1]
+
+    @property
+    def info(self) -> pathlib.Path:
+        """`pathlib.Path` of the file, created on first use"""
+        if self._info is None:
+            self._info = pathlib.Path(self.path)
+        return self._info
 
     def get_last_modified_time(self) -> datetime.datetime:
         """Returns last modified time as datetime.datetime object"""
-        return datetime.datetime.fromtimestamp(self.info.stat().st_mtime)
+        if self.is_stale():
+            self.refresh()
+        return datetime.datetime.fromtimestamp(self.mtime_ns / 1e9)
 
     def get_created_time(self) -> datetime.datetime:
         """Returns created time as datetime.datetime object"""
-        return datetime.datetime.fromtimestamp(self.info.stat().st_ctime)
+        if self.is_stale():
+            self.refresh()
+        return datetime.datetime.fromtimestamp(self.ctime_ns / 1e9)
+
 
+class Directory:
+    """A scanned directory with du-style totals of everything below it"""
 
-def get_checksum(file_name: str) -> str:
+    __slots__ = ("path", "size", "files", "mtime_ns")
+
+    def __init__(self, path: str, size: int = 0, files: int = 0, mtime_ns: int = 0) -> None:
+        self.path = path
+        self.size = size
+        self.files = files
+        self.mtime_ns = mtime_ns
+
+    @property
+    def name(self) -> str:
+        """The last path component"""
+        return os.path.basename(self.path) or self.path
+
+    def get_last_modified_time(self) -> datetime.datetime:
+        """Returns the newest mtime of the files below as datetime.datetime object"""
+        return datetime.datetime.fromtimestamp(self.mtime_ns / 1e9)
+
+
+def get_checksum(file_name: str, algorithm: str = DEFAULT_ALGORITHM) -> str:
     """Returns checksum of the file"""
-    sha_hash = hashlib.sha224()
-    a_file = open(file_name, "rb")
-    content = a_file.read()
-    sha_hash.update(content)
-    digest = sha_hash.hexdigest()
-    a_file.close()
-    return digest
+    if not stats.enabled:
+        return file_checksum(file_name, algorithm)
+    start = time.perf_counter()
+    try:
+        return file_checksum(file_name, algorithm)
+    finally:
+        stats.observe("hash file", time.perf_counter() - start)
+
+
+def scan_tree(startpath: str,
+              hash_files: bool = True,
+              algorithm: str = DEFAULT_ALGORITHM,
+              workers: int = 1,
+              executor: str = "thread",
+              cache: HashCache = None,
+              hidden: str = "skip_dirs",
+              symlinks: str = "files",
+              same_device: bool = False,
+              scheduler: IOScheduler = None) -> Iterator[tuple[str, str, File]]:
+    """Walks the filesystem, yielding entries while the walk is still running
+
+    With `workers > 1` the walk keeps producing files while a bounded pool
+    hashes them; entries still come out in walk order. Files whose stat tuple
+    matches an entry of `cache` are not read again, and hard links reuse the
+    checksum of the first path seen for their `(st_dev, st_ino)`. `hidden`,
+    `symlinks` and `same_device` are passed on to `walker.walk`. A `scheduler`
+    reads the files in its order and budget, see `iosched.IOScheduler.map`.
+
+    Yields:
+        tuple[str, str, File]: `(root, path, file)`, `file` is `None` for directories
+    """
+    links = {}
+
+    def scan() -> Iterator[tuple]:
+        counting = stats.enabled
+        for root, entry, st in walk(startpath, hidden, symlinks, same_device):
+            if st is None:
+                if counting:
+                    stats.count("directories visited")
+                yield root, entry.path, None, None
+                continue
+            if counting:
+                stats.count("files visited")
+            file = File(entry.name, entry.path, None, st.st_size, st.st_ino, st.st_mtime_ns, st.st_ctime_ns,
+                        dev=st.st_dev, nlink=st.st_nlink)
+            first = None
+            if hash_files and st.st_nlink > 1:
+                first = links.setdefault((st.st_dev, st.st_ino), file)
+                first = None if first is file else first
+            if cache is not None and hash_files and first is None:
+                file.hash = cache.get(file, algorithm)
+                stats.count("cache misses" if file.hash is None else "cache hits")
+            yield root, entry.path, file, first
+
+    if not hash_files:
+        for root, path, file, _ in scan():
+            yield root, path, file
+        return
+
+    def skip(entry: tuple) -> bool:
+        return entry[2] is None or entry[2].hash is not None or entry[3] is not None
+
+    if cache is not None:
+        cache.load(startpath, algorithm)
+    if scheduler is None:
+        checksum = functools.partial(get_checksum, algorithm=algorithm)
+        hashed = bounded_map(checksum, scan(), workers, executor, key=lambda entry: entry[1], skip=skip)
+    else:
+        hashed = scheduler.map(scheduler.get_checksum(algorithm, executor), scan(), workers, executor,
+                               key=lambda entry: entry[1], skip=skip, get_file=lambda entry: entry[2])
+    try:
+        for (root, path, file, first), hash in hashed:
+            if first is not None:
+                file.hash = first.hash
+            elif hash is not None:
+                file.hash = hash
+                stats.count("bytes hashed", file.size)
+                if cache is not None:
+                    cache.put(file, algorithm, hash)
+            yield root, path, file
+    finally:
+        if cache is not None:
+            cache.flush()
+
+
+class HashGroups(Mapping):
+    """`file_and_hash` of a staged scan, built by hashing every file when it is first read
+
+    Staged scans don't read files during the walk, but `data[0]` has always
+    mapped checksum -> `[(root, name)]` for every file. Code that still uses
+    it pays for hashing the whole tree then; everything else never does.
+    """
+
+    def __init__(self, load: Callable[[], dict]) -> None:
+        """Creates the mapping
+
+        Args:
+            load (Callable[[], dict]): Hashes the files and returns the groups, called once
+        """
+        self._load = load
+        self._groups: dict = None
+
+    def _get_groups(self) -> dict:
+        if self._groups is None:
+            self._groups = self._load()
+        return self._groups
+
+    def __getitem__(self, digest: str) -> list[tuple[str, str]]:
+        return self._get_groups()[digest]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._get_groups())
+
+    def __len__(self) -> int:
+        return len(self._get_groups())
+
 
+def parser(startpath: str,
+           hash_files: bool = True,
+           compact: bool = False,
+           progress: Callable[[str], None] = None,
+           usage: DiskUsage = None,
+           **options) -> tuple:
+    """Utility method to parse the filesystem
 
-def parser(startpath: str) -> tuple:
-    """Utility method to parse the filesystem"""
+    With `hash_files=False` no file is read, `file_and_hash` stays empty and
+    hashes are left for `DuplicateFinder` to compute on demand. With `compact`
+    `files_lst` is a `FileIndex` instead of a list. `progress` is called with
+    every scanned path, an exception it raises aborts the scan. `options` are
+    passed on to `scan_tree`. Every scanned entry is counted in `usage`.
+    """
     file_and_hash = {}
     dirs_list = []
-    files_lst = []
-
-    def parse(startpath1: str) -> tuple:
-        for root, dirs, files in os.walk(startpath1):
-            dir_content = []
-            for dir in dirs:
-                if dir[0] != ".":
-                    go_inside = os.path.join(startpath1, dir)
-                    dirs_list.append(go_inside)
-                    dir_content.append(parse(go_inside))
-            for f in files:
-                ffile = os.path.join(startpath1, f)
-                if os.path.isfile(ffile):
-                    hash = get_checksum(ffile)
-                    file = File(f, ffile, hash)
-                    files_lst.append(file)
-                    if file_and_hash.get(hash) is None:
-                        file_and_hash[hash] = [(root, f)]
-                    else:
-                        file_and_hash[hash].append((root, f))
-            return file_and_hash, dirs_list, files_lst
-
-    parsed_data = parse(startpath)
-    return parsed_data[0], parsed_data[1], parsed_data[2]
+    files_lst = FileIndex(File) if compact else []
+    start = time.perf_counter()
+    for root, path, file in scan_tree(startpath, hash_files, **options):
+        if progress is not None:
+            progress(path)
+        if file is None:
+            dirs_list.append(path)
+            if usage is not None:
+                usage.add_directory(path)
+            continue
+        files_lst.append(file)
+        if usage is not None:
+            usage.add_file(path, file.size, file.mtime_ns, get_link_key(file))
+        if not hash_files:
+            continue
+        if file_and_hash.get(file.hash) is None:
+            file_and_hash[file.hash] = [(root, file.name)]
+        else:
+            file_and_hash[file.hash].append((root, file.name))
+    stats.observe("scan", time.perf_counter() - start)
+    return file_and_hash, dirs_list, files_lst
 
 
 class FileManager:
     """filemanager class having APIs to manger filesystem"""
 
-    def __init__(self, file_path: str):
+    def __init__(self,
+                 file_path: str,
+                 staged: bool = True,
+                 algorithm: str = DEFAULT_ALGORITHM,
+                 workers: int = 1,
+                 executor: str = "thread",
+                 cache: HashCache = None,
+                 hidden: str = "skip_dirs",
+                 symlinks: str = "files",
+                 same_device: bool = False,
+                 lazy: bool = False,
+                 compact: bool = False,
+                 progress: Callable[[str], None] = None,
+                 scheduler: IOScheduler = None):
+        """Scans `file_path`
+
+        Args:
+            file_path (str): Root directory to scan
+            staged (bool, optional): Skip hashing during the scan and let `get_dupliacte` hash
+                only files whose size and head/tail collide. `data[0]` is then a `HashGroups`
+                that hashes every file on first use. Defaults to True.
+            algorithm (str, optional): Hash algorithm from `hashing.ALGORITHMS`. Defaults to DEFAULT_ALGORITHM.
+            workers (int, optional): Number of files hashed at once. Defaults to 1.
+            executor (str, optional): "thread" or "process" pool for hashing. Defaults to "thread".
+            cache (HashCache, optional): Persistent checksum cache reused across scans. Defaults to None.
+            hidden (str, optional): Hidden file policy, see `walker.walk`. Defaults to "skip_dirs".
+            symlinks (str, optional): Symlink policy, see `walker.walk`. Defaults to "files".
+            same_device (bool, optional): Stay on the filesystem of `file_path`. Defaults to False.
+            lazy (bool, optional): Don't scan until `data` is first used, the `iter_*` methods
+                stream straight from the walk until then. Defaults to False.
+            compact (bool, optional): Keep files in a columnar `FileIndex` and only build `File`
+                objects on access. Defaults to False.
+            progress (Callable[[str], None], optional): Called with every scanned path, see `parser`.
+                Defaults to None.
+            scheduler (IOScheduler, optional): Read order, bandwidth budgets and cache hints for
+                every file read, see `iosched`. Defaults to None.
+        """
         self.file_path = file_path
-        self.data = parser(self.file_path)
+        self.staged = staged
+        self.algorithm = algorithm
+        self.workers = workers
+        self.executor = executor
+        self.cache = cache
+        self.scheduler = scheduler
+        self.options = {
+            "algorithm": algorithm,
+            "workers": workers,
+            "executor": executor,
+            "cache": cache,
+            "hidden": hidden,
+            "symlinks": symlinks,
+            "same_device": same_device,
+            "scheduler": scheduler,
+        }
+        self.compact = compact
+        self.progress = progress
+        self.watcher: Watcher = None
+        self._data = None
+        self._query: QueryIndex = None
+        self._query_source = None
+        self._children: ChildIndex = None
+        self._children_source = None
+        self._usage: DiskUsage = None
+        self._generation = 0
+        if not lazy:
+            self._scan()
+
+    @property
+    def data(self) -> tuple:
+        """The scan result `(file_and_hash, dirs_list, files_lst)`, scanned on first use"""
+        if self.watcher is not None:
+            state = self.watcher.state
+            with state.lock:
+                files = list(state.files.values())
+                if self.staged:
+                    return HashGroups(functools.partial(self._hash_all, files)), list(state.directories), files
+                file_and_hash = {}
+                for digest, group in state.digests.items():
+                    file_and_hash[digest] = [(os.path.dirname(path), file.name) for path, file in group.items()]
+                return file_and_hash, list(state.directories), files
+        if self._data is None:
+            self._scan()
+        return self._data
+
+    def _scan(self) -> None:
+        """Walks the tree once, filling `_data` and `_usage`"""
+        self._usage = DiskUsage(self.file_path)
+        self._data = parser(self.file_path, not self.staged, self.compact, self.progress, self._usage,
+                            **self.options)
+        if self.staged:
+            self._data = (HashGroups(functools.partial(self._hash_all, self._data[2])), *self._data[1:])
+        self._generation += 1
+
+    def _store_hashes(self, hashed: Iterable[tuple[int, File]]) -> None:
+        """Keeps checksums of `(walk index, file)` pairs in a compact scan, whose `File`s are built on access"""
+        index = self._data[2] if self._data is not None and self.watcher is None else None
+        if not isinstance(index, FileIndex):
+            return
+        for position, file in hashed:
+            if file.hash is not None and index.digests[position] is None:
+                index.set_hash(position, file.hash)
+
+    def _hash_all(self, files: list) -> dict:
+        """Hashes every file not hashed yet and groups them like `parser` does, for `HashGroups`"""
+        finder = DuplicateFinder(files, algorithm=self.algorithm, workers=self.workers, executor=self.executor,
+                                 cache=self.cache, scheduler=self.scheduler)
+        if self.cache is not None:
+            self.cache.load(self.file_path, self.algorithm)
+        files = list(files)
+        finder.hash_files(files)
+        stats.count("bytes hashed", finder.bytes_read)
+        self._store_hashes(enumerate(files))
+        file_and_hash = {}
+        for file in files:
+            file_and_hash.setdefault(file.hash, []).append((os.path.dirname(file.path), file.name))
+        return file_and_hash
+
+    @property
+    def version(self) -> tuple:
+        """Changes whenever the scan result may have changed, scanning first if it was dropped
+
+        Results computed from this scan can be cached under it, like the
+        index daemon does.
+        """
+        if self.watcher is not None:
+            return self._generation, self.watcher.state.version
+        if self._data is None:
+            self._scan()
+        return self._generation, None
+
+    def rescan(self) -> None:
+        """Drops the scan result so the next use of `data` walks the tree again"""
+        if self.watcher is None:
+            self._data = None
+            self._usage = None
+
+    def watch(self, backend: str = "auto", interval: float = 1.0) -> Watcher:
+        """Keeps this scan current as the tree changes, until `unwatch`
+
+        The scan result is moved into a `TreeState` that is updated per event,
+        so `get_files`, `get_directories` and `get_dupliacte` reflect changes
+        without rescanning.
+
+        Args:
+            backend (str, optional): "inotify", "poll" or "auto". Defaults to "auto".
+            interval (float, optional): Seconds between polls. Defaults to 1.0.
+
+        Returns:
+            Watcher: The running watcher
+        """
+        if self.watcher is None:
+            state = TreeState(self.file_path, self.data[2], self.data[1], File, self.algorithm,
+                              self.options["hidden"], self.options["symlinks"], not self.staged)
+            self.watcher = Watcher(state, backend, interval)
+            self._data = None
+            self._usage = None
+            self._generation += 1
+        return self.watcher
+
+    def unwatch(self) -> None:
+        """Stops watching, keeping the current state as the scan result"""
+        if self.watcher is not None:
+            self.watcher.stop()
+            data = self.data
+            usage = self.watcher.state.usage
+            self.watcher = None
+            self._data = data
+            self._usage = usage
+            self._generation += 1
+
+    def iter_files(self) -> Iterator[File]:
+        """Yields files one by one without building a list"""
+        if self.watcher is not None:
+            yield from self.data[2]
+            return
+        if self._data is not None:
+            yield from self._data[2]
+            return
+        for _, _, file in scan_tree(self.file_path, not self.staged, **self.options):
+            if file is not None:
+                yield file
+
+    def iter_directories(self) -> Iterator[str]:
+        """Yields directory paths one by one without building a list"""
+        if self.watcher is not None:
+            yield from self.data[1]
+            return
+        if self._data is not None:
+            yield from self._data[1]
+            return
+        for _, path, file in scan_tree(self.file_path, False, **self.options):
+            if file is None:
+                yield path
+
+    def iter_duplicates(self) -> Iterator[tuple[File, File]]:
+        """Yields `(original, duplicate)` as soon as a file is found to match an earlier one
+
+        Only the first file of every size is kept until a second one shows up,
+        so memory grows with the number of distinct sizes, not with the tree.
+        """
+        finder = DuplicateFinder([], algorithm=self.algorithm, cache=self.cache, scheduler=self.scheduler)
+        if self.cache is not None:
+            self.cache.load(self.file_path, self.algorithm)
+        try:
+            for file in self.iter_files():
+                original = finder.add(file)
+                if original is not None:
+                    yield original, file
+        finally:
+            if self.cache is not None:
+                self.cache.flush()
+
+    def query(self, **criteria) -> list[File]:
+        """Returns the files matching `criteria`, in walk order
+
+        Indexes are built on the first query and kept until the scan changes,
+        when watching they are rebuilt after the tree changed.
+
+        Args:
+            **criteria: Keyword arguments of `QueryIndex.query`, e.g. `extension=".py"`,
+                `category="video"`, `min_size=1 << 20`, `modified_after=timestamp`, `name="*.txt"`
+
+        Returns:
+            list[File]: The matching files
+        """
+        return self._get_query_index().query(**criteria)
+
+    def iter_sorted(self,
+                    key: str = "name",
+                    reverse: bool = False,
+                    directory: str = None,
+                    hidden: bool = True) -> Iterator[File]:
+        """Yields files by name, size or mtime
+
+        The whole scan comes straight from the query indexes, see `QueryIndex.iter_sorted`.
+        A single directory only sorts its own files, from the watched tree or a `ChildIndex`,
+        so listing it does not build the query indexes.
+
+        Args:
+            key (str, optional): One of `query.SORT_KEYS`. Defaults to "name".
+            reverse (bool, optional): Largest, newest or last name first. Defaults to False.
+            directory (str, optional): Only yield the files directly inside it. Defaults to None.
+            hidden (bool, optional): Include names starting with a dot. Defaults to True.
+        """
+        if directory is None:
+            files = self._get_query_index().iter_sorted(key, reverse)
+            return files if hidden else (file for file in files if not file.name.startswith("."))
+        if self.watcher is None:
+            return self._get_child_index().iter_sorted(directory, key, reverse, hidden)
+        directory = directory.rstrip(os.sep) or os.sep
+        state = self.watcher.state
+        with state.lock:
+            files = [state.files[path] for path in state.children.get(directory, ()) if path in state.files]
+        if not hidden:
+            files = [file for file in files if not file.name.startswith(".")]
+        attribute = {"name": "name", "size": "size", "mtime": "mtime_ns"}[key]
+        return iter(sorted(files, key=lambda file: getattr(file, attribute) or 0, reverse=reverse))
+
+    def _get_child_index(self) -> ChildIndex:
+        """Returns the files grouped by directory, grouping them again if the scan changed"""
+        source = self.data
+        if self._children is None or self._children_source is not source:
+            self._children = ChildIndex(source[2])
+            self._children_source = source
+        return self._children
+
+    def _get_query_index(self) -> QueryIndex:
+        """Returns the query indexes, building them if the scan changed since last time"""
+        if self.watcher is not None:
+            source = (id(self.watcher), self.watcher.state.version)
+            stale = self._query_source != source
+        else:
+            source = self.data
+            stale = self._query_source is not source
+        if self._query is None or stale:
+            self._query = QueryIndex(self.data[2], CATEGORIES)
+            self._query_source = source
+        return self._query
+
+    def get_usage(self, path: str = None) -> Directory:
+        """Returns `path`, or the scanned root, with the totals of everything below it
+
+        Args:
+            path (str, optional): A directory inside the scan. Defaults to the scanned root.
+
+        Returns:
+            Directory: The directory, or `None` if `path` is not part of the scan
+        """
+        path = path or self.file_path
+        if self.watcher is not None:
+            with self.watcher.state.lock:
+                totals = self.watcher.state.usage.get(path)
+        else:
+            if self._data is None:
+                self._scan()
+            totals = self._usage.get(path)
+        return None if totals is None else Directory(path.rstrip(os.sep) or os.sep, *totals)
+
+    def get_usage_children(self, path: str = None) -> list[Directory]:
+        """Returns the subdirectories of `path`, or of the scanned root, largest first"""
+        path = path or self.file_path
+        if self.watcher is not None:
+            with self.watcher.state.lock:
+                subdirs = self.watcher.state.usage.get_subdirectories(path)
+        else:
+            if self._data is None:
+                self._scan()
+            subdirs = self._usage.get_subdirectories(path)
+        children = [self.get_usage(subdir) for subdir in subdirs]
+        return sorted((child for child in children if child is not None), key=lambda child: -child.size)
+
+    def get_duplicate_groups(self) -> list[list[File]]:
+        """Returns every group of files with the same content stored on two or more inodes
+
+        Hard links of a single inode use no extra space, so they are not
+        duplicates of each other.
+        """
+        if self.watcher is not None:
+            return self.watcher.state.get_duplicates()
+        if self.staged:
+            finder = DuplicateFinder(self.data[2], algorithm=self.algorithm, workers=self.workers,
+                                     executor=self.executor, cache=self.cache, scheduler=self.scheduler)
+            if self.cache is not None:
+                self.cache.load(self.file_path, self.algorithm)
+            with stats.timer("find duplicates"):
+                groups = list(finder.find().values())
+            stats.count("bytes hashed", finder.bytes_read)
+            self._store_hashes(finder.hashed)
+            return groups
+        groups = {}
+        for file in self.data[2]:
+            groups.setdefault(file.hash, []).append(file)
+        return [group for group in groups.values() if count_inodes(group) > 1]
 
     def get_dupliacte(self) -> dict:
         """Returs a list of list having duplicate files"""
         ans = []
         files = {}
-        for i in self.data[0].values():
-            if len(i) > 1:
-                ans.append(i)
+        for group in self.get_duplicate_groups():
+            ans.append([(os.path.dirname(file.path), file.name) for file in group])
         for i in ans:
             for j in i:
                 if files.get(j[1]) is None:
@@ -90,16 +634,17 @@ class FileManager:
                     files[j[1]].append(j[0])
         return files
 
+    def save_snapshot(self, path: str) -> None:
+        """Writes the scanned files to a snapshot file, see `snapshot.build`"""
+        snapshot.write(path, self.data[2], self.file_path, self.algorithm)
+
     def get_directories(self) -> list:
         """Returns list of directories present inside the directory you fired this command from"""
         return self.data[1]
 
     def get_files(self) -> list:
         """Returns files present in the directory you fired this command from"""
-        files = []
-        for i in self.data[2]:
-            files.append(i)
-        return files
+        return list(self.data[2])
 
 
 if __name__ == "__main__":
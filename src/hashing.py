@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import hashlib
+import threading
+import zlib
+from typing import Callable
+
+from .errors import UnknownAlgorithm
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+BUFFER_SIZE = 256 * 1024
+DEFAULT_ALGORITHM = "sha224"
+
+ALGORITHMS: dict[str, Callable[[], object]] = {}
+
+_local = threading.local()
+
+
+class CRC32:
+    """hashlib-like wrapper around `zlib.crc32`"""
+
+    name = "crc32"
+    digest_size = 4
+
+    def __init__(self) -> None:
+        self.value = 0
+
+    def update(self, data: bytes) -> None:
+        """Feeds `data` into the checksum"""
+        self.value = zlib.crc32(data, self.value)
+
+    def digest(self) -> bytes:
+        """Returns the checksum as bytes"""
+        return self.value.to_bytes(4, "big")
+
+    def hexdigest(self) -> str:
+        """Returns the checksum as a hex str"""
+        return f"{self.value:08x}"
+
+
+def register_algorithm(name: str, factory: Callable[[], object]) -> None:
+    """Makes a hash algorithm available to `get_hasher`
+
+    Args:
+        name (str): Name used to select the algorithm
+        factory (Callable[[], object]): Returns a new object with `update` and `hexdigest`
+    """
+    ALGORITHMS[name] = factory
+
+
+def get_hasher(algorithm: str = DEFAULT_ALGORITHM) -> object:
+    """Returns a new hash object for `algorithm`
+
+    Args:
+        algorithm (str, optional): A registered algorithm name. Defaults to DEFAULT_ALGORITHM.
+
+    Raises:
+        UnknownAlgorithm: If the algorithm is not registered
+
+    Returns:
+        object: The hash object
+    """
+    try:
+        return ALGORITHMS[algorithm]()
+    except KeyError:
+        raise UnknownAlgorithm(f"Unknown hash algorithm: {algorithm}")
+
+
+def _get_buffer() -> bytearray:
+    """Returns this thread's reusable read buffer"""
+    buffer = getattr(_local, "buffer", None)
+    if buffer is None:
+        buffer = _local.buffer = bytearray(BUFFER_SIZE)
+    return buffer
+
+
+def update_from_file(hasher: object, a_file: object, limit: int = None,
+                     throttle: Callable[[int], None] = None) -> int:
+    """Feeds a binary file into `hasher` through a reused buffer
+
+    Args:
+        hasher (object): The hash object to update
+        a_file (object): File opened in binary mode
+        limit (int, optional): Stop after this many bytes. Defaults to None (until EOF).
+        throttle (Callable[[int], None], optional): Called with the size of every read that
+            returned data, e.g. `IOScheduler.throttle`. Defaults to None.
+
+    Returns:
+        int: Number of bytes read
+    """
+    buffer = _get_buffer()
+    view = memoryview(buffer)
+    total = 0
+    while limit is None or total < limit:
+        if limit is not None and limit - total < len(buffer):
+            size = a_file.readinto(view[:limit - total])
+        else:
+            size = a_file.readinto(buffer)
+        if not size:
+            break
+        if throttle is not None:
+            throttle(size)
+        hasher.update(view[:size])
+        total += size
+    return total
+
+
+def file_checksum(file_name: str, algorithm: str = DEFAULT_ALGORITHM) -> str:
+    """Returns the checksum of a file without loading it into memory
+
+    Args:
+        file_name (str): Path of the file
+        algorithm (str, optional): A registered algorithm name. Defaults to DEFAULT_ALGORITHM.
+
+    Returns:
+        str: Hex digest of the file
+    """
+    hasher = get_hasher(algorithm)
+    with open(file_name, "rb", buffering=0) as a_file:
+        update_from_file(hasher, a_file)
+    return hasher.hexdigest()
+
+
+register_algorithm("sha224", hashlib.sha224)
+register_algorithm("sha256", hashlib.sha256)
+register_algorithm("blake2b", hashlib.blake2b)
+register_algorithm("crc32", CRC32)
+if xxhash is not None:
+    register_algorithm("xxh64", xxhash.xxh64)
+    register_algorithm("xxh3_64", xxhash.xxh3_64)
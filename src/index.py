@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import os
+import time
+from array import array
+from typing import Iterator
+
+
+class FileIndex:
+    """Columnar store of scanned files
+
+    Directory prefixes are stored once, sizes, inodes, link counts and times live in
+    `array` columns and digests are kept as raw bytes. `File` objects are only
+    created when an entry is accessed, with stat data as old as the index.
+    """
+
+    def __init__(self, file_type: type) -> None:
+        """Creates an empty index
+
+        Args:
+            file_type (type): Class used to build records on access, normally `File`
+        """
+        self.file_type = file_type
+        self.roots: list[str] = []
+        self.root_ids: dict[str, int] = {}
+        self.names: list[str] = []
+        self.parents = array("I")
+        self.sizes = array("q")
+        self.inodes = array("Q")
+        self.mtimes = array("q")
+        self.ctimes = array("q")
+        self.devs = array("Q")
+        self.nlinks = array("I")
+        self.digests: list[bytes] = []
+        self.stat_time = time.monotonic()
+
+    def append(self, file: object) -> None:
+        """Adds a scanned file to the index
+
+        Args:
+            file (File): The file, its `path` must be `os.path.join(root, name)`
+        """
+        root = os.path.dirname(file.path)
+        root_id = self.root_ids.get(root)
+        if root_id is None:
+            root_id = self.root_ids[root] = len(self.roots)
+            self.roots.append(root)
+        self.names.append(file.name)
+        self.parents.append(root_id)
+        self.sizes.append(file.size or 0)
+        self.inodes.append(file.inode or 0)
+        self.mtimes.append(file.mtime_ns or 0)
+        self.ctimes.append(file.ctime_ns or 0)
+        self.devs.append(file.dev or 0)
+        self.nlinks.append(file.nlink or 0)
+        self.digests.append(None if file.hash is None else bytes.fromhex(file.hash))
+
+    def get_path(self, index: int) -> str:
+        """Returns the path of the file at `index`"""
+        return os.path.join(self.roots[self.parents[index]], self.names[index])
+
+    def get_hash(self, index: int) -> str:
+        """Returns the hex digest of the file at `index`, or `None` if not hashed"""
+        digest = self.digests[index]
+        return None if digest is None else digest.hex()
+
+    def set_hash(self, index: int, digest: str) -> None:
+        """Stores the hex digest of the file at `index`"""
+        self.digests[index] = bytes.fromhex(digest)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __getitem__(self, index: int) -> object:
+        if index < 0:
+            index += len(self)
+        return self.file_type(self.names[index], self.get_path(index), self.get_hash(index),
+                              self.sizes[index], self.inodes[index], self.mtimes[index], self.ctimes[index],
+                              self.stat_time, self.devs[index], self.nlinks[index] or None)
+
+    def __iter__(self) -> Iterator:
+        for index in range(len(self)):
+            yield self[index]
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+from functools import lru_cache
+from shlex import split
+from typing import NamedTuple
+
+from .command import Command
+from .errors import InvalidOption, InvalidSyntax, UnknownCommand
+
+CACHE_SIZE = 512
+_QUOTING = ("'", '"', "\\")
+
+
+class ParsedInput(NamedTuple):
+    """A parsed input line
+
+    Indexes 0-2 are the `(command names, options, params)` tuple `Terminal`
+    always used, `command` is the already resolved `Command`.
+    """
+
+    names: tuple[str, ...]
+    options: dict[str, str]
+    params: tuple[str, ...]
+    command: Command
+
+
+def tokenize(input: str) -> list[str]:
+    """Splits an input line into words, only falling back to `shlex` for quoted input
+
+    Args:
+        input (str): The plain str input
+
+    Raises:
+        InvalidSyntax: If the quoting is unbalanced
+
+    Returns:
+        list[str]: The words
+    """
+    if not any(char in input for char in _QUOTING):
+        return input.split()
+    try:
+        return split(input)
+    except ValueError:
+        raise InvalidSyntax(f"Invalid syntax: {input}")
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse(input: str) -> ParsedInput:
+    """Parses an input line in one pass, resolving the command on the way
+
+    Results are cached, so repeated lines skip tokenizing and lookups.
+
+    Args:
+        input (str): The plain str input
+
+    Raises:
+        InvalidSyntax: If the input is empty or the quoting is unbalanced
+        UnknownCommand: If the first word is not a top-level command
+        InvalidOption: If an option follows a parameter
+
+    Returns:
+        ParsedInput: The parsed line
+    """
+    words = tokenize(input)
+    if not words:
+        raise InvalidSyntax(f"Invalid syntax: {input}")
+    command = Command.get_command(words[0])
+    if command is None or command.parent is not None:
+        raise UnknownCommand(f"Unknown Command: {words[0]}")
+
+    position = 1
+    names = [words[0]]
+    while position < len(words):
+        subcommand = command._children.get(words[position])
+        if subcommand is None:
+            break
+        command = subcommand
+        names.append(words[position])
+        position += 1
+
+    options = {}
+    params = []
+    while position < len(words):
+        word = words[position]
+        position += 1
+        if word.startswith("-"):
+            if params:
+                raise InvalidOption(
+                    f"Parameter before option: '[red bold]{word}[/]' in '[red bold]{input}[/]'"
+                )
+            if word.startswith("--"):
+                if position < len(words):
+                    options[word] = words[position]
+                    position += 1
+                else:
+                    options[word] = ""
+            elif len(word) > 2:
+                options[word[0:2]] = ""
+                params.append(word[2:])
+            else:
+                options[word] = ""
+        else:
+            params.append(word)
+
+    return ParsedInput(tuple(names), options, tuple(params), command)
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import contextlib
+import threading
+import time
+from typing import TYPE_CHECKING, Iterator
+
+if TYPE_CHECKING:
+    from rich.table import Table
+
+BUCKETS = 32
+
+
+class Histogram:
+    """Latency histogram with power of two microsecond buckets"""
+
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * BUCKETS
+
+    def add(self, seconds: float) -> None:
+        """Records one duration"""
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.buckets[min(int(seconds * 1e6).bit_length(), BUCKETS - 1)] += 1
+
+    def percentile(self, fraction: float) -> float:
+        """Returns the upper bound, in seconds, of the bucket holding the `fraction` quantile"""
+        wanted = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if seen >= wanted and count:
+                return min((1 << bucket) / 1e6, self.max)
+        return self.max
+
+
+class Stats:
+    """Counters and latency histograms for the hot paths
+
+    Disabled by default. Every method returns at once while disabled and
+    per-file loops check `enabled` once up front, so collection costs close
+    to nothing until `stats -e` or `launcher.py --stats` turns it on.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.counters: dict[str, int] = {}
+        self.histograms: dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def count(self, name: str, amount: int = 1) -> None:
+        """Adds `amount` to a counter"""
+        if self.enabled:
+            with self._lock:
+                self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name: str, seconds: float) -> None:
+        """Records a duration in a histogram"""
+        if self.enabled:
+            with self._lock:
+                histogram = self.histograms.get(name)
+                if histogram is None:
+                    histogram = self.histograms[name] = Histogram()
+                histogram.add(seconds)
+
+    @contextlib.contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """Records how long the `with` block took, exceptions included"""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def reset(self) -> None:
+        """Drops every counter and histogram"""
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def render(self) -> Table:
+        """Returns counters and histograms as a table"""
+        from rich.table import Table
+
+        table = Table(title="Stats" if self.enabled else "Stats (disabled)")
+        for column in ("Name", "Count", "Total ms", "Mean ms", "p50 ms", "p99 ms", "Max ms"):
+            table.add_column(column, justify="left" if column == "Name" else "right")
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                table.add_row(name, f"{value:,}", "", "", "", "", "")
+            for name, histogram in sorted(self.histograms.items()):
+                table.add_row(name, f"{histogram.count:,}", f"{histogram.total * 1000:.2f}",
+                              f"{histogram.total / histogram.count * 1000:.3f}",
+                              f"{histogram.percentile(0.5) * 1000:.3f}", f"{histogram.percentile(0.99) * 1000:.3f}",
+                              f"{histogram.max * 1000:.3f}")
+        return table
+
+
+stats = Stats()
+
+
+def _stats(terminal: None, options: list[list[str], dict[str, str]], params: list[str]) -> None:
+    """Shows counters and timings, `-e`/`-d` enable or disable collection, `-r` resets"""
+    if "-e" in options[0]:
+        stats.enabled = True
+    if "-d" in options[0]:
+        stats.enabled = False
+    if "-r" in options[0]:
+        stats.reset()
+    terminal.console.print(stats.render())
+
+
+def init(terminal: None) -> None:
+    """Initialize the stats command
+
+    Args:
+        terminal (Terminal): The `Terminal` object to add commands to
+    """
+    from .command import Command
+
+    terminal.commands.append(Command("stats", terminal, [["-e", "-d", "-r"], []], _stats))
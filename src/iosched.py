@@ -0,0 +1,300 @@
+"""Read ordering, bandwidth budgets and page cache hints for hashing
+
+A scan reads files in walk order, which on a spinning disk or a network
+filesystem means a seek between almost every file. `IOScheduler` reorders
+the pending reads by where the data sits, `(st_dev, st_ino)` or the first
+physical extent from the `FIEMAP` ioctl, and caps bytes and reads per second
+with token buckets so a background scan leaves the disk usable. Files are
+read with `POSIX_FADV_SEQUENTIAL` and dropped from the page cache with
+`POSIX_FADV_DONTNEED` once hashed, so a scan does not push out the cache of
+everything else. Note that `DONTNEED` also drops pages other programs had cached.
+"""
+from __future__ import annotations
+
+import functools
+import os
+import struct
+import threading
+import time
+from itertools import islice
+from typing import Callable, Iterable, Iterator
+
+from .errors import InvalidOption, UnknownPolicy
+from .hashing import DEFAULT_ALGORITHM, get_hasher, update_from_file
+from .instrumentation import stats
+from .pool import bounded_map
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+ORDERS = ["walk", "inode", "extent"]
+# _IOWR('f', 11, struct fiemap)
+FS_IOC_FIEMAP = 0xC020660B
+# fm_start, fm_length, fm_flags, fm_mapped_extents, fm_extent_count, fm_reserved
+FIEMAP = struct.Struct("=QQIIII")
+# fe_logical, fe_physical, fe_length, fe_reserved64[2], fe_flags, fe_reserved[3]
+FIEMAP_EXTENT = struct.Struct("=QQQ2QI3I")
+# Files sorted together by default, enough to cut seeks without holding a whole walk in memory
+WINDOW = 4096
+
+
+class TokenBucket:
+    """Allows `rate` units per second on average and bursts of up to `burst`
+
+    Taking more than is available puts the bucket in debt and sleeps until
+    it is paid back, so callers sharing a bucket across threads together
+    stay at `rate`.
+    """
+
+    def __init__(self, rate: float, burst: float = None) -> None:
+        """Creates a full bucket
+
+        Args:
+            rate (float): Units added per second
+            burst (float, optional): Capacity of the bucket. Defaults to one second of `rate`.
+
+        Raises:
+            InvalidOption: If `rate` is not positive
+        """
+        if rate <= 0:
+            raise InvalidOption(f"Rate must be positive: {rate}")
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self, amount: float = 1) -> float:
+        """Takes `amount` units, sleeping while the bucket is in debt
+
+        Returns:
+            float: Seconds slept
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+def get_physical_offset(path: str) -> int:
+    """Returns where the first extent of a file starts on its device, or `None` if unknown
+
+    Not every filesystem supports `FIEMAP` (tmpfs, overlayfs, network mounts),
+    and small files may be stored inline without an extent of their own.
+    """
+    if fcntl is None:
+        return None
+    buffer = bytearray(FIEMAP.size + FIEMAP_EXTENT.size)
+    FIEMAP.pack_into(buffer, 0, 0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0)
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return None
+    try:
+        fcntl.ioctl(fd, FS_IOC_FIEMAP, buffer, True)
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+    if not FIEMAP.unpack_from(buffer)[3]:
+        return None
+    return FIEMAP_EXTENT.unpack_from(buffer, FIEMAP.size)[1]
+
+
+def read_checksum(path: str,
+                  algorithm: str = DEFAULT_ALGORITHM,
+                  fadvise: bool = True,
+                  throttle: Callable[[int], None] = None) -> str:
+    """Returns the checksum of a file like `hashing.file_checksum`, with cache hints and a throttle
+
+    Args:
+        path (str): Path of the file
+        algorithm (str, optional): A registered algorithm name. Defaults to DEFAULT_ALGORITHM.
+        fadvise (bool, optional): Read ahead sequentially and drop the pages afterwards. Defaults to True.
+        throttle (Callable[[int], None], optional): Called with the size of every read. Defaults to None.
+
+    Returns:
+        str: Hex digest of the file
+    """
+    hasher = get_hasher(algorithm)
+    with open(path, "rb", buffering=0) as a_file:
+        advise(a_file, "POSIX_FADV_SEQUENTIAL" if fadvise else None)
+        try:
+            update_from_file(hasher, a_file, throttle=throttle)
+        finally:
+            advise(a_file, "POSIX_FADV_DONTNEED" if fadvise else None)
+    return hasher.hexdigest()
+
+
+def advise(a_file: object, advice: str) -> None:
+    """Passes the `os` constant named `advice` for the whole file to `posix_fadvise`
+
+    Nothing happens on platforms without it, and failures are ignored: a hint
+    is never worth failing a read for.
+    """
+    if advice is None or not hasattr(os, advice):
+        return
+    try:
+        os.posix_fadvise(a_file.fileno(), 0, 0, getattr(os, advice))
+    except OSError:
+        pass
+
+
+class IOScheduler:
+    """Orders and throttles the reads of a scan, see the module docstring
+
+    One scheduler may be shared by several scans, they then share its budgets.
+    """
+
+    def __init__(self,
+                 order: str = "inode",
+                 bytes_per_second: float = None,
+                 iops: float = None,
+                 fadvise: bool = True,
+                 window: int = WINDOW) -> None:
+        """Creates a scheduler
+
+        Args:
+            order (str, optional): One of `ORDERS`: keep the walk order, sort by `(st_dev, st_ino)`,
+                or by physical extent where `FIEMAP` works and by inode elsewhere. Defaults to "inode".
+            bytes_per_second (float, optional): Read bandwidth budget. Defaults to None (unlimited).
+            iops (float, optional): Reads per second budget. Defaults to None (unlimited).
+            fadvise (bool, optional): Give page cache hints, see `read_checksum`. Defaults to True.
+            window (int, optional): Reads sorted together, fewer start hashing sooner and hold less
+                in memory, `None` sorts the whole walk at once. Defaults to WINDOW.
+
+        Raises:
+            UnknownPolicy: If `order` is not in `ORDERS`
+            InvalidOption: If a budget or `window` is not positive
+        """
+        if order not in ORDERS:
+            raise UnknownPolicy(f"Unknown read order: {order}")
+        if window is not None and window < 1:
+            raise InvalidOption(f"Window must be positive: {window}")
+        self.order = order
+        self.bytes_per_second = bytes_per_second
+        self.iops = iops
+        self.fadvise = fadvise
+        self.window = window
+        self._bandwidth = TokenBucket(bytes_per_second) if bytes_per_second else None
+        self._operations = TokenBucket(iops) if iops else None
+
+    @property
+    def throttled(self) -> bool:
+        """`True` if there is a budget to enforce"""
+        return self._bandwidth is not None or self._operations is not None
+
+    def throttle(self, size: int) -> None:
+        """Charges one read of `size` bytes to the budgets, sleeping while over them"""
+        waited = 0.0
+        if self._operations is not None:
+            waited += self._operations.take()
+        if self._bandwidth is not None and size:
+            waited += self._bandwidth.take(size)
+        if waited and stats.enabled:
+            stats.observe("io throttled", waited)
+
+    def get_position(self, file: object) -> tuple:
+        """Returns the sort key of a scanned File for `order`"""
+        if self.order == "extent":
+            offset = get_physical_offset(file.path)
+            if offset is not None:
+                return file.dev or 0, 0, offset
+        return file.dev or 0, 1, file.inode or 0
+
+    def sort(self, items: Iterable, get_file: Callable = None) -> list:
+        """Returns items in the order their Files should be read
+
+        Args:
+            items (Iterable): Files, or anything `get_file` maps to one
+            get_file (Callable, optional): Maps an item to its File. Defaults to None (the item is one).
+
+        Returns:
+            list: The sorted items
+        """
+        items = list(items)
+        if self.order == "walk":
+            return items
+        get_file = get_file or _identity
+        positions = {id(item): self.get_position(get_file(item)) for item in items}
+        return sorted(items, key=lambda item: positions[id(item)])
+
+    def open(self, path: str) -> object:
+        """Opens a file for reading with the sequential hint, see `close`"""
+        a_file = open(path, "rb", buffering=0)
+        advise(a_file, "POSIX_FADV_SEQUENTIAL" if self.fadvise else None)
+        return a_file
+
+    def close(self, a_file: object) -> None:
+        """Drops the pages of a file opened with `open` from the cache and closes it"""
+        try:
+            advise(a_file, "POSIX_FADV_DONTNEED" if self.fadvise else None)
+        finally:
+            a_file.close()
+
+    def get_checksum(self, algorithm: str = DEFAULT_ALGORITHM, executor: str = "thread") -> Callable[[str], str]:
+        """Returns `path -> checksum` reading through this scheduler
+
+        Raises:
+            InvalidOption: If there are budgets and `executor` is not "thread",
+                worker processes can't share them
+        """
+        if executor == "thread":
+            return functools.partial(read_checksum, algorithm=algorithm, fadvise=self.fadvise,
+                                     throttle=self.throttle if self.throttled else None)
+        if self.throttled:
+            raise InvalidOption("Read budgets need the thread executor")
+        return functools.partial(read_checksum, algorithm=algorithm, fadvise=self.fadvise)
+
+    def map(self,
+            func: Callable,
+            items: Iterable,
+            workers: int = 1,
+            executor: str = "thread",
+            key: Callable = None,
+            skip: Callable = None,
+            get_file: Callable = None) -> Iterator[tuple]:
+        """Like `pool.bounded_map`, but starts the calls in read order
+
+        Up to `window` items are taken at once (every item if it is `None`), their
+        calls are made sorted by `get_position` and the results still come out
+        in input order.
+
+        Args:
+            func (Callable): The function to call, e.g. from `get_checksum`
+            items (Iterable): The items to process
+            workers (int, optional): Pool size. Defaults to 1.
+            executor (str, optional): "thread" or "process". Defaults to "thread".
+            key (Callable, optional): Maps an item to the argument passed to `func`. Defaults to None.
+            skip (Callable, optional): Items it returns `True` for get a `None` result. Defaults to None.
+            get_file (Callable, optional): Maps an item to its File. Defaults to None (the item is one).
+
+        Yields:
+            tuple: `(item, func(key(item)))`
+        """
+        key = key or _identity
+        items = iter(items)
+        while True:
+            batch = list(islice(items, self.window)) if self.window is not None else list(items)
+            if not batch:
+                return
+            pending = [item for item in batch if skip is None or not skip(item)]
+            results = {}
+            for item, result in bounded_map(func, self.sort(pending, get_file), workers, executor, key):
+                results[id(item)] = result
+            for item in batch:
+                yield item, results.get(id(item))
+            if self.window is None:
+                return
+
+
+def _identity(item: object) -> object:
+    """Returns `item` unchanged"""
+    return item
@@ -0,0 +1,271 @@
+from __future__ import annotations
+
+import asyncio
+import io
+import itertools
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+from rich.console import Console
+from rich.markup import escape
+from rich.progress import (
+    BarColumn, Progress, SpinnerColumn, TextColumn, TimeElapsedColumn
+)
+from rich.table import Table
+
+from .command import Command
+from .errors import JobCancelled, UnknownJob
+
+MAX_WORKERS = 8
+
+
+class Job:
+    """A command running in the background"""
+
+    def __init__(self, id: int, name: str) -> None:
+        """Creates a Job, `JobManager.submit` does this
+
+        Args:
+            id (int): The job ID shown to the user
+            name (str): The command line that started it
+        """
+        self.id = id
+        self.name = name
+        self.completed = 0
+        self.total: int | None = None
+        self.started = time.monotonic()
+        self.finished: float | None = None
+        self.future: Future | None = None
+        self.output: list[str] = []
+        self.coroutine = False
+        self.notified = threading.Event()
+        self._cancel = threading.Event()
+
+    @property
+    def status(self) -> str:
+        """One of "running", "cancelling", "done", "failed" or "cancelled"."""
+        if self.future is None or not self.future.done():
+            return "cancelling" if self._cancel.is_set() else "running"
+        if self.future.cancelled() or isinstance(self.future.exception(), JobCancelled):
+            return "cancelled"
+        return "failed" if self.future.exception() is not None else "done"
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds since the job started, until it finished"""
+        return (self.finished or time.monotonic()) - self.started
+
+    def advance(self, *args: object, amount: int = 1) -> None:
+        """Counts progress, long running functions call it as they go
+
+        It also is where cancellation happens, so it can be passed straight
+        in as a `progress` callback.
+
+        Raises:
+            JobCancelled: If `cancel` was called
+        """
+        if self._cancel.is_set():
+            raise JobCancelled(f"Job {self.id} cancelled")
+        self.completed += amount
+
+    def cancel(self) -> None:
+        """Asks the job to stop at its next `advance`
+
+        A coroutine is cancelled at once. A function running in a thread
+        can't be interrupted, so the job stays "cancelling" until it returns.
+        """
+        self._cancel.set()
+        if self.future is not None and self.coroutine:
+            self.future.cancel()
+
+
+class JobManager:
+    """Runs background jobs on an asyncio loop living in its own thread
+
+    Coroutine functions run on the loop itself, plain functions run in a
+    thread pool through `run_in_executor`, so the prompt is never blocked.
+    """
+
+    def __init__(self, console: object, max_workers: int = MAX_WORKERS, buffered: bool = False) -> None:
+        """Starts the event loop thread
+
+        Args:
+            console (Console): Where job notifications are printed
+            max_workers (int, optional): Plain functions running at once. Defaults to MAX_WORKERS.
+            buffered (bool, optional): Keep what a job prints in `Job.output` until `flush`, so
+                batch output stays in order. Defaults to False.
+        """
+        self.console = console
+        self.buffered = buffered
+        self.jobs: dict[int, Job] = {}
+        self._ids = itertools.count(1)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="jobs", daemon=True)
+        self.thread.start()
+
+    def submit(self, name: str, func: Callable, *args: object) -> Job:
+        """Starts `func(*args, job)` in the background
+
+        Args:
+            name (str): Shown in `jobs`
+            func (Callable): A function or coroutine function, the `Job` is passed as its last argument
+
+        Returns:
+            Job: The new job
+        """
+        job = Job(next(self._ids), name)
+        job.coroutine = asyncio.iscoroutinefunction(func)
+        self.jobs[job.id] = job
+        job.future = asyncio.run_coroutine_threadsafe(self._run(func, *args, job), self.loop)
+        job.future.add_done_callback(lambda _: self._finished(job))
+        return job
+
+    async def _run(self, func: Callable, *args: object) -> object:
+        """Awaits `func(*args)` on the loop or in the executor"""
+        if asyncio.iscoroutinefunction(func):
+            return await func(*args)
+        return await self.loop.run_in_executor(self.executor, self._call, func, args)
+
+    def _call(self, func: Callable, args: tuple) -> object:
+        """Runs a plain function in an executor thread, capturing its output when `buffered`
+
+        The console buffer is per thread, so a job only captures what it printed itself.
+        """
+        job = args[-1]
+        # a job cancelled while it waited for a free thread does not start
+        job.advance(amount=0)
+        if not self.buffered:
+            return func(*args)
+        self.console.begin_capture()
+        try:
+            return func(*args)
+        finally:
+            job.output.append(self.console.end_capture())
+
+    def _finished(self, job: Job) -> None:
+        """Prints a one line notification when a job ends
+
+        A job that is already done when `submit` attaches this callback gets
+        it on the submitting thread, so a buffered notification is rendered on
+        a console of its own instead of the capture of whatever thread runs it.
+        """
+        job.finished = time.monotonic()
+        status = job.status
+        try:
+            if status == "failed":
+                text = f"[red][{job.id}] {escape(job.name)} failed:[/] {escape(str(job.future.exception()))}"
+            else:
+                colour = "green" if status == "done" else "yellow"
+                text = f"[{colour}][{job.id}] {escape(job.name)} {status}[/] ({job.elapsed:.2f}s)"
+            if self.buffered:
+                job.output.append(self._render(text))
+            else:
+                self.console.print(text)
+        finally:
+            job.notified.set()
+
+    def _render(self, text: str) -> str:
+        """Renders markup like `console.print` would, without printing it"""
+        buffer = io.StringIO()
+        Console(file=buffer, width=self.console.width, color_system=self.console.color_system,
+                force_terminal=self.console.is_terminal).print(text)
+        return buffer.getvalue()
+
+    def flush(self, jobs: list[Job]) -> None:
+        """Prints the output `buffered` jobs kept so far, one job after the other
+
+        Args:
+            jobs (list[Job]): The jobs, in the order their output should appear
+        """
+        for job in jobs:
+            while job.output:
+                self.console.out(job.output.pop(0), end="", highlight=False)
+
+    def get(self, id: int | str) -> Job:
+        """Returns a job by ID
+
+        Raises:
+            UnknownJob: If no job has that ID
+        """
+        try:
+            return self.jobs[int(id)]
+        except (KeyError, ValueError):
+            raise UnknownJob(f"Unknown job: {id}")
+
+    def running(self) -> list[Job]:
+        """Returns the jobs that have not finished yet"""
+        return [job for job in self.jobs.values() if not job.future.done()]
+
+    def wait(self, jobs: list[Job], show_progress: bool = True) -> None:
+        """Blocks until every job in `jobs` finished, drawing a progress bar per job
+
+        Args:
+            jobs (list[Job]): The jobs to wait for
+            show_progress (bool, optional): Draw progress bars. Defaults to True.
+        """
+        if not show_progress:
+            for job in jobs:
+                job.notified.wait()
+            return
+        columns = (SpinnerColumn(), TextColumn("[{task.fields[id]}] {task.description}"), BarColumn(),
+                   TextColumn("{task.completed:,}"), TimeElapsedColumn())
+        with Progress(*columns, console=self.console, transient=True) as progress:
+            tasks = {job.id: progress.add_task(job.name, id=job.id, total=job.total) for job in jobs}
+            while any(not job.notified.is_set() for job in jobs):
+                for job in jobs:
+                    progress.update(tasks[job.id], completed=job.completed, total=job.total)
+                time.sleep(0.1)
+
+    def shutdown(self) -> None:
+        """Cancels running jobs and stops the loop"""
+        for job in self.running():
+            job.cancel()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.executor.shutdown(wait=False)
+
+
+def _jobs(terminal: None, options: list[list[str], dict[str, str]], params: list[str]) -> None:
+    """Lists background jobs"""
+    table = Table()
+    for column in ("ID", "Command", "Status", "Progress", "Elapsed"):
+        table.add_column(column)
+    for job in terminal.jobs.jobs.values():
+        table.add_row(str(job.id), job.name, job.status, f"{job.completed:,}", f"{job.elapsed:.1f}s")
+    terminal.console.print(table)
+
+
+def _wait(terminal: None, options: list[list[str], dict[str, str]], params: list[str]) -> None:
+    """Waits for the given jobs, or all running ones"""
+    jobs = [terminal.jobs.get(id) for id in params] if params else terminal.jobs.running()
+    try:
+        terminal.jobs.wait(jobs, show_progress=not terminal.jobs.buffered)
+    except KeyboardInterrupt:
+        terminal.console.print("Stopped waiting, jobs keep running")
+    if not params:
+        # jobs that finished before this `wait` still have their output buffered
+        jobs = [job for job in terminal.jobs.jobs.values() if job.notified.is_set()]
+    terminal.jobs.flush(jobs)
+
+
+def _cancel(terminal: None, options: list[list[str], dict[str, str]], params: list[str]) -> None:
+    """Cancels the given jobs, or all running ones with `-a`"""
+    jobs = terminal.jobs.running() if "-a" in options[0] else [terminal.jobs.get(id) for id in params]
+    for job in jobs:
+        job.cancel()
+
+
+def init(terminal: None) -> None:
+    """Initialize the job commands
+
+    Args:
+        terminal (Terminal): The `Terminal` object to add commands to
+    """
+    for command in (
+        Command("jobs", terminal, [[], []], _jobs),
+        Command("wait", terminal, [[], []], _wait),
+        Command("cancel", terminal, [["-a"], []], _cancel),
+    ):
+        terminal.commands.append(command)
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import datetime
+import itertools
+import os
+import stat
+from typing import Iterable, Iterator
+
+from rich.console import Console
+from rich.markup import escape
+
+from templates.folder_tree import format_size
+
+from .instrumentation import stats
+
+MIN_PAGE_SIZE = 5
+
+
+def iter_directory(path: str, key: str = None, reverse: bool = False, hidden: bool = False) -> Iterator[tuple]:
+    """Yields `(name, is_dir, size, mtime_ns)` for the entries of an unscanned directory
+
+    Unsorted listings stream straight from `os.scandir`. Sorting by name only
+    needs `os.listdir`, so entries are still stat'ed one by one as they are
+    yielded; sorting by size or mtime has to stat everything first. Scanned
+    directories are better listed with `iter_scanned`, which sorts nothing.
+
+    Args:
+        path (str): The directory
+        key (str, optional): None, or one of `query.SORT_KEYS`. Defaults to None.
+        reverse (bool, optional): Reverse the sort order. Defaults to False.
+        hidden (bool, optional): Include names starting with a dot. Defaults to False.
+    """
+    if key is None:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if hidden or not entry.name.startswith("."):
+                    yield _get_row(entry)
+        return
+    if key == "name":
+        names = [name for name in os.listdir(path) if hidden or not name.startswith(".")]
+        names.sort(reverse=reverse)
+        for name in names:
+            try:
+                st = os.stat(os.path.join(path, name))
+            except OSError:
+                yield name, False, 0, 0
+                continue
+            yield name, stat.S_ISDIR(st.st_mode), st.st_size, st.st_mtime_ns
+        return
+    with os.scandir(path) as entries:
+        entries = [entry for entry in entries if hidden or not entry.name.startswith(".")]
+    column = 2 if key == "size" else 3
+    yield from sorted(map(_get_row, entries), key=lambda row: row[column], reverse=reverse)
+
+
+def iter_scanned(manager: object,
+                 path: str,
+                 key: str = None,
+                 reverse: bool = False,
+                 hidden: bool = False) -> Iterator[tuple]:
+    """Yields `(name, is_dir, size, mtime_ns)` for a scanned directory without reading it
+
+    Subdirectories come first with their du totals, then files sorted from
+    the scan's per-directory index, see `FileManager.iter_sorted`.
+
+    Args:
+        manager (FileManager): A scan containing `path`
+        path (str): The directory
+        key (str, optional): None, or one of `query.SORT_KEYS`. Defaults to "name" order.
+        reverse (bool, optional): Reverse the sort order. Defaults to False.
+        hidden (bool, optional): Include names starting with a dot. Defaults to False.
+    """
+    key = key or "name"
+    attribute = {"name": "name", "size": "size", "mtime": "mtime_ns"}[key]
+    directories = [child for child in manager.get_usage_children(path)
+                   if hidden or not child.name.startswith(".")]
+    for directory in sorted(directories, key=lambda child: getattr(child, attribute), reverse=reverse):
+        yield directory.name, True, directory.size, directory.mtime_ns
+    for file in manager.iter_sorted(key, reverse, path, hidden):
+        yield file.name, False, file.size, file.mtime_ns
+
+
+def _get_row(entry: os.DirEntry) -> tuple:
+    """Stats one directory entry into a listing row"""
+    try:
+        st = entry.stat()
+    except OSError:
+        return entry.name, False, 0, 0
+    return entry.name, entry.is_dir(), st.st_size, st.st_mtime_ns
+
+
+class Pager:
+    """Prints rows one screen at a time
+
+    Rows are pulled from their iterator only when a page needs them and
+    only the visible page is turned into a table, so the first screen is
+    drawn as soon as it was read, however long the listing is.
+    """
+
+    def __init__(self, console: Console, page_size: int = None) -> None:
+        """Creates a pager
+
+        Args:
+            console (Console): Console to print on
+            page_size (int, optional): Rows per page. Defaults to what fits on the console.
+        """
+        self.console = console
+        self.page_size = page_size or max(console.height - 6, MIN_PAGE_SIZE)
+
+    def show(self, rows: Iterable[tuple], interactive: bool = True) -> int:
+        """Prints `(name, is_dir, size, mtime_ns)` rows page by page
+
+        Args:
+            rows (Iterable[tuple]): The rows, e.g. from `iter_directory` or `iter_scanned`
+            interactive (bool, optional): Ask before every further page, `q` stops. Defaults to True.
+
+        Returns:
+            int: The number of rows printed
+        """
+        rows = iter(rows)
+        shown = 0
+        while True:
+            page = list(itertools.islice(rows, self.page_size))
+            if page:
+                with stats.timer("render page"):
+                    self.console.print(self._render(page), highlight=False)
+                shown += len(page)
+            if len(page) < self.page_size:
+                break
+            if interactive:
+                answer = self.console.input(f"[dim]-- {shown:,} shown, Enter for more, q to stop --[/] ")
+                if answer.strip().lower() == "q":
+                    break
+        return shown
+
+    @staticmethod
+    def _render(page: list[tuple]) -> str:
+        """Formats one page as fixed width lines, cheaper than a `Table` for long listings"""
+        lines = []
+        for name, is_dir, size, mtime_ns in page:
+            modified = f"{datetime.datetime.fromtimestamp(mtime_ns / 1e9):%Y-%m-%d %H:%M}" if mtime_ns else "-"
+            name = f"[bold blue]{escape(name)}/[/]" if is_dir else escape(name)
+            lines.append(f"{format_size(size):>7}  {modified:<16}  {name}")
+        return "\n".join(lines)
@@ -1,74 +1,137 @@
-from shlex import split
+from __future__ import annotations
 
-from rich.console import Console
+import functools
+import importlib
+import sys
+import threading
+import time
+from typing import TYPE_CHECKING, Iterable
 
-from templates import main_menu
-
-from . import command
+from . import command, input_parser
 from .command import Command
-from .errors import InvalidOption, InvalidSyntax
+from .instrumentation import stats
+
+if TYPE_CHECKING:
+    from rich.console import Console
+
+    from .cache import HashCache
+    from .completion import Completer
+    from .daemon import IndexClient
+    from .jobs import JobManager
+
+# Command modules are only imported when one of their commands is first used
+COMMAND_MODULES = {
+    "jobs": ["jobs", "wait", "cancel"],
+    "file_commands": ["scan", "watch", "unwatch", "dedup", "cp", "mv", "rm", "snapshot", "diff", "ls", "du",
+                      "tree", "find"],
+    "instrumentation": ["stats"],
+}
 
 
 class Terminal:
-    """The main Application class that handles everything"""
+    """The main Application class that handles everything
+
+    rich, the job loop and every command module are loaded on first use, so
+    starting up only costs the imports the first command actually needs.
+    """
 
     def __init__(self) -> None:
-        self.console = Console(highlight=False)
+        self._console: Console = None
+        self._jobs: JobManager = None
+        self._buffer_jobs = False
         self.running = False
         self.commands = []
+        self.file_managers = {}
+        self._file_managers_lock = threading.Lock()
+        self.client: IndexClient = None
+        self.completer: Completer = None
+        self._hash_cache: HashCache = None
+        self._hash_cache_opened = False
+        self._hash_cache_lock = threading.Lock()
         self.NO_PARAM_OPTIONS = [
             '-v'
         ]
         command.init(self)
+        for module, names in COMMAND_MODULES.items():
+            Command.add_lazy(names, functools.partial(self.load_commands, module))
+        input_parser.parse.cache_clear()
+
+    @property
+    def console(self) -> Console:
+        """The rich `Console`, created on first use"""
+        if self._console is None:
+            from rich.console import Console
+
+            self._console = Console(highlight=False)
+        return self._console
+
+    @console.setter
+    def console(self, console: Console) -> None:
+        self._console = console
+
+    @property
+    def jobs(self) -> JobManager:
+        """The background `JobManager`, its event loop thread is started on first use"""
+        if self._jobs is None:
+            from .jobs import JobManager
+
+            self._jobs = JobManager(self.console, buffered=self._buffer_jobs)
+        return self._jobs
+
+    @property
+    def hash_cache(self) -> HashCache:
+        """The persistent checksum cache shared by every scan, opened on first use, `None` if it can't be"""
+        with self._hash_cache_lock:
+            if not self._hash_cache_opened:
+                from .cache import open_cache
+
+                self._hash_cache = open_cache()
+                self._hash_cache_opened = True
+        return self._hash_cache
+
+    def attach(self, socket_path: str = None) -> None:
+        """Leaves scans to the index daemon listening on `socket_path`, see `daemon`
+
+        Raises:
+            DaemonError: If the daemon can't be reached
+        """
+        from .daemon import DEFAULT_SOCKET, IndexClient
+
+        self.client = IndexClient(socket_path or DEFAULT_SOCKET)
+        self.client.request("ping")
+
+    def add_file_managers(self, managers: dict) -> None:
+        """Adds or replaces scans by root
+
+        Jobs call this from their own threads, so `file_managers` is replaced
+        instead of changed in place: whoever is iterating it keeps a consistent dict.
+
+        Args:
+            managers (dict[str, FileManager]): root -> scan
+        """
+        with self._file_managers_lock:
+            self.file_managers = {**self.file_managers, **managers}
+
+    def load_commands(self, module: str) -> None:
+        """Imports a module of `COMMAND_MODULES` and adds its commands"""
+        importlib.import_module(f"{__package__}.{module}").init(self)
 
-    def parse_input(self, input: str) -> tuple:
+    def parse_input(self, input: str) -> input_parser.ParsedInput:
         """A helper method to parse out input to command attributes and stuff
 
         Args:
             input (str): The plain str input
 
         Returns:
-            tuple: parsed strings
+            ParsedInput: names, options and params like before, plus the resolved `Command`
         """
+        if not stats.enabled:
+            return input_parser.parse(input)
+        start = time.perf_counter()
         try:
-            words = split(input)
-        except ValueError:
-            raise InvalidSyntax(f"Invalid syntax: {input}")
-        _command = [words[0]]
-        words.pop(0)
-        _options = {}
-        _params = []
-        while Command.has_subcommands(_command[-1]) and words != []:
-            if Command.is_subcommand(words[0], _command[-1]):
-                _command.append(words[0])
-                words.pop(0)
-                continue
-            break
-        for i, word in enumerate(words):
-            if word.startswith("--"):
-                if len(_params) != 0:
-                    raise InvalidOption(
-                        f"Parameter before option: '[red bold]{word}[/]' in '[red bold]{input}[/]'"
-                    )
-                if len(words) - 1 != i:
-                    _options[word] = words[i + 1]
-                    words.pop(i+1)
-                else:
-                    _options[word] = ""
-            elif word.startswith("-"):
-                if len(_params) != 0:
-                    raise InvalidOption(
-                        f"Parameter before option: '[red bold]{word}[/]' in '[red bold]{input}[/]'"
-                    )
-                if len(word) > 2:
-                    _options[word[0:2]] = ""
-                    _params.append(word[2:])
-                else:
-                    _options[word] = ""
-            else:
-                _params.append(word)
-
-        return _command, _options, _params
+            return input_parser.parse(input)
+        finally:
+            stats.observe("parse_input", time.perf_counter() - start)
 
     def run_command(self, data: tuple) -> None:
         """Runs the corresponding Command using the data
@@ -76,20 +139,107 @@ class Terminal:
         Args:
             data (tuple): The data in three parts: Command, options, params
         """
-        command = Command.parse(" ".join(data[0]))
-        command.run(data[1], data[2])
+        if isinstance(data, input_parser.ParsedInput):
+            command = data.command
+        else:
+            command = Command.parse(" ".join(data[0]))
+        command.run(data[1], list(data[2]))
 
     def run(self) -> None:
         """Main function that starts the application"""
-        main_menu.render(self.console)
+        from templates import main_menu
+
+        from .completion import Completer
+
+        with stats.timer("render main menu"):
+            main_menu.render(self.console)
+        self.completer = Completer(self)
+        self.completer.install()
         self.running = True
         while self.running:
             try:
                 input = self.console.input("> ")
                 self.run_command(self.parse_input(input))
             except KeyboardInterrupt:
+                if self._jobs is not None:
+                    self._jobs.shutdown()
                 self.console.clear()
                 self.console.print("[red bold]Thanks for using This app :-)")
                 break
             except Exception as e:
                 self.console.print(e.args[0])
+
+    def run_batch(self, lines: Iterable[str], timings: bool = False, flush_every: int = 256) -> int:
+        """Runs many input lines without the main menu, prompt or per-line flushing
+
+        Blank lines and lines starting with `#` are skipped. Output is captured
+        and written to stdout every `flush_every` lines. A failing line is
+        reported with its line number and does not stop the batch. Background
+        jobs are waited for before returning and count as failed lines if they fail.
+        What a job prints is kept until it is waited for, by `wait` or at the end,
+        so it comes out whole and in job order instead of mixed into other lines.
+
+        Args:
+            lines (Iterable[str]): The input lines, e.g. an open script file or `sys.stdin`
+            timings (bool, optional): Print per-command timings at the end. Defaults to False.
+            flush_every (int, optional): Lines between output flushes. Defaults to 256.
+
+        Returns:
+            int: The number of lines that failed
+        """
+        failures = 0
+        durations: dict[str, list[float]] = {}
+        previous_jobs = set(self._jobs.jobs) if self._jobs is not None else set()
+        self._set_job_buffering(True)
+        self.console.begin_capture()
+        try:
+            for number, line in enumerate(lines, 1):
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    start = time.perf_counter()
+                    try:
+                        data = self.parse_input(line)
+                        self.run_command(data)
+                    except Exception as e:
+                        failures += 1
+                        self.console.print(f"[red]line {number}:[/] {e.args[0] if e.args else repr(e)}")
+                    else:
+                        durations.setdefault(" ".join(data.names), []).append(time.perf_counter() - start)
+                if number % flush_every == 0:
+                    sys.stdout.write(self.console.end_capture())
+                    self.console.begin_capture()
+            if self._jobs is not None:
+                started = [job for id, job in self._jobs.jobs.items() if id not in previous_jobs]
+                self._jobs.wait(started, show_progress=False)
+                self._jobs.flush(started)
+                failures += sum(job.status == "failed" for job in started)
+        finally:
+            self._set_job_buffering(False)
+            sys.stdout.write(self.console.end_capture())
+            sys.stdout.flush()
+        if timings:
+            self.print_timings(durations)
+        return failures
+
+    def _set_job_buffering(self, buffered: bool) -> None:
+        """Makes background jobs keep their output until they are waited for, see `JobManager`"""
+        self._buffer_jobs = buffered
+        if self._jobs is not None:
+            self._jobs.buffered = buffered
+
+    def print_timings(self, durations: dict[str, list[float]]) -> None:
+        """Prints count, total, mean and max time per command
+
+        Args:
+            durations (dict[str, list[float]]): command -> run times in seconds
+        """
+        from rich.table import Table
+
+        table = Table(title="Timings")
+        for column in ("Command", "Runs", "Total ms", "Mean ms", "Max ms"):
+            table.add_column(column, justify="left" if column == "Command" else "right")
+        for name, runs in sorted(durations.items(), key=lambda item: -sum(item[1])):
+            total = sum(runs)
+            table.add_row(name, str(len(runs)), f"{total * 1000:.2f}", f"{total / len(runs) * 1000:.3f}",
+                          f"{max(runs) * 1000:.3f}")
+        self.console.print(table)
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator
+
+from .errors import UnknownExecutor
+
+EXECUTORS = {
+    "thread": ThreadPoolExecutor,
+    "process": ProcessPoolExecutor,
+}
+
+
+def bounded_map(func: Callable,
+                items: Iterable,
+                workers: int = 1,
+                executor: str = "thread",
+                key: Callable = None,
+                window: int = None,
+                skip: Callable = None) -> Iterator[tuple]:
+    """Calls `func` on every item across a pool, yielding results in input order
+
+    `items` is only consumed while fewer than `window` calls are pending, so a
+    lazy producer (like a directory walk) is never allowed to run far ahead.
+
+    Args:
+        func (Callable): The function to call, must be picklable for the process executor
+        items (Iterable): The items to process
+        workers (int, optional): Pool size, `1` runs inline without a pool. Defaults to 1.
+        executor (str, optional): "thread" or "process". Defaults to "thread".
+        key (Callable, optional): Maps an item to the argument passed to `func`. Defaults to None.
+        window (int, optional): Max pending calls. Defaults to `4 * workers`.
+        skip (Callable, optional): Items it returns `True` for are yielded in order
+            with a `None` result instead of being processed. Defaults to None.
+
+    Raises:
+        UnknownExecutor: If `executor` is not in `EXECUTORS`
+
+    Yields:
+        tuple: `(item, func(key(item)))`
+    """
+    if executor not in EXECUTORS:
+        raise UnknownExecutor(f"Unknown executor: {executor}")
+    if key is None:
+        key = _identity
+    if workers <= 1:
+        for item in items:
+            if skip is not None and skip(item):
+                yield item, None
+            else:
+                yield item, func(key(item))
+        return
+
+    window = window or 4 * workers
+    pending = deque()
+    with EXECUTORS[executor](max_workers=workers) as pool:
+        for item in items:
+            if len(pending) >= window:
+                yield _pop_result(pending)
+            if skip is not None and skip(item):
+                pending.append((item, None))
+            else:
+                pending.append((item, pool.submit(func, key(item))))
+        while pending:
+            yield _pop_result(pending)
+
+
+def _pop_result(pending: deque) -> tuple:
+    """Waits for the oldest pending call and returns `(item, result)`"""
+    item, future = pending.popleft()
+    return item, None if future is None else future.result()
+
+
+def _identity(item: object) -> object:
+    """Returns `item` unchanged"""
+    return item
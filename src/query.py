@@ -0,0 +1,237 @@
+from __future__ import annotations
+
+import datetime
+import fnmatch
+import os
+from bisect import bisect_left, bisect_right
+from typing import Callable, Iterable, Iterator
+
+from .index import FileIndex
+
+WILDCARDS = "*?["
+SORT_KEYS = ["name", "size", "mtime"]
+
+
+def _to_ns(moment: datetime.datetime | float) -> int:
+    """Converts a datetime or a POSIX timestamp to nanoseconds"""
+    if isinstance(moment, datetime.datetime):
+        moment = moment.timestamp()
+    return int(moment * 1_000_000_000)
+
+
+class QueryIndex:
+    """Secondary indexes over scanned files
+
+    Files are indexed by extension, by size and by mtime (sorted, searched
+    with `bisect`) and by name (sorted names and sorted reversed names, so the
+    literal prefix or suffix of a glob narrows the search). A query starts
+    from the most selective index and checks the other criteria on those
+    candidates only.
+    """
+
+    def __init__(self, files: Iterable, categories: dict[str, list[str]]) -> None:
+        """Builds every index
+
+        Args:
+            files (Iterable[File]): The scanned files, in walk order
+            categories (dict[str, list[str]]): category name -> extensions
+        """
+        if isinstance(files, FileIndex):
+            # read the columns, building a `File` per row would undo what `compact` saves
+            self.files = files
+            names, sizes, mtimes = files.names, files.sizes, files.mtimes
+        else:
+            self.files = list(files)
+            names = [file.name for file in self.files]
+            sizes = [file.size for file in self.files]
+            mtimes = [file.mtime_ns or 0 for file in self.files]
+        self.categories = categories
+        self.by_extension: dict[str, list[int]] = {}
+        for index, name in enumerate(names):
+            self.by_extension.setdefault(os.path.splitext(name)[-1].lower(), []).append(index)
+        count = len(names)
+        self.size_order = sorted(range(count), key=sizes.__getitem__)
+        self.sizes = [sizes[index] for index in self.size_order]
+        self.mtime_order = sorted(range(count), key=mtimes.__getitem__)
+        self.mtimes = [mtimes[index] for index in self.mtime_order]
+        self.name_order = sorted(range(count), key=names.__getitem__)
+        self.names = [names[index] for index in self.name_order]
+        self.suffix_order = sorted(range(count), key=lambda index: names[index][::-1])
+        self.suffixes = [names[index][::-1] for index in self.suffix_order]
+
+    def query(self,
+              extension: str | list[str] = None,
+              category: str = None,
+              min_size: int = None,
+              max_size: int = None,
+              modified_after: datetime.datetime | float = None,
+              modified_before: datetime.datetime | float = None,
+              name: str = None) -> list:
+        """Returns the files matching every given criterion, in walk order
+
+        Args:
+            extension (str | list[str], optional): Extension(s) with the dot, e.g. ".py". Defaults to None.
+            category (str, optional): A key of `categories`, e.g. "video". Defaults to None.
+            min_size (int, optional): Smallest size in bytes. Defaults to None.
+            max_size (int, optional): Largest size in bytes. Defaults to None.
+            modified_after (datetime | float, optional): Oldest mtime. Defaults to None.
+            modified_before (datetime | float, optional): Newest mtime. Defaults to None.
+            name (str, optional): A glob matched against the file name. Defaults to None.
+
+        Raises:
+            KeyError: If `category` is unknown
+
+        Returns:
+            list[File]: The matching files
+        """
+        candidates = []
+        checks: list[Callable[[object], bool]] = []
+
+        extensions = None
+        if isinstance(extension, str):
+            extensions = {extension.lower()}
+        elif extension is not None:
+            extensions = {ext.lower() for ext in extension}
+        if category is not None:
+            wanted = {ext.lower() for ext in self.categories[category]}
+            extensions = wanted if extensions is None else extensions & wanted
+        if extensions is not None:
+            lists = [self.by_extension.get(ext, []) for ext in extensions]
+            candidates.append((sum(map(len, lists)), lambda: (index for found in lists for index in found)))
+            checks.append(lambda file: file.extension.lower() in extensions)
+
+        if min_size is not None or max_size is not None:
+            low = 0 if min_size is None else bisect_left(self.sizes, min_size)
+            high = len(self.sizes) if max_size is None else bisect_right(self.sizes, max_size)
+            candidates.append((max(high - low, 0), lambda: self.size_order[low:high]))
+            checks.append(lambda file: (min_size is None or file.size >= min_size)
+                          and (max_size is None or file.size <= max_size))
+
+        if modified_after is not None or modified_before is not None:
+            after = None if modified_after is None else _to_ns(modified_after)
+            before = None if modified_before is None else _to_ns(modified_before)
+            start = 0 if after is None else bisect_left(self.mtimes, after)
+            stop = len(self.mtimes) if before is None else bisect_right(self.mtimes, before)
+            candidates.append((max(stop - start, 0), lambda: self.mtime_order[start:stop]))
+            checks.append(lambda file: (after is None or (file.mtime_ns or 0) >= after)
+                          and (before is None or (file.mtime_ns or 0) <= before))
+
+        if name is not None:
+            candidates.append(self._name_candidates(name))
+            checks.append(lambda file: fnmatch.fnmatchcase(file.name, name))
+
+        if not candidates:
+            return list(self.files)
+        _, driver = min(candidates, key=lambda candidate: candidate[0])
+        matches = [index for index in driver() if all(check(self.files[index]) for check in checks)]
+        return [self.files[index] for index in sorted(matches)]
+
+    def iter_sorted(self, key: str = "name", reverse: bool = False) -> Iterator:
+        """Yields files in the order of one of the sorted indexes, without sorting anything
+
+        Args:
+            key (str, optional): One of `SORT_KEYS`. Defaults to "name".
+            reverse (bool, optional): Largest, newest or last name first. Defaults to False.
+
+        Raises:
+            KeyError: If `key` is not in `SORT_KEYS`
+
+        Yields:
+            File: The next file
+        """
+        order = {"name": self.name_order, "size": self.size_order, "mtime": self.mtime_order}[key]
+        for index in reversed(order) if reverse else order:
+            yield self.files[index]
+
+    def _name_candidates(self, pattern: str) -> tuple[int, Callable]:
+        """Returns `(count, producer)` for the names sharing the glob's literal prefix or suffix"""
+        prefix = pattern
+        for char in WILDCARDS:
+            prefix = prefix.split(char, 1)[0]
+        suffix = pattern[::-1]
+        for char in WILDCARDS + "]":
+            suffix = suffix.split(char, 1)[0]
+        low, high = bisect_left(self.names, prefix), bisect_left(self.names, prefix + "\U0010ffff")
+        by_prefix = (high - low, lambda: self.name_order[low:high])
+        start, stop = bisect_left(self.suffixes, suffix), bisect_left(self.suffixes, suffix + "\U0010ffff")
+        by_suffix = (stop - start, lambda: self.suffix_order[start:stop])
+        return min(by_prefix, by_suffix, key=lambda candidate: candidate[0])
+
+
+class ChildIndex:
+    """Scanned files grouped by directory, to list one directory without the whole scan
+
+    Grouping is one pass over the files, or over the parent column of a
+    `FileIndex`. A directory's files are sorted the first time it is listed
+    in an order, and only they are.
+    """
+
+    def __init__(self, files: Iterable) -> None:
+        """Groups the files
+
+        Args:
+            files (Iterable[File]): The scanned files, in walk order
+        """
+        self.children: dict[str, list[int]] = {}
+        if isinstance(files, FileIndex):
+            self.files = files
+            by_root: dict[int, list[int]] = {}
+            for index, root_id in enumerate(files.parents):
+                by_root.setdefault(root_id, []).append(index)
+            for root_id, indexes in by_root.items():
+                self.children[files.roots[root_id]] = indexes
+            self._columns = {"name": files.names, "size": files.sizes, "mtime": files.mtimes}
+        else:
+            self.files = list(files)
+            for index, file in enumerate(self.files):
+                self.children.setdefault(os.path.dirname(file.path), []).append(index)
+            self._columns = None
+        self._orders: dict[tuple[str, str], list[int]] = {}
+
+    def iter_sorted(self, directory: str, key: str = "name", reverse: bool = False, hidden: bool = True) -> Iterator:
+        """Yields the files directly inside `directory`
+
+        Args:
+            directory (str): The directory
+            key (str, optional): One of `SORT_KEYS`. Defaults to "name".
+            reverse (bool, optional): Largest, newest or last name first. Defaults to False.
+            hidden (bool, optional): Include names starting with a dot. Defaults to True.
+
+        Raises:
+            KeyError: If `key` is not in `SORT_KEYS`
+
+        Yields:
+            File: The next file
+        """
+        directory = directory.rstrip(os.sep) or os.sep
+        order = self._orders.get((directory, key))
+        if order is None:
+            order = self._orders[directory, key] = sorted(self.children.get(directory, ()), key=self._get_key(key))
+        names = self._columns["name"] if self._columns is not None else None
+        for index in reversed(order) if reverse else order:
+            if hidden or not (names[index] if names is not None else self.files[index].name).startswith("."):
+                yield self.files[index]
+
+    def _get_key(self, key: str) -> Callable[[int], object]:
+        """Returns `index -> sort value` for one of `SORT_KEYS`"""
+        if self._columns is not None:
+            return self._columns[key].__getitem__
+        attribute = {"name": "name", "size": "size", "mtime": "mtime_ns"}[key]
+        return lambda index: getattr(self.files[index], attribute) or 0
+
+
+def parse_size(text: str) -> int:
+    """Parses sizes like "512", "10K", "1.5G" into bytes"""
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+    text = text.strip().upper().rstrip("B")
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def parse_age(text: str) -> float:
+    """Parses ages like "30m", "12h", "7d", "2w" into a POSIX timestamp that long ago"""
+    units = {"S": 1, "M": 60, "H": 3600, "D": 86400, "W": 604800}
+    text = text.strip().upper()
+    seconds = float(text[:-1]) * units[text[-1]] if text and text[-1] in units else float(text)
+    return datetime.datetime.now().timestamp() - seconds
@@ -0,0 +1,339 @@
+from __future__ import annotations
+
+import contextlib
+import mmap
+import os
+import secrets
+import struct
+import sys
+import time
+from array import array
+from typing import Iterable, NamedTuple
+
+from .errors import InvalidSnapshot
+
+MAGIC = b"FMSNAP\0\0"
+VERSION = 1
+# magic, version, digest size, entries, root size, path table size, created, algorithm
+HEADER = struct.Struct("<8sIIQQQd16s")
+CHANGE_KINDS = ["added", "removed", "modified", "moved"]
+# Entries `diff` compares at once when the two snapshots line up, in C instead of one by one
+BLOCK_SIZE = 256
+
+
+class Change(NamedTuple):
+    """One difference between two snapshots, `old_path` is only set for moves"""
+
+    kind: str
+    path: str
+    old_path: str = None
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def build(files: Iterable, root: str, algorithm: str = None) -> bytes:
+    """Encodes scanned files as a snapshot
+
+    The layout after the header is: the root path, then the path offsets, the
+    size, mtime, inode and device columns (8 bytes each), the digests (fixed
+    width, all zero when a file was not hashed) and the NUL terminated paths
+    relative to the root, sorted bytewise. Every section starts 8 byte
+    aligned, all numbers are little endian.
+
+    Args:
+        files (Iterable[File]): Files below `root`, e.g. `FileManager.get_files()`
+        root (str): The scanned root
+        algorithm (str, optional): Algorithm of the digests. Defaults to None.
+
+    Raises:
+        InvalidSnapshot: If digests of different sizes are mixed
+
+    Returns:
+        bytes: The snapshot
+    """
+    root = root.rstrip(os.sep) or os.sep
+    prefix = os.path.join(root, "")
+    records = []
+    digest_size = 0
+    for file in files:
+        path = file.path[len(prefix):] if file.path.startswith(prefix) else file.path
+        digest = bytes.fromhex(file.hash) if file.hash else None
+        if digest is not None:
+            if digest_size and len(digest) != digest_size:
+                raise InvalidSnapshot("Digests of different sizes can't be stored together")
+            digest_size = len(digest)
+        records.append((os.fsencode(path), file.size or 0, file.mtime_ns or 0, file.inode or 0, file.dev or 0,
+                        digest))
+    records.sort(key=lambda record: record[0])
+
+    offsets = array("Q", [0])
+    sizes, mtimes, inodes, devs = array("q"), array("q"), array("Q"), array("Q")
+    empty = bytes(digest_size)
+    digests = bytearray()
+    for path, size, mtime_ns, inode, dev, digest in records:
+        offsets.append(offsets[-1] + len(path) + 1)
+        sizes.append(size)
+        mtimes.append(mtime_ns)
+        inodes.append(inode)
+        devs.append(dev)
+        digests += digest or empty
+    paths = b"".join(record[0] + b"\0" for record in records)
+    if sys.byteorder != "little":
+        for column in (offsets, sizes, mtimes, inodes, devs):
+            column.byteswap()
+
+    encoded_root = os.fsencode(root)
+    header = HEADER.pack(MAGIC, VERSION, digest_size, len(records), len(encoded_root), len(paths), time.time(),
+                         (algorithm or "").encode()[:16])
+    parts = [header, encoded_root]
+    position = len(header) + len(encoded_root)
+    for section in (offsets, sizes, mtimes, inodes, devs, digests, paths):
+        padding = _align(position) - position
+        parts.append(bytes(padding))
+        parts.append(section.tobytes() if isinstance(section, array) else bytes(section))
+        position += padding + len(parts[-1])
+    return b"".join(parts)
+
+
+def write(path: str, files: Iterable, root: str, algorithm: str = None) -> None:
+    """Writes a snapshot file atomically, see `build`, leaving nothing behind if that fails
+
+    The file is written under a new random name first, so concurrent writers
+    of the same snapshot never share a temporary file.
+    """
+    temporary = f"{path}.{secrets.token_hex(4)}.tmp"
+    a_file = open(temporary, "xb")
+    try:
+        with a_file:
+            a_file.write(build(files, root, algorithm))
+        os.replace(temporary, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(temporary)
+        raise
+
+
+class Snapshot:
+    """A snapshot read in place
+
+    Columns are `memoryview`s over the file mapped with `mmap`, so opening
+    one costs the same for ten files or ten million; a record is only decoded
+    when it is asked for.
+    """
+
+    def __init__(self, buffer: bytes | mmap.mmap) -> None:
+        """Reads a snapshot from a buffer, see `open` for files
+
+        Raises:
+            InvalidSnapshot: If the buffer is not a snapshot of a known version
+        """
+        self._buffer = buffer
+        view = memoryview(buffer)
+        if len(view) < HEADER.size:
+            raise InvalidSnapshot("Too short to be a snapshot")
+        magic, version, digest_size, count, root_size, paths_size, created, algorithm = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise InvalidSnapshot("Not a snapshot")
+        if version != VERSION:
+            raise InvalidSnapshot(f"Unsupported snapshot version: {version}")
+        self.digest_size = digest_size
+        self.created = created
+        self.algorithm = algorithm.rstrip(b"\0").decode() or None
+        position = HEADER.size + root_size
+        self.root = os.fsdecode(bytes(view[HEADER.size:position]))
+        self._views = [view]
+        sections = []
+        for size in ((count + 1) * 8, count * 8, count * 8, count * 8, count * 8, count * digest_size, paths_size):
+            position = _align(position)
+            sections.append(view[position:position + size])
+            position += size
+        if position > len(view):
+            raise InvalidSnapshot("Snapshot is truncated")
+        columns = [self._get_column(section, code) for section, code in zip(sections, "QqqQQ")]
+        self.offsets, self.sizes, self.mtimes, self.inodes, self.devs = columns
+        self.digests, self.paths = sections[5], sections[6]
+        self._views.extend(sections)
+
+    def _get_column(self, section: memoryview, code: str) -> memoryview | array:
+        """Returns an 8 byte column, copied only on big endian machines"""
+        if sys.byteorder == "little":
+            column = section.cast(code)
+            self._views.append(column)
+            return column
+        column = array(code)
+        column.frombytes(section)
+        column.byteswap()
+        return column
+
+    @classmethod
+    def open(cls, path: str) -> Snapshot:
+        """Maps a snapshot file, `close` it or use it as a context manager"""
+        with open(path, "rb") as a_file:
+            if os.fstat(a_file.fileno()).st_size == 0:
+                raise InvalidSnapshot(f"Empty file: {path}")
+            return cls(mmap.mmap(a_file.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def close(self) -> None:
+        """Releases the mapping"""
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+
+    def __enter__(self) -> Snapshot:
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self.sizes)
+
+    def get_relative_path(self, index: int) -> bytes:
+        """Returns the encoded path of entry `index` below the root, the sort key"""
+        return bytes(self.paths[self.offsets[index]:self.offsets[index + 1] - 1])
+
+    def get_relative_paths(self) -> list[bytes]:
+        """Returns every encoded relative path at once, far faster than one by one"""
+        return bytes(self.paths).split(b"\0")[:len(self)]
+
+    def get_path(self, index: int) -> str:
+        """Returns the absolute path of entry `index`"""
+        return os.path.join(self.root, os.fsdecode(self.get_relative_path(index)))
+
+    def get_digest(self, index: int) -> bytes:
+        """Returns the raw digest of entry `index`, or `None` if it was not hashed"""
+        if not self.digest_size:
+            return None
+        digest = bytes(self.digests[index * self.digest_size:(index + 1) * self.digest_size])
+        return digest if digest.strip(b"\0") else None
+
+    def find(self, path: str) -> int:
+        """Returns the index of a path below the root by binary search, or `None`"""
+        key = os.fsencode(os.path.relpath(path, self.root))
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self.get_relative_path(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low if low < len(self) and self.get_relative_path(low) == key else None
+
+
+def diff(old: Snapshot, new: Snapshot) -> list[Change]:
+    """Compares two snapshots by their paths relative to the root
+
+    Both path tables are sorted, so one merge join pass finds added, removed
+    and changed entries. A file counts as modified when its size or, if both
+    sides were hashed, its digest changed, or when its mtime changed and there
+    is no digest to tell. A removed and an added file are reported as a move
+    when they share device, inode and size (a rename), or else their digest.
+
+    Raises:
+        InvalidSnapshot: If both snapshots have digests, made with different algorithms
+
+    Returns:
+        list[Change]: The changes, sorted by path
+    """
+    if old.digest_size and new.digest_size and old.algorithm != new.algorithm:
+        raise InvalidSnapshot(f"Digests can't be compared: {old.algorithm} and {new.algorithm}")
+    changes = []
+    removed, added = [], []
+    old_keys, new_keys = old.get_relative_paths(), new.get_relative_paths()
+    old_count, new_count = len(old_keys), len(new_keys)
+    old_index = new_index = 0
+    next_block = 0
+    while old_index < old_count and new_index < new_count:
+        if old_index >= next_block:
+            if _is_same_block(old, old_keys, old_index, new, new_keys, new_index):
+                old_index += BLOCK_SIZE
+                new_index += BLOCK_SIZE
+                continue
+            next_block = old_index + BLOCK_SIZE
+        old_key, new_key = old_keys[old_index], new_keys[new_index]
+        if old_key == new_key:
+            if _is_modified(old, old_index, new, new_index):
+                changes.append(Change("modified", new.get_path(new_index)))
+            old_index += 1
+            new_index += 1
+        elif old_key < new_key:
+            removed.append(old_index)
+            old_index += 1
+        else:
+            added.append(new_index)
+            new_index += 1
+    removed.extend(range(old_index, old_count))
+    added.extend(range(new_index, new_count))
+
+    moves = _pair_moves(old, removed, new, added)
+    for index in added:
+        source = moves.get(index)
+        if source is None:
+            changes.append(Change("added", new.get_path(index)))
+        else:
+            changes.append(Change("moved", new.get_path(index), old.get_path(source)))
+    moved = set(moves.values())
+    changes.extend(Change("removed", old.get_path(index)) for index in removed if index not in moved)
+    changes.sort(key=lambda change: change.path)
+    return changes
+
+
+def _is_same_block(old: Snapshot, old_keys: list[bytes], old_index: int,
+                   new: Snapshot, new_keys: list[bytes], new_index: int) -> bool:
+    """Returns `True` if the next `BLOCK_SIZE` entries of both have the same paths, sizes, mtimes and digests"""
+    old_end, new_end = old_index + BLOCK_SIZE, new_index + BLOCK_SIZE
+    if old_end > len(old_keys) or new_end > len(new_keys) or old.digest_size != new.digest_size:
+        return False
+    size = old.digest_size
+    return (old_keys[old_index:old_end] == new_keys[new_index:new_end]
+            and old.sizes[old_index:old_end] == new.sizes[new_index:new_end]
+            and old.mtimes[old_index:old_end] == new.mtimes[new_index:new_end]
+            and old.digests[old_index * size:old_end * size] == new.digests[new_index * size:new_end * size])
+
+
+def _is_modified(old: Snapshot, old_index: int, new: Snapshot, new_index: int) -> bool:
+    """Compares one path present in both snapshots, without building anything for unchanged files"""
+    if old.sizes[old_index] != new.sizes[new_index]:
+        return True
+    same_time = old.mtimes[old_index] == new.mtimes[new_index]
+    size = old.digest_size
+    if not size or size != new.digest_size:
+        return not same_time
+    old_digest = old.digests[old_index * size:(old_index + 1) * size]
+    new_digest = new.digests[new_index * size:(new_index + 1) * size]
+    if old_digest == new_digest:
+        return not same_time and not any(old_digest)
+    if any(old_digest) and any(new_digest):
+        return True
+    return not same_time
+
+
+def _pair_moves(old: Snapshot, removed: list[int], new: Snapshot, added: list[int]) -> dict[int, int]:
+    """Returns added index -> removed index for files that kept their inode, or else their digest"""
+    moves = {}
+    by_inode: dict[tuple, list[int]] = {}
+    for index in removed:
+        if old.inodes[index]:
+            by_inode.setdefault((old.devs[index], old.inodes[index], old.sizes[index]), []).append(index)
+    for index in added:
+        candidates = by_inode.get((new.devs[index], new.inodes[index], new.sizes[index]))
+        if candidates and new.inodes[index]:
+            old_digest, new_digest = old.get_digest(candidates[-1]), new.get_digest(index)
+            if old_digest is None or new_digest is None or old_digest == new_digest:
+                moves[index] = candidates.pop()
+    paired = set(moves.values())
+    by_digest: dict[bytes, list[int]] = {}
+    for index in removed:
+        digest = old.get_digest(index)
+        if digest is not None and index not in paired:
+            by_digest.setdefault(digest, []).append(index)
+    for index in added:
+        if index not in moves:
+            candidates = by_digest.get(new.get_digest(index))
+            if candidates:
+                moves[index] = candidates.pop()
+    return moves
@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import os
+from typing import Iterator
+
+
+class DiskUsage:
+    """du-style totals for every directory of a tree
+
+    While the tree is walked a file only touches its own directory. Totals are
+    rolled up bottom-up on first use, in one pass over the directories, and
+    after that every change updates the directories above it in O(depth).
+    Totals are `[bytes, files, newest mtime_ns]`, counting everything below.
+    Like `du`, an inode with several hard links in the tree only counts its
+    bytes once, at the first of its paths; every path still counts as a file.
+    """
+
+    def __init__(self, root: str) -> None:
+        """Creates totals for an empty tree
+
+        Args:
+            root (str): The scanned root
+        """
+        self.root = root.rstrip(os.sep) or os.sep
+        self.own: dict[str, list[int]] = {self.root: [0, 0, 0]}
+        self.subdirs: dict[str, set[str]] = {self.root: set()}
+        self.totals: dict[str, list[int]] = None
+        # (st_dev, st_ino) -> [size, paths], for files with more than one link
+        self.links: dict[tuple[int, int], list] = {}
+
+    def add_directory(self, path: str) -> None:
+        """Adds a directory, its parent must already be known"""
+        if path in self.own:
+            return
+        self.own[path] = [0, 0, 0]
+        self.subdirs[path] = set()
+        self.subdirs[os.path.dirname(path)].add(path)
+        if self.totals is not None:
+            self.totals[path] = [0, 0, 0]
+
+    def add_file(self, path: str, size: int, mtime_ns: int, link: tuple[int, int] = None) -> None:
+        """Counts a file in its directory and, once rolled up, in every directory above
+
+        Args:
+            path (str): The file
+            size (int): Its size
+            mtime_ns (int): Its mtime
+            link (tuple[int, int], optional): `(st_dev, st_ino)` if it has more than one hard link,
+                see `get_link_key`. Defaults to None.
+        """
+        if link is not None:
+            entry = self.links.setdefault(link, [size, []])
+            entry[1].append(path)
+            if len(entry[1]) > 1:
+                size = 0
+        parent = os.path.dirname(path)
+        _add(self.own[parent], size, 1, mtime_ns)
+        if self.totals is not None:
+            for directory in self._ancestors(parent):
+                _add(self.totals[directory], size, 1, mtime_ns)
+
+    def remove_file(self, path: str, size: int, newest: int, link: tuple[int, int] = None) -> None:
+        """Stops counting a file
+
+        Args:
+            path (str): The removed file
+            size (int): Its size
+            newest (int): The newest mtime_ns of the files left in its directory, 0 if none
+            link (tuple[int, int], optional): The `link` it was added with. Defaults to None.
+        """
+        parent = os.path.dirname(path)
+        own = self.own.get(parent)
+        if own is None:
+            return
+        entry = self.links.get(link) if link is not None else None
+        if entry is not None and path in entry[1]:
+            counted = entry[1][0] == path
+            entry[1].remove(path)
+            if not entry[1]:
+                del self.links[link]
+            elif counted:
+                # the bytes now belong to the next path of the inode
+                self._add_size(os.path.dirname(entry[1][0]), size)
+            if not counted:
+                size = 0
+        own[0] -= size
+        own[1] -= 1
+        own[2] = newest
+        if self.totals is not None:
+            for directory in self._ancestors(parent):
+                self.totals[directory][0] -= size
+                self.totals[directory][1] -= 1
+            self._update_newest(parent)
+
+    def remove_directory(self, path: str) -> None:
+        """Stops counting a directory and everything below it"""
+        if path not in self.own or path == self.root:
+            return
+        parent = os.path.dirname(path)
+        if self.totals is not None:
+            size, files, _ = self.totals[path]
+            for directory in self._ancestors(parent):
+                self.totals[directory][0] -= size
+                self.totals[directory][1] -= files
+        stack = [path]
+        while stack:
+            directory = stack.pop()
+            del self.own[directory]
+            if self.totals is not None:
+                del self.totals[directory]
+            stack.extend(self.subdirs.pop(directory))
+        self.subdirs[parent].discard(path)
+        if self.totals is not None:
+            self._update_newest(parent)
+        self._drop_links(path)
+
+    def _drop_links(self, path: str) -> None:
+        """Forgets the links below a removed directory, moving bytes to a path that is left"""
+        prefix = path + os.sep
+        for link, (size, paths) in list(self.links.items()):
+            kept = [linked for linked in paths if not linked.startswith(prefix)]
+            if len(kept) == len(paths):
+                continue
+            if not kept:
+                del self.links[link]
+                continue
+            if kept[0] != paths[0]:
+                self._add_size(os.path.dirname(kept[0]), size)
+            paths[:] = kept
+
+    def _add_size(self, directory: str, size: int) -> None:
+        """Adds bytes to a directory and, once rolled up, to every directory above"""
+        own = self.own.get(directory)
+        if own is None:
+            return
+        own[0] += size
+        if self.totals is not None:
+            for ancestor in self._ancestors(directory):
+                self.totals[ancestor][0] += size
+
+    def roll_up(self) -> None:
+        """Computes every total from the per directory counts
+
+        Directories are added in walk order, parents before their children,
+        so going backwards adds every directory to its parent after it got
+        all of its own children.
+        """
+        self.totals = {path: list(own) for path, own in self.own.items()}
+        for path in reversed(self.own):
+            if path != self.root:
+                _add(self.totals[os.path.dirname(path)], *self.totals[path])
+
+    def get(self, path: str) -> tuple[int, int, int]:
+        """Returns `(bytes, files, newest mtime_ns)` below `path`, or `None` if it is not in the tree"""
+        if self.totals is None:
+            self.roll_up()
+        totals = self.totals.get(path.rstrip(os.sep) or os.sep)
+        return None if totals is None else tuple(totals)
+
+    def get_subdirectories(self, path: str) -> list[str]:
+        """Returns the direct subdirectories of `path`"""
+        return sorted(self.subdirs.get(path.rstrip(os.sep) or os.sep, ()))
+
+    def _update_newest(self, path: str) -> None:
+        """Recomputes the newest mtime from `path` upwards, stopping once nothing changes"""
+        for directory in self._ancestors(path):
+            totals = self.totals[directory]
+            newest = max([self.own[directory][2]] + [self.totals[sub][2] for sub in self.subdirs[directory]])
+            if newest == totals[2]:
+                return
+            totals[2] = newest
+
+    def _ancestors(self, path: str) -> Iterator[str]:
+        """Yields `path` and every directory above it up to the root"""
+        while True:
+            yield path
+            parent = os.path.dirname(path)
+            if path == self.root or parent == path:
+                return
+            path = parent
+
+
+def get_link_key(file: object) -> tuple[int, int]:
+    """Returns the `link` argument of `DiskUsage.add_file` for a File: `(st_dev, st_ino)` or `None`"""
+    if file.nlink is None or file.nlink < 2 or file.inode is None:
+        return None
+    return file.dev, file.inode
+
+
+def _add(totals: list[int], size: int, files: int, mtime_ns: int) -> None:
+    """Adds counts to a totals list in place"""
+    totals[0] += size
+    totals[1] += files
+    if mtime_ns > totals[2]:
+        totals[2] = mtime_ns
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import os
+import stat
+from typing import Iterator
+
+from .errors import UnknownPolicy
+
+HIDDEN_POLICIES = ["include", "skip_dirs", "skip"]
+SYMLINK_POLICIES = ["skip", "files", "follow"]
+
+
+def walk(top: str,
+         hidden: str = "skip_dirs",
+         symlinks: str = "files",
+         same_device: bool = False) -> Iterator[tuple[str, os.DirEntry, os.stat_result]]:
+    """Walks a tree with `os.scandir` and an explicit stack instead of recursion
+
+    Directories are yielded when they are entered, with a `None` stat. Regular
+    files are yielded with their stat result after every subdirectory of
+    their parent has been walked, which is the order `parser()` always used.
+
+    Args:
+        top (str): The directory to walk
+        hidden (str, optional): "include" everything, "skip_dirs" (dot-directories) or "skip"
+            dot-files and dot-directories. Defaults to "skip_dirs".
+        symlinks (str, optional): "skip" all links, follow links to "files" only, or "follow"
+            directory links too (each directory is entered once). Defaults to "files".
+        same_device (bool, optional): Don't descend into other filesystems. Defaults to False.
+
+    Raises:
+        UnknownPolicy: If `hidden` or `symlinks` is not a known policy
+
+    Yields:
+        tuple[str, os.DirEntry, os.stat_result]: `(root, entry, stat)` where `root` is the parent directory
+    """
+    if hidden not in HIDDEN_POLICIES:
+        raise UnknownPolicy(f"Unknown hidden file policy: {hidden}")
+    if symlinks not in SYMLINK_POLICIES:
+        raise UnknownPolicy(f"Unknown symlink policy: {symlinks}")
+
+    top = top.rstrip(os.sep) or os.sep
+    top_stat = os.stat(top)
+    visited = {(top_stat.st_dev, top_stat.st_ino)}
+    follow_dirs = symlinks == "follow"
+
+    stack = [(top, *_iter_dir(top, hidden, symlinks))]
+    while stack:
+        root, subdirs, files = stack[-1]
+        entry = next(subdirs, None)
+        if entry is None:
+            stack.pop()
+            for file, st in files:
+                yield root, file, st
+            continue
+        if follow_dirs or same_device:
+            try:
+                st = entry.stat(follow_symlinks=follow_dirs)
+            except OSError:
+                continue
+            if same_device and st.st_dev != top_stat.st_dev:
+                continue
+            if follow_dirs:
+                if (st.st_dev, st.st_ino) in visited:
+                    continue
+                visited.add((st.st_dev, st.st_ino))
+        yield root, entry, None
+        stack.append((entry.path, *_iter_dir(entry.path, hidden, symlinks)))
+
+
+def _iter_dir(path: str, hidden: str, symlinks: str) -> tuple[Iterator[os.DirEntry], list[tuple]]:
+    """`read_dir` with the subdirectories as an iterator, for the walk stack"""
+    subdirs, files = read_dir(path, hidden, symlinks)
+    return iter(subdirs), files
+
+
+def read_dir(path: str, hidden: str = "skip_dirs", symlinks: str = "files") -> tuple[list[os.DirEntry], list[tuple]]:
+    """Lists a directory once, splitting it into subdirectories and regular files
+
+    Args:
+        path (str): The directory to list
+        hidden (str, optional): Hidden file policy, see `walk`. Defaults to "skip_dirs".
+        symlinks (str, optional): Symlink policy, see `walk`. Defaults to "files".
+
+    Returns:
+        tuple[list[os.DirEntry], list[tuple]]: subdirectory entries, `(entry, stat)` of files
+    """
+    subdirs = []
+    files = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if hidden != "include" and entry.name[0] == ".":
+                    if hidden == "skip" or entry.is_dir(follow_symlinks=symlinks == "follow"):
+                        continue
+                if symlinks == "skip" and entry.is_symlink():
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=symlinks == "follow"):
+                        subdirs.append(entry)
+                        continue
+                    st = entry.stat()
+                except OSError:
+                    continue
+                if stat.S_ISREG(st.st_mode):
+                    files.append((entry, st))
+    except OSError:
+        pass
+    return subdirs, files
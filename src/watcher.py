@@ -0,0 +1,381 @@
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import stat
+import struct
+import threading
+import time
+from typing import Callable, Iterable
+
+from .duplicates import count_inodes
+from .errors import UnknownPolicy
+from .hashing import file_checksum
+from .usage import DiskUsage, get_link_key
+from .walker import read_dir, walk
+
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ONLYDIR = 0x1000000
+
+WATCH_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+EVENT = struct.Struct("iIII")
+
+BACKENDS = ["auto", "inotify", "poll"]
+
+
+class TreeState:
+    """A scanned tree that can be updated one path at a time
+
+    Files are grouped by size as they are added, and only files that share a
+    size with another file are hashed, so every update costs O(changes).
+    `version` goes up with every change, so derived indexes know when to rebuild,
+    and `usage` keeps du-style totals of every directory.
+    """
+
+    def __init__(self,
+                 root: str,
+                 files: Iterable,
+                 directories: Iterable[str],
+                 file_type: type,
+                 algorithm: str,
+                 hidden: str = "skip_dirs",
+                 symlinks: str = "files",
+                 hash_all: bool = False) -> None:
+        """Builds the state from an existing scan
+
+        Args:
+            root (str): The scanned root
+            files (Iterable[File]): The scanned files
+            directories (Iterable[str]): The scanned directories, without `root`
+            file_type (type): Class used for new records, normally `File`
+            algorithm (str): Hash algorithm for duplicate groups
+            hidden (str, optional): Hidden file policy, see `walker.walk`. Defaults to "skip_dirs".
+            symlinks (str, optional): Symlink policy, see `walker.walk`. Defaults to "files".
+            hash_all (bool, optional): Hash every file, not only those sharing a size. Defaults to False.
+        """
+        self.root = root.rstrip(os.sep) or os.sep
+        self.file_type = file_type
+        self.algorithm = algorithm
+        self.hidden = hidden
+        self.symlinks = symlinks
+        self.hash_all = hash_all
+        self.lock = threading.RLock()
+        self.version = 0
+        self.on_directory: Callable[[str], None] = None
+        self.files: dict[str, object] = {}
+        self.directories: dict[str, None] = {}
+        self.children: dict[str, set[str]] = {self.root: set()}
+        self.sizes: dict[int, dict[str, object]] = {}
+        self.digests: dict[str, dict[str, object]] = {}
+        self.usage = DiskUsage(self.root)
+        for path in directories:
+            self.add_directory(path)
+        for file in files:
+            self.add_file(file)
+
+    def add_directory(self, path: str) -> None:
+        """Adds a directory, its parent must already be known"""
+        if path in self.children:
+            return
+        self.version += 1
+        self.directories[path] = None
+        self.children[path] = set()
+        self.children[os.path.dirname(path)].add(path)
+        self.usage.add_directory(path)
+        if self.on_directory is not None:
+            self.on_directory(path)
+
+    def remove_directory(self, path: str) -> None:
+        """Removes a directory and everything below it"""
+        self.version += 1
+        for child in self.children.pop(path, ()):
+            if child in self.files:
+                self.remove_file(child)
+            else:
+                self.remove_directory(child)
+        self.directories.pop(path, None)
+        parent = self.children.get(os.path.dirname(path))
+        if parent is not None:
+            parent.discard(path)
+        self.usage.remove_directory(path)
+
+    def add_file(self, file: object) -> None:
+        """Adds or replaces a file, hashing it only if its size is shared"""
+        if file.path in self.files:
+            self.remove_file(file.path)
+        self.version += 1
+        self.files[file.path] = file
+        self.children[os.path.dirname(file.path)].add(file.path)
+        self.usage.add_file(file.path, file.size, file.mtime_ns, get_link_key(file))
+        group = self.sizes.setdefault(file.size, {})
+        group[file.path] = file
+        if self.hash_all:
+            self._add_digest(file)
+        elif len(group) == 2:
+            for member in group.values():
+                self._add_digest(member)
+        elif len(group) > 2:
+            self._add_digest(file)
+
+    def remove_file(self, path: str) -> None:
+        """Removes a file from every index"""
+        file = self.files.pop(path, None)
+        if file is None:
+            return
+        self.version += 1
+        parent = self.children.get(os.path.dirname(path))
+        if parent is not None:
+            parent.discard(path)
+            newest = max((self.files[child].mtime_ns for child in parent if child in self.files), default=0)
+            self.usage.remove_file(path, file.size, newest, get_link_key(file))
+        group = self.sizes[file.size]
+        del group[path]
+        if not group:
+            del self.sizes[file.size]
+        if file.hash is not None and path in self.digests.get(file.hash, ()):
+            del self.digests[file.hash][path]
+            if not self.digests[file.hash]:
+                del self.digests[file.hash]
+
+    def _add_digest(self, file: object) -> None:
+        """Hashes a file if needed and puts it in its digest group"""
+        if file.hash is None:
+            try:
+                file.hash = file_checksum(file.path, self.algorithm)
+            except OSError:
+                return
+        self.digests.setdefault(file.hash, {})[file.path] = file
+
+    def scan_directory(self, path: str) -> None:
+        """Adds a directory and everything below it"""
+        self.add_directory(path)
+        for _, entry, st in walk(path, self.hidden, self.symlinks):
+            if st is None:
+                self.add_directory(entry.path)
+            else:
+                self.add_file(self._make_file(entry.path, st))
+
+    def refresh(self, path: str) -> None:
+        """Brings one path in line with the filesystem, whatever happened to it"""
+        with self.lock:
+            if os.path.dirname(path) not in self.children:
+                return
+            entry = self._stat(path)
+            if entry is None:
+                if path in self.files:
+                    self.remove_file(path)
+                else:
+                    self.remove_directory(path)
+                return
+            st, is_dir = entry
+            if is_dir:
+                if path in self.files:
+                    self.remove_file(path)
+                if path not in self.children:
+                    self.scan_directory(path)
+                return
+            if path in self.children:
+                self.remove_directory(path)
+            if self._is_changed(path, st):
+                self.add_file(self._make_file(path, st))
+
+    def resync(self, path: str) -> None:
+        """Diffs one known directory against its current listing"""
+        with self.lock:
+            if path not in self.children:
+                return
+            subdirs, files = read_dir(path, self.hidden, self.symlinks)
+            current = {entry.path for entry in subdirs} | {entry.path for entry, _ in files}
+            for child in self.children[path] - current:
+                self.refresh(child)
+            for entry in subdirs:
+                if entry.path not in self.children:
+                    self.scan_directory(entry.path)
+            for entry, st in files:
+                if self._is_changed(entry.path, st):
+                    self.add_file(self._make_file(entry.path, st))
+
+    def _is_changed(self, path: str, st: os.stat_result) -> bool:
+        """Returns `True` if `path` is unknown or its stat tuple differs from the known file"""
+        known = self.files.get(path)
+        return known is None or (known.inode, known.size, known.mtime_ns) != (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def _stat(self, path: str) -> tuple[os.stat_result, bool]:
+        """Stats a path following the hidden and symlink policies
+
+        Returns:
+            tuple[os.stat_result, bool]: `(stat, is_dir)` or `None` if the path is gone or excluded
+        """
+        try:
+            st = os.lstat(path)
+            if stat.S_ISLNK(st.st_mode):
+                if self.symlinks == "skip":
+                    return None
+                st = os.stat(path)
+                if stat.S_ISDIR(st.st_mode) and self.symlinks != "follow":
+                    return None
+        except OSError:
+            return None
+        is_dir = stat.S_ISDIR(st.st_mode)
+        name = os.path.basename(path)
+        if self.hidden != "include" and name.startswith(".") and (is_dir or self.hidden == "skip"):
+            return None
+        if not is_dir and not stat.S_ISREG(st.st_mode):
+            return None
+        return st, is_dir
+
+    def _make_file(self, path: str, st: os.stat_result) -> object:
+        """Creates a file record from a stat result"""
+        return self.file_type(os.path.basename(path), path, None, st.st_size, st.st_ino, st.st_mtime_ns,
+                              st.st_ctime_ns, dev=st.st_dev, nlink=st.st_nlink)
+
+    def get_duplicates(self) -> list[list]:
+        """Returns every group of files with the same content on two or more inodes"""
+        with self.lock:
+            return [list(group.values()) for group in self.digests.values() if count_inodes(group.values()) > 1]
+
+
+class Watcher:
+    """Keeps a `TreeState` current from inotify events, or by polling directory mtimes
+
+    Polling only notices changes that touch a directory's mtime (files
+    created, deleted or renamed); in-place edits need the inotify backend.
+    Directories inotify can't watch, once `fs.inotify.max_user_watches` is
+    reached, are polled like that by the inotify thread, see `polled`.
+    """
+
+    def __init__(self, state: TreeState, backend: str = "auto", interval: float = 1.0) -> None:
+        """Starts watching in a daemon thread
+
+        Args:
+            state (TreeState): The tree to keep current
+            backend (str, optional): "inotify", "poll" or "auto" (inotify when available). Defaults to "auto".
+            interval (float, optional): Seconds between polls, or between stop checks. Defaults to 1.0.
+
+        Raises:
+            UnknownPolicy: If `backend` is not in `BACKENDS`
+        """
+        if backend not in BACKENDS:
+            raise UnknownPolicy(f"Unknown watch backend: {backend}")
+        self.state = state
+        self.interval = interval
+        self._stop = threading.Event()
+        self._libc = _load_inotify() if backend in ("auto", "inotify") else None
+        if self._libc is None and backend == "inotify":
+            raise OSError("inotify is not available")
+        self.backend = "inotify" if self._libc is not None else "poll"
+        if self.backend == "inotify":
+            self._fd = self._libc.inotify_init1(os.O_CLOEXEC)
+            if self._fd < 0:
+                raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+            self._paths: dict[int, str] = {}
+            self.polled: dict[str, int] = {}
+            state.on_directory = self._add_watch
+            self._add_watch(state.root)
+            for path in list(state.directories):
+                self._add_watch(path)
+            target = self._read_events
+        else:
+            self._mtimes = {path: self._mtime(path) for path in state.children}
+            target = self._poll
+        self.thread = threading.Thread(target=target, name="watcher", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """Stops watching and waits for the thread to finish"""
+        self._stop.set()
+        self.thread.join()
+        if self.backend == "inotify":
+            self.state.on_directory = None
+            os.close(self._fd)
+
+    def _add_watch(self, path: str) -> None:
+        """Starts receiving events for a directory, or polls it if inotify can't watch it"""
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK | IN_ONLYDIR)
+        if wd >= 0:
+            self._paths[wd] = path
+            return
+        # ENOENT: gone already, its parent's events remove it. ENOSPC: out of watches.
+        if ctypes.get_errno() != errno.ENOENT:
+            self.polled[path] = self._mtime(path)
+
+    def _poll_unwatched(self) -> None:
+        """Resyncs the directories in `polled` whose mtime changed"""
+        for path, mtime in list(self.polled.items()):
+            current = self._mtime(path)
+            if current is None or path not in self.state.children:
+                del self.polled[path]
+            elif current != mtime:
+                self.polled[path] = current
+                self.state.resync(path)
+
+    def _read_events(self) -> None:
+        """Thread body of the inotify backend"""
+        next_poll = time.monotonic() + self.interval
+        while not self._stop.is_set():
+            ready, _, _ = select.select([self._fd], [], [], self.interval)
+            if self.polled and time.monotonic() >= next_poll:
+                self._poll_unwatched()
+                next_poll = time.monotonic() + self.interval
+            if not ready:
+                continue
+            data = os.read(self._fd, 64 * 1024)
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT.unpack_from(data, offset)
+                name = os.fsdecode(data[offset + EVENT.size:offset + EVENT.size + length].rstrip(b"\0"))
+                offset += EVENT.size + length
+                if mask & IN_Q_OVERFLOW:
+                    for path in list(self.state.children):
+                        self.state.resync(path)
+                    continue
+                if mask & IN_IGNORED:
+                    self._paths.pop(wd, None)
+                    continue
+                directory = self._paths.get(wd)
+                if directory is not None and name:
+                    self.state.refresh(os.path.join(directory, name))
+
+    def _poll(self) -> None:
+        """Thread body of the polling backend"""
+        while not self._stop.wait(self.interval):
+            for path in list(self.state.children):
+                mtime = self._mtime(path)
+                if path in self._mtimes and mtime != self._mtimes[path]:
+                    self.state.resync(path)
+                self._mtimes[path] = mtime
+            self._mtimes = {path: self._mtimes.get(path) or self._mtime(path) for path in self.state.children}
+
+    @staticmethod
+    def _mtime(path: str) -> int:
+        """Returns the mtime of a directory, or `None` if it is gone"""
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+
+def _load_inotify() -> object:
+    """Returns libc if it has inotify, else `None`"""
+    name = ctypes.util.find_library("c")
+    if name is None:
+        return None
+    try:
+        libc = ctypes.CDLL(name, use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, "inotify_init1") or not hasattr(libc, "inotify_add_watch"):
+        return None
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    return libc
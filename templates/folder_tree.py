@@ -1 +1,37 @@
-# for now this is empty
+from typing import Callable
+
+from rich.console import Console
+from rich.markup import escape
+from rich.tree import Tree
+
+
+def format_size(size: int) -> str:
+    """Formats a byte count like `du -h`"""
+    for unit in ("B", "K", "M", "G", "T"):
+        if size < 1024 or unit == "T":
+            return f"{size:.0f}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+        size /= 1024
+
+
+def render(console: Console, root: object, children: Callable[[str], list], depth: int = 2) -> None:
+    """Renders a directory tree with the size and file count of every directory
+
+    Args:
+        console (Console): Console to print on
+        root (Directory): The directory at the top of the tree
+        children (Callable[[str], list[Directory]]): Returns the subdirectories of a path
+        depth (int, optional): Levels shown below `root`. Defaults to 2.
+    """
+    def label(directory: object) -> str:
+        size = format_size(directory.size)
+        return f"[bold]{size:>7}[/] {escape(directory.name)} [dim]({directory.files:,} files)[/]"
+
+    tree = Tree(label(root), guide_style="blue")
+    stack = [(tree, root, 0)]
+    while stack:
+        node, directory, level = stack.pop()
+        if level >= depth:
+            continue
+        for child in children(directory.path):
+            stack.append((node.add(label(child)), child, level + 1))
+    console.print(tree)
@@ -1,15 +1,21 @@
 from __future__ import annotations
 
-import os
-import hashlib
 import datetime
+import os
 import pathlib
 import shutil
+import time
 from typing import Callable, List
+
 from rich.console import Console
 from rich.panel import Panel
 from rich.rule import Rule
 
+from src import bulk
+from src.file_manager import FileManager
+from src.hashing import DEFAULT_ALGORITHM, file_checksum
+
+
 class CommandNotFound(Exception):
     def __init__(self, *args: object) -> None:
         super().__init__(*args)
@@ -24,6 +30,8 @@ class Command:
     top_command_ids = []
     command_ids = []
     commands = []
+    commands_by_id = {}
+    commands_by_name = {}
 
     def __init__(self, name: str, parent: int | None, subcommands: List[int] | None, id: int, func: Callable) -> None:
         self.name = name
@@ -37,17 +45,22 @@ class Command:
                 raise CommandNotFound
 
         self.subcommands = subcommands
+        self.children = {}
         if self.subcommands is not None:
             for x in self.subcommands:
                 if not self.is_command(x):
                     raise CommandNotFound
+                child = Command.commands_by_id[x]
+                self.children.setdefault(child.name, child)
         
-        if self.id not in Command.command_ids:
+        if self.id not in Command.commands_by_id:
             if self.parent is None:
                 Command.top_command_ids.append(self.id)
                 Command.top_commands.append(self)
             Command.command_ids.append(self.id)
             Command.commands.append(self)
+            Command.commands_by_id[self.id] = self
+            Command.commands_by_name.setdefault(self.name, self)
         else:
             raise InvalidID
         
@@ -58,44 +71,68 @@ class Command:
     
     @classmethod
     def is_command(self, command_id: int) -> bool:
-        if command_id in Command.command_ids:
-            return True
-        else:
-            return False
+        return command_id in Command.commands_by_id
 
     @classmethod
     def get_command_from_id(self, command_id: int) -> Command:
-        
-        if self.is_command(command_id):
-            index = Command.command_ids.index(command_id)
-            return Command.commands[index]
-        else:
+        try:
+            return Command.commands_by_id[command_id]
+        except KeyError:
             raise CommandNotFound
-    
+
     @classmethod
     def get_command_from_name(self, command_name: str) -> Command:
-        for x in Command.commands:
-            if x.name == command_name:
-                return x
-        raise CommandNotFound
-    
+        try:
+            return Command.commands_by_name[command_name]
+        except KeyError:
+            raise CommandNotFound
+
     @classmethod
     def is_command_from_name(self, command) -> bool:
+        return command in Command.commands_by_name
+
+    def get_subcommand(self, name: str) -> Command:
         try:
-            self.get_command_from_name(command)
-            return True
-        except CommandNotFound:
-            return False
+            return self.children[name]
+        except KeyError:
+            raise CommandNotFound
     
 
 class File:
-    def __init__(self, path) -> None:
+    stat_ttl: float | None = None
+
+    def __init__(self, path, stat: os.stat_result | None = None) -> None:
         self.path = path
+        self.name = os.path.basename(path)
         self.extension = os.path.splitext(self.name)[-1]
         self.info = pathlib.Path(self.path)
+        self._stat = stat
+        self._stat_time = time.monotonic()
+
+    def refresh(self) -> os.stat_result:
+        """Reloads and returns the stat result"""
+        self._stat = self.info.stat()
+        self._stat_time = time.monotonic()
+        return self._stat
+
+    def stat(self) -> os.stat_result:
+        """Returns the cached stat result, reloading it once it is older than `stat_ttl`"""
+        if self._stat is None or (self.stat_ttl is not None and time.monotonic() - self._stat_time > self.stat_ttl):
+            return self.refresh()
+        return self._stat
+
+    def rename(self, name: str) -> None:
+        """Renames or moves the file, `name` without a directory stays in the same one"""
+        target = os.path.join(os.path.dirname(self.path), name)
+        bulk.move_path(str(self.path), target)
+        self.path = target
+        self.name = os.path.basename(target)
+        self.info = pathlib.Path(target)
 
-    def rename(self) -> None:
-        os.rename(self.path)
+    def copy(self, target: str) -> File:
+        """Copies the file inside the kernel where possible and returns the copy"""
+        bulk.copy_path(str(self.path), target)
+        return File(target)
 
     def run(self):
         os.startfile(self.path)
@@ -104,39 +141,81 @@ class File:
         os.remove(self.path)
         del self
     
-    def get_checksum(self, file_name: str) -> str:
+    def get_checksum(self, file_name: str, algorithm: str = DEFAULT_ALGORITHM) -> str:
         """Returns checksum of the file"""
-        sha_hash = hashlib.sha224()
-        a_file = open(file_name, "rb")
-        content = a_file.read()
-        sha_hash.update(content)
-        digest = sha_hash.hexdigest()
-        a_file.close()
-        return digest
+        return file_checksum(file_name, algorithm)
     
     def get_last_modified_time(self) -> datetime.datetime:
         """Returns last modified time as datetime.datetime object"""
-        return datetime.datetime.fromtimestamp(self.info.stat().st_mtime)
+        return datetime.datetime.fromtimestamp(self.stat().st_mtime)
 
     def get_created_time(self) -> datetime.datetime:
         """Returns created time as datetime.datetime object"""
-        return datetime.datetime.fromtimestamp(self.info.stat().st_ctime)
+        return datetime.datetime.fromtimestamp(self.stat().st_ctime)
 
 class Directory:
-    def __init__(self, path) -> None:
+    stat_ttl: float | None = None
+    # Watched scans by root, shared by every Directory inside them
+    scans: dict[str, FileManager] = {}
+
+    def __init__(self, path, stat: os.stat_result | None = None) -> None:
         self.path = path
         self.info = pathlib.Path(self.path)
+        self._stat = stat
+        self._stat_time = time.monotonic()
+        self.files, self.directories = self.parse()
+
+    def parse(self) -> tuple[list[str], list[str]]:
+        """Returns the paths of the files and of the subdirectories directly inside"""
+        files, directories = [], []
+        try:
+            with os.scandir(self.path) as entries:
+                for entry in entries:
+                    (directories if entry.is_dir(follow_symlinks=False) else files).append(entry.path)
+        except OSError:
+            pass
+        return files, directories
 
-        # [TODO] Parse the files and directories
-        self.files, self.directories = [], []
+    def refresh(self) -> os.stat_result:
+        """Reloads and returns the stat result"""
+        self._stat = self.info.stat()
+        self._stat_time = time.monotonic()
+        return self._stat
+
+    def stat(self) -> os.stat_result:
+        """Returns the cached stat result, reloading it once it is older than `stat_ttl`"""
+        if self._stat is None or (self.stat_ttl is not None and time.monotonic() - self._stat_time > self.stat_ttl):
+            return self.refresh()
+        return self._stat
 
     def get_last_modified_time(self) -> datetime.datetime:
         """Returns last modified time as datetime.datetime object"""
-        return datetime.datetime.fromtimestamp(self.info.stat().st_mtime)
+        return datetime.datetime.fromtimestamp(self.stat().st_mtime)
 
     def get_created_time(self) -> datetime.datetime:
         """Returns created time as datetime.datetime object"""
-        return datetime.datetime.fromtimestamp(self.info.stat().st_ctime)
+        return datetime.datetime.fromtimestamp(self.stat().st_ctime)
+
+    def get_usage(self) -> tuple[int, int, int]:
+        """Returns `(bytes, files, newest mtime_ns)` of everything below
+
+        The first call walks the tree once into a watched scan, later calls for
+        it or any directory inside it read the rollup the watcher keeps current.
+        """
+        path = os.path.abspath(str(self.path))
+        manager = None
+        parent = path
+        while manager is None:
+            manager = self.scans.get(parent)
+            if os.path.dirname(parent) == parent:
+                break
+            parent = os.path.dirname(parent)
+        directory = manager.get_usage(path) if manager is not None else None
+        if directory is None:
+            manager = self.scans[path] = FileManager(path)
+            manager.watch()
+            directory = manager.get_usage(path)
+        return directory.size, directory.files, directory.mtime_ns
 
     def delete(self) -> None:
         shutil.rmtree(self.path)